@@ -0,0 +1,183 @@
+# =================================================================================
+# Dialogue_History.py - 有界的对话历史
+#
+# 1. 内存中只保留最近的 max_in_memory 条消息；更早的消息按顺序追加写入磁盘上的
+#    JSONL 归档（只追加，不改写），只有玩家往回翻看时才会读取。
+# 2. Prompt 只需要最近 window_size 条对话，单独用一个环形缓冲区保存，
+#    每轮格式化的开销只和窗口大小有关，与游戏进行了多久无关。
+# 3. 被移出内存的对话早已由 Memory_Summarizer 总结进 long_term_memory
+#    (总结阈值远小于 max_in_memory)，所以 Prompt 不会丢失这些信息。
+# =================================================================================
+
+import json
+import os
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+DIALOGUE_ROLES = ("user", "assistant")
+ARCHIVE_EXT = ".jsonl"
+
+
+def remove_unreferenced(archive_dir, referenced, min_age=86400.0, dry_run=False) -> list:
+    """
+    删除 archive_dir 中没有被任何存档引用的对话历史归档。
+
+    Args:
+        archive_dir (str): history/ 目录。
+        referenced (set): 存档中引用的归档文件名（不含扩展名）。
+        min_age (float): 只删除至少这么多秒没有修改过的文件：还在内存中、尚未存档的 Agent 的归档不会被误删。
+        dry_run (bool): 只列出，不删除。
+
+    Returns:
+        list: 删除（或将要删除）的文件路径。
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    removed = []
+    cutoff = time.time() - min_age
+    for filename in os.listdir(archive_dir):
+        name, ext = os.path.splitext(filename)
+        if ext != ARCHIVE_EXT or name in referenced:
+            continue
+        path = os.path.join(archive_dir, filename)
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+    return removed
+
+
+class DialogueHistory:
+    def __init__(self, archive_dir, window_size=10, max_in_memory=60):
+        """
+        初始化 DialogueHistory。
+
+        Args:
+            archive_dir (str): 归档文件所在目录。
+            window_size (int): Prompt 中使用的最近对话条数。
+            max_in_memory (int): 内存中保留的最多消息条数，超出部分写入归档。
+        """
+        self.archive_dir = archive_dir
+        self.window_size = window_size
+        self._messages = deque()
+        self._window = deque(maxlen=window_size)
+        self.max_in_memory = max(max_in_memory, window_size)
+
+        self.archive_id = None  # 归档文件名（不含扩展名），第一次溢出时才创建
+        self.archived_count = 0  # 已归档的消息条数，即归档文件中属于本时间线的行数
+        self.archived_bytes = 0  # 这些行在归档文件中占用的字节数
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def append(self, message: dict):
+        self._messages.append(message)
+        if message.get("role") in DIALOGUE_ROLES:
+            self._window.append(message)
+        if len(self._messages) > self.max_in_memory:
+            self._spill(len(self._messages) - self.max_in_memory)
+
+    def _spill(self, count: int):
+        """把最旧的 count 条消息追加到归档文件并移出内存"""
+        path = self._archive_path(self.archive_id) if self.archive_id else None
+        if path is None or not os.path.exists(path) or os.path.getsize(path) != self.archived_bytes:
+            self._fork_archive()
+        with open(self._archive_path(self.archive_id), "ab") as f:
+            for _ in range(count):
+                f.write((json.dumps(self._messages.popleft(), ensure_ascii=False) + "\n").encode("utf-8"))
+            self.archived_bytes = f.tell()
+        self.archived_count += count
+
+    def _fork_archive(self):
+        """
+        归档文件只追加，多个存档可以共享同一个文件，各自只读前 archived_count 行。
+        如果文件在本时间线之后又被追加过（例如读取了较早的存档后继续游戏），
+        就复制出属于本时间线的前 archived_bytes 字节，之后在新文件上追加。
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        new_id = uuid.uuid4().hex
+        with open(self._archive_path(new_id), "wb") as dst:
+            if self.archive_id and self.archived_bytes:
+                with open(self._archive_path(self.archive_id), "rb") as src:
+                    dst.write(src.read(self.archived_bytes))
+        self.archive_id = new_id
+
+    def _archive_path(self, archive_id):
+        return os.path.join(self.archive_dir, f"{archive_id}{ARCHIVE_EXT}")
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def prompt_window(self) -> list:
+        """最近 window_size 条 user/assistant 消息，O(window)"""
+        return list(self._window)
+
+    def recent_dialogue(self, count: int) -> list:
+        """最近 count 条 user/assistant 消息的副本（只看内存中的部分）"""
+        recent = []
+        for msg in reversed(self._messages):
+            if len(recent) >= count:
+                break
+            if msg.get("role") in DIALOGUE_ROLES:
+                recent.append(dict(msg))
+        recent.reverse()
+        return recent
+
+    def page(self, offset: int, limit: int) -> list:
+        """
+        按全局序号读取一段历史，用于玩家往回翻看。
+
+        Args:
+            offset (int): 起始序号（0 为游戏中的第一条消息）。
+            limit (int): 最多返回的条数。
+        """
+        offset = max(0, offset)
+        end = min(offset + max(0, limit), len(self))
+        result = []
+        if offset < self.archived_count and self.archive_id:
+            with open(self._archive_path(self.archive_id), "r", encoding="utf-8") as f:
+                for line in islice(f, offset, min(end, self.archived_count)):
+                    result.append(json.loads(line))
+        start_in_memory = max(0, offset - self.archived_count)
+        result.extend(islice(self._messages, start_in_memory, max(0, end - self.archived_count)))
+        return result
+
+    def __len__(self):
+        """全部消息条数（含已归档的）"""
+        return self.archived_count + len(self._messages)
+
+    def __iter__(self):
+        """只遍历内存中的消息"""
+        return iter(self._messages)
+
+    # ------------------------------------------------------------------
+    # 存档
+    # ------------------------------------------------------------------
+    def export(self) -> tuple:
+        """返回 (内存中的消息, 归档信息)，用于写入存档"""
+        archive = None
+        if self.archive_id:
+            archive = {"id": self.archive_id, "count": self.archived_count, "bytes": self.archived_bytes}
+        return list(self._messages), archive
+
+    @classmethod
+    def restore(cls, messages, archive, archive_dir, **kwargs):
+        """从存档数据恢复。旧版存档只有完整的 history 列表，超出部分会立即写入新归档"""
+        history = cls(archive_dir, **kwargs)
+        if archive:
+            history.archive_id = archive.get("id")
+            history.archived_count = archive.get("count", 0)
+            history.archived_bytes = archive.get("bytes", 0)
+        for message in messages:
+            history._messages.append(message)
+            if message.get("role") in DIALOGUE_ROLES:
+                history._window.append(message)
+        if len(history._messages) > history.max_in_memory:
+            history._spill(len(history._messages) - history.max_in_memory)
+        return history
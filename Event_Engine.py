@@ -0,0 +1,271 @@
+# =================================================================================
+# Event_Engine.py - 数据驱动的随机事件
+#
+# 1. 事件定义在 config/events.yaml 中，启动时只解析一次。
+# 2. 事件按 (地点, 关系阶段) 分组，每组一张别名表 (alias method)，按权重抽取一个事件是 O(1) 的，
+#    与事件总数无关。没有限定关系阶段的事件会放进每个关系阶段的组；没有限定地点的事件单独成表，
+#    在各地点的表中只占一项（权重为它们的总和），抽中这一项时再从中抽取，所以各地点的表只包含本地点的事件。
+#    别名表在某组第一次用到时建立并缓存，也可以在启动时一次性建好 (warm_up)。
+# 3. 其他条件（亲密度、心情等）在加载时编译成一个 Python 函数。抽中的事件不满足条件时重新抽，
+#    最多 MAX_REJECTIONS 次，所以满足条件的事件之间仍然保持权重比例。
+# 4. 随机数由调用方传入（每个 GalGameAgent 持有自己的 random.Random），
+#    相同的种子和相同的操作总能得到相同的事件序列，便于复现和离线模拟。
+#
+# events.yaml 格式:
+#   trigger_rate: 0.1              # 每经过一个中间地点触发事件的概率
+#   events:
+#     - id: drop_cookie
+#       text: "路过{waypoint}时，苏糖不小心把饼干掉在了地上。"   # 可用 {waypoint} 和 {destination}
+#       weight: 2                  # 省略时为 1
+#       locations: [canteen]       # 省略时任何地点都可以触发
+#       relationship_states: [朋友, 好朋友]   # 省略时任何关系阶段都可以触发
+#       conditions: {closeness: ">= 40", mood_today: happy, boredom_level: "< 5"}
+#       effects: {closeness: 1}    # 触发后亲密度的变化
+# =================================================================================
+
+import os
+import re
+import threading
+from pathlib import Path
+
+EVENTS_PATH = Path(__file__).resolve().parent / "config" / "events.yaml"
+DEFAULT_TRIGGER_RATE = 0.1
+MAX_REJECTIONS = 4  # 抽中的事件不满足条件时最多重抽几次
+_CONDITION = re.compile(r"^\s*(>=|<=|==|!=|>|<)\s*(.+?)\s*$")
+
+
+class EventConfigError(Exception):
+    """events.yaml 中的事件定义有误"""
+
+
+class Event:
+    """一个随机事件，创建后不再修改"""
+    __slots__ = ("id", "text", "weight", "locations", "relationship_states", "predicate", "effects")
+
+    def __init__(self, id, text, weight=1.0, locations=None, relationship_states=None, conditions=None, effects=None):
+        """
+        初始化 Event。
+
+        Args:
+            id (str): 事件ID。
+            text (str): 事件描述，可使用 {waypoint} 和 {destination}。
+            weight (float): 同一组事件中被抽中的相对权重。
+            locations (list, optional): 可以触发的地点key，省略时不限。
+            relationship_states (list, optional): 可以触发的关系阶段，省略时不限。
+            conditions (dict, optional): game_state 字段 -> 条件，见 compile_conditions。
+            effects (dict, optional): 触发后对 game_state 的影响，目前支持 closeness（亲密度变化）。
+        """
+        if weight <= 0:
+            raise EventConfigError(f"事件 '{id}' 的权重必须大于0")
+        try:
+            text.format(waypoint="", destination="")
+        except (KeyError, IndexError, ValueError) as e:
+            raise EventConfigError(f"事件 '{id}' 的描述只能使用 {{waypoint}} 和 {{destination}}: {e}") from None
+        self.id = id
+        self.text = text
+        self.weight = float(weight)
+        self.locations = frozenset(locations) if locations else None
+        self.relationship_states = frozenset(relationship_states) if relationship_states else None
+        self.predicate = compile_conditions(conditions, id) if conditions else None
+        self.effects = dict(effects or {})
+
+    def render(self, waypoint, destination):
+        return self.text.format(waypoint=waypoint, destination=destination)
+
+
+def compile_conditions(conditions, event_id="?"):
+    """
+    把条件编译成一个函数 predicate(game_state) -> bool。
+
+    条件的写法：值为字符串且以比较运算符开头时按数值比较（"closeness: '>= 40'"），
+    值为列表时要求字段取值在列表中，其他值要求字段相等。字段缺失时按 None 处理（数值比较视为不满足）。
+    """
+    clauses = []
+    for field, expected in conditions.items():
+        getter = f"s.get({field!r})"
+        match = _CONDITION.match(expected) if isinstance(expected, str) else None
+        if match:
+            op, value = match.groups()
+            try:
+                number = float(value)
+            except ValueError:
+                raise EventConfigError(f"事件 '{event_id}' 的条件 {field}: '{expected}' 需要数值") from None
+            clauses.append(f"({getter} is not None and {getter} {op} {number!r})")
+        elif isinstance(expected, (list, tuple)):
+            clauses.append(f"{getter} in {frozenset(expected)!r}")
+        elif expected is None or isinstance(expected, (str, int, float, bool)):
+            clauses.append(f"{getter} == {expected!r}")
+        else:
+            raise EventConfigError(f"事件 '{event_id}' 的条件 {field} 无法识别: {expected!r}")
+    source = f"lambda s: {' and '.join(clauses) or 'True'}"
+    return eval(compile(source, f"<event {event_id}>", "eval"), {"__builtins__": {}, "frozenset": frozenset})
+
+
+class AliasTable:
+    """Vose 别名表：按权重抽样，每次只需两个随机数。表项也可以是另一张 AliasTable，抽中时再从中抽取"""
+    __slots__ = ("items", "prob", "alias", "size", "total")
+
+    def __init__(self, items, weights):
+        n = len(items)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        prob, alias = [1.0] * n, list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s], alias[s] = scaled[s], l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        self.items = tuple(items)
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+        self.size = n
+        self.total = total
+
+    def sample(self, rng):
+        i = int(rng.random() * self.size)
+        item = self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+        return item.sample(rng) if type(item) is AliasTable else item
+
+
+class EventEngine:
+    def __init__(self, events=(), trigger_rate=DEFAULT_TRIGGER_RATE):
+        """
+        初始化 EventEngine。
+
+        Args:
+            events (list): Event 列表。
+            trigger_rate (float): 每经过一个中间地点触发事件的概率。
+        """
+        self.events = tuple(events)
+        self.trigger_rate = trigger_rate
+        ids = [event.id for event in self.events]
+        if len(set(ids)) != len(ids):
+            raise EventConfigError("事件ID重复: " + ", ".join(sorted({i for i in ids if ids.count(i) > 1})))
+        # 只有被某个事件明确提到的地点/关系阶段才单独建表，其余的查 None（“其他”）那一张
+        self._locations = frozenset().union(*(e.locations for e in self.events if e.locations))
+        self._states = frozenset().union(*(e.relationship_states for e in self.events if e.relationship_states))
+        self._by_location = {None: [e for e in self.events if e.locations is None]}
+        for event in self.events:
+            for location in event.locations or ():
+                self._by_location.setdefault(location, []).append(event)
+        self._tables = {}  # (地点, 关系阶段) -> AliasTable 或 None（没有可触发的事件）
+        self._lock = threading.Lock()
+        self.steps = 0
+        self.triggered = {}
+
+    def _build_table(self, key):
+        location, state = key
+        items = [e for e in self._by_location[location] if e.relationship_states is None or state in e.relationship_states]
+        weights = [e.weight for e in items]
+        if location is not None:
+            anywhere = self.table_for(None, state)  # 不限地点的事件作为一项
+            if anywhere is not None:
+                items.append(anywhere)
+                weights.append(anywhere.total)
+        table = AliasTable(items, weights) if items else None
+        with self._lock:
+            self._tables[key] = table
+        return table
+
+    def table_for(self, location, state):
+        """取得某地点、某关系阶段的别名表，没有可触发的事件时为 None"""
+        key = (location if location in self._locations else None, state if state in self._states else None)
+        try:
+            return self._tables[key]
+        except KeyError:
+            return self._build_table(key)
+
+    def warm_up(self):
+        """一次性建好所有别名表（多进程部署时在 fork 之前调用）"""
+        for location in (*self._locations, None):
+            for state in (*self._states, None):
+                self.table_for(location, state)
+
+    def roll(self, rng, location, game_state):
+        """
+        在一个中间地点掷一次事件。
+
+        Args:
+            rng (random.Random): 调用方的随机数生成器。
+            location (str): 所在地点key。
+            game_state (dict): 当前游戏状态（关系阶段、亲密度等）。
+
+        Returns:
+            Event or None: 触发的事件；没有触发时为 None。
+        """
+        if rng.random() >= self.trigger_rate:
+            return None
+        table = self.table_for(location, game_state.get("relationship_state"))
+        if table is None:
+            return None
+        for _ in range(MAX_REJECTIONS + 1):
+            event = table.sample(rng)
+            if event.predicate is None or event.predicate(game_state):
+                with self._lock:
+                    self.triggered[event.id] = self.triggered.get(event.id, 0) + 1
+                return event
+        return None
+
+    def walk(self, rng, waypoints, game_state):
+        """依次经过若干中间地点，返回 [(地点key, 事件), ...]"""
+        with self._lock:
+            self.steps += len(waypoints)
+        hits = []
+        for location in waypoints:
+            event = self.roll(rng, location, game_state)
+            if event is not None:
+                hits.append((location, event))
+        return hits
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "events": len(self.events),
+                "tables": sum(table is not None for table in self._tables.values()),
+                "trigger_rate": self.trigger_rate,
+                "waypoints": self.steps,
+                "triggered": dict(self.triggered),
+            }
+
+
+def load_events(path):
+    """读取事件文件，返回 (事件列表, 触发概率)"""
+    import yaml
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    events = []
+    for i, item in enumerate(data.get("events") or []):
+        if "text" not in item:
+            raise EventConfigError(f"第{i + 1}个事件缺少 text")
+        events.append(Event(item.get("id", f"event_{i + 1}"), item["text"], item.get("weight", 1),
+                            item.get("locations"), item.get("relationship_states"),
+                            item.get("conditions"), item.get("effects")))
+    return events, float(data.get("trigger_rate", DEFAULT_TRIGGER_RATE))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_event_engine() -> EventEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            events, rate = [], DEFAULT_TRIGGER_RATE
+            if EVENTS_PATH.exists():
+                try:
+                    events, rate = load_events(EVENTS_PATH)
+                except Exception as e:
+                    print(f"[EVENT] 加载 events.yaml 失败，不触发随机事件: {e}")
+            rate = float(os.environ.get("SUTANG_EVENT_RATE", rate))
+            _engine = EventEngine(events, rate)
+        return _engine
+
+
+def set_event_engine(engine: EventEngine):
+    """替换进程内共享的事件引擎（离线模拟时使用其他事件表或触发概率）"""
+    global _engine
+    with _engine_lock:
+        _engine = engine
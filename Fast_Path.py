@@ -0,0 +1,303 @@
+# =================================================================================
+# Fast_Path.py - 本地快速通道与预测性请求
+#
+# 1. FastPathRouter: 在调用LLM之前先用本地规则给玩家输入分类。打招呼、“嗯/好的”、道谢、
+#    笑声、道别这类不需要推理的短句，直接从按关系阶段编写的回复库里取一句，立即返回。
+#    保守起见：苏糖上一句是提问时不接“嗯/好的”，也不会连续超过 max_streak 轮走快速通道。
+# 2. SpeculativeRunner: 玩家还在输入时，前端把草稿发过来，后台按草稿提前发起LLM请求。
+#    正式发送的内容生成的Prompt与草稿完全一致时直接使用这次请求的结果，否则丢弃。
+#    每个会话同时最多一个预测性请求，进行中时新的草稿直接跳过；请求以低于对话的优先级排队 (Turn_Scheduler.SPECULATIVE)。
+# 3. 两者都统计命中率和省下的时间（/api/stats 与 /metrics）。
+#
+# 开关:
+#   SUTANG_FAST_PATH=on|off（默认 off）、SUTANG_FAST_PATH_MAX_STREAK
+#   SUTANG_SPECULATE=on|off（默认 off）、SUTANG_SPECULATE_WORKERS、SUTANG_SPECULATE_MIN_CHARS
+# =================================================================================
+
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Metrics import get_metrics
+from Response_Cache import normalize_input
+
+# 规范化（见 Response_Cache.normalize_input）之后整句匹配的短语
+INTENT_PHRASES = {
+    "greeting": {"你好", "您好", "嗨", "哈喽", "hi", "hello", "hey", "早", "早上好", "早安", "中午好", "下午好", "晚上好",
+                 "苏糖", "糖糖", "学姐好", "你好苏糖", "苏糖你好"},
+    "ack": {"嗯", "嗯嗯", "恩", "恩恩", "哦", "噢", "喔", "好", "好的", "好滴", "行", "ok", "okay", "可以", "知道了",
+            "明白了", "懂了", "原来如此", "这样啊", "是吗", "对", "对的", "没错"},
+    "thanks": {"谢谢", "谢谢你", "谢啦", "多谢", "感谢", "thx", "thanks", "thankyou"},
+    "farewell": {"拜拜", "再见", "回头见", "明天见", "下次见", "bye", "byebye", "晚安", "先走了", "我先走了"},
+}
+LAUGH_CHARS = set("哈嘿呵嘻")
+TRAILING_PARTICLES = "呀啊呢哦吧啦嘛喔哟~"
+
+# intent -> 关系阶段 -> 回复模板。模板中可用 {location}（当前地点名称）
+REPLY_BANK = {
+    "greeting": {
+        "初始阶段": ["啊，你好！……我们是不是在社团招新的时候见过？", "你好呀。今天在{location}也能碰到你呢。",
+                     "嗯？啊，你好……找我有事吗？"],
+        "朋友": ["哟，又见面啦！", "你好呀～今天怎么也来{location}了？", "嗨！正好有点无聊，你来得刚好。"],
+        "好朋友": ["来啦来啦！我刚还在想你今天会不会出现呢。", "嘿！在{location}等你好一会儿了～", "你好呀，今天心情怎么样？"],
+        "亲密关系": ["你来啦～（眼睛一下子亮了起来）", "终于等到你了，今天也想和你待在一起。", "嘿嘿，一见到你就开心起来了。"],
+    },
+    "ack": {
+        "初始阶段": ["嗯……", "这样啊。", "嗯，那个……"],
+        "朋友": ["嗯嗯！", "对吧～", "嘿嘿，就是这样。"],
+        "好朋友": ["嗯嗯，我就知道你懂我！", "对吧对吧～", "嘿嘿。"],
+        "亲密关系": ["嗯～（轻轻靠近了一点）", "你说什么我都觉得好。", "嘿嘿，就知道你会这么说。"],
+    },
+    "thanks": {
+        "初始阶段": ["啊，不、不用谢啦。", "没什么的……举手之劳。"],
+        "朋友": ["不客气啦～", "跟我客气什么呀！"],
+        "好朋友": ["谢什么呀，我们谁跟谁～", "下次请我吃甜点就好啦！"],
+        "亲密关系": ["对你的话，不用说谢谢哦。", "嘿嘿，那……你要怎么报答我？"],
+    },
+    "laugh": {
+        "初始阶段": ["（也跟着笑了一下）", "诶？有、有那么好笑吗？"],
+        "朋友": ["哈哈，你笑起来好夸张！", "嘿嘿，我也觉得好好笑～"],
+        "好朋友": ["哈哈哈，你真是的！", "笑什么啦～（拍了拍你的胳膊）"],
+        "亲密关系": ["看你笑得这么开心，我也好开心。", "嘿嘿，我最喜欢看你笑了。"],
+    },
+    "farewell": {
+        "初始阶段": ["嗯，再见。", "好的，那……下次见。"],
+        "朋友": ["拜拜～路上小心！", "好哦，明天见！"],
+        "好朋友": ["拜拜！明天记得来烘焙社找我～", "这就要走了吗……好吧，下次见！"],
+        "亲密关系": ["嗯……要早点回来找我哦。", "路上小心，到了跟我说一声～"],
+    },
+}
+# 苏糖上一句是提问时，这些意图需要真正的回答，交给LLM
+NEEDS_CONTEXT = {"ack", "laugh", "thanks"}
+# 句末的动作/神态描写，例如 "你呢？（笑）"
+TRAILING_ASIDE = re.compile(r"(?:\s*[（(][^（）()]*[）)])+\s*$")
+
+
+def ends_with_question(reply: str) -> bool:
+    """回复是否以提问结尾（忽略句末括号里的动作描写）"""
+    return TRAILING_ASIDE.sub("", reply).rstrip("）) ").endswith(("？", "?"))
+
+
+def classify_input(text: str):
+    """返回输入对应的意图名称；不是可以本地回复的短句时返回 None"""
+    normalized = normalize_input(text)
+    if not normalized:
+        return None
+    if (len(normalized) >= 2 and set(normalized) <= LAUGH_CHARS) or normalized in ("hh", "hhh", "233", "2333"):
+        return "laugh"
+    for candidate in (normalized, normalized.rstrip(TRAILING_PARTICLES)):
+        for intent, phrases in INTENT_PHRASES.items():
+            if candidate in phrases:
+                return intent
+    return None
+
+
+class FastPathRouter:
+    def __init__(self, enabled=False, max_streak=1, rng=None):
+        """
+        初始化 FastPathRouter。
+
+        Args:
+            enabled (bool): 是否启用快速通道。
+            max_streak (int): 最多连续几轮走快速通道，之后必须交给LLM。
+            rng (random.Random, optional): 选择回复模板用的随机数生成器。
+        """
+        self.enabled = enabled
+        self.max_streak = max_streak
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.hits = 0
+        self.hits_by_intent = {}
+        self.saved_seconds = 0.0
+
+    def route(self, user_input, game_state, location_name, last_reply, streak, rng=None):
+        """
+        判断本轮能否本地回复。
+
+        Args:
+            user_input (str): 玩家输入。
+            game_state (dict): 当前游戏状态（关系阶段等）。
+            location_name (str): 当前地点名称。
+            last_reply (str): 苏糖的上一句回复，没有时为 None。
+            streak (int): 已经连续走了几轮快速通道。
+            rng (random.Random, optional): 调用方的随机数生成器，省略时使用 self.rng。
+
+        Returns:
+            str or None: 本地回复；需要调用LLM时为 None。
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self.turns += 1
+        intent = classify_input(user_input)
+        if intent is None or streak >= self.max_streak:
+            return None
+        if intent in NEEDS_CONTEXT and last_reply and ends_with_question(last_reply):
+            return None
+        stage = game_state.get("relationship_state", "初始阶段")
+        templates = REPLY_BANK[intent].get(stage) or REPLY_BANK[intent]["初始阶段"]
+        choices = [t for t in templates if t.format(location=location_name) != last_reply] or templates
+        with self._lock:
+            self.hits += 1
+            self.hits_by_intent[intent] = self.hits_by_intent.get(intent, 0) + 1
+            reply = (rng or self.rng).choice(choices)
+        return reply.format(location=location_name)
+
+    def record_saved(self, elapsed):
+        """按最近LLM请求的平均耗时估算这次快速回复省下的时间"""
+        llm_seconds = get_metrics().average("llm_request") or get_metrics().average("llm_stream")
+        if llm_seconds:
+            with self._lock:
+                self.saved_seconds += max(0.0, llm_seconds - elapsed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "turns": self.turns,
+                "hits": self.hits,
+                "hit_ratio": round(self.hits / self.turns, 4) if self.turns else 0.0,
+                "hits_by_intent": dict(self.hits_by_intent),
+                "estimated_saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+class Speculation:
+    """一次预测性请求：草稿生成的Prompt + 后台请求"""
+    __slots__ = ("prompt", "future", "token_ratio", "started_at", "finished_at")
+
+    def __init__(self, prompt, future, token_ratio=None):
+        self.prompt = prompt
+        self.future = future
+        self.token_ratio = token_ratio  # 组装 prompt 时的token校准比例，正式发送时按同一比例组装
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+
+class SpeculativeRunner:
+    def __init__(self, enabled=False, workers=4, min_chars=2):
+        """
+        初始化 SpeculativeRunner。
+
+        Args:
+            enabled (bool): 是否接受草稿并提前发起请求。
+            workers (int): 同时进行的预测性请求上限。
+            min_chars (int): 草稿规范化后至少多少个字才值得提前请求。
+        """
+        self.enabled = enabled
+        self.workers = workers
+        self.min_chars = min_chars
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = set()  # 有预测性请求尚未结束的会话
+        self.started = 0
+        self.skipped = 0  # 同一会话上一个请求还没结束而跳过的草稿数
+        self.used = 0
+        self.discarded = 0
+        self.saved_seconds = 0.0
+
+    def accepts(self, draft: str) -> bool:
+        return self.enabled and len(normalize_input(draft)) >= self.min_chars
+
+    def start(self, session, prompt, request, token_ratio=None):
+        """
+        在后台线程中执行 request()。
+
+        Args:
+            session: 会话标识，同一会话同时最多一个预测性请求。
+            prompt (str): 草稿生成的Prompt。
+            request (callable): 发起请求的函数。
+            token_ratio (float, optional): 组装 prompt 时的token校准比例。
+
+        Returns:
+            Speculation or None: 该会话上一个请求还没结束（包括已经丢弃但仍在进行的请求）时为 None。
+        """
+        with self._lock:
+            if session in self._in_flight:
+                self.skipped += 1
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="speculate")
+            self._in_flight.add(session)
+            self.started += 1
+            speculation = Speculation(prompt, None, token_ratio)
+            speculation.future = self._executor.submit(self._run, speculation, request)
+        speculation.future.add_done_callback(lambda _: self._finished(session))  # 完成、失败或被取消
+        return speculation
+
+    def _finished(self, session):
+        with self._lock:
+            self._in_flight.discard(session)
+
+    @staticmethod
+    def _run(speculation, request):
+        try:
+            return request()
+        finally:
+            speculation.finished_at = time.monotonic()
+
+    def discard(self, speculation):
+        """草稿被改掉或没有用上：还没开始的请求直接取消，已经发出的结果丢弃"""
+        speculation.future.cancel()
+        with self._lock:
+            self.discarded += 1
+
+    def claim(self, speculation):
+        """正式请求用上了这次预测：省下的时间是从草稿请求发出到现在（最多为整个请求的耗时）"""
+        end = speculation.finished_at or time.monotonic()
+        with self._lock:
+            self.used += 1
+            self.saved_seconds += end - speculation.started_at
+        return speculation.future
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "started": self.started,
+                "skipped": self.skipped,
+                "used": self.used,
+                "discarded": self.discarded,
+                "hit_ratio": round(self.used / self.started, 4) if self.started else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+_router = None
+_runner = None
+_fast_path_lock = threading.Lock()
+
+
+def get_fast_path_router() -> FastPathRouter:
+    """取得进程内共享的 FastPathRouter（第一次调用时按环境变量创建）"""
+    global _router
+    with _fast_path_lock:
+        if _router is None:
+            _router = FastPathRouter(
+                enabled=os.environ.get("SUTANG_FAST_PATH", "off").lower() == "on",
+                max_streak=int(os.environ.get("SUTANG_FAST_PATH_MAX_STREAK", 1)),
+            )
+        return _router
+
+
+def get_speculative_runner() -> SpeculativeRunner:
+    """取得进程内共享的 SpeculativeRunner（第一次调用时按环境变量创建）"""
+    global _runner
+    with _fast_path_lock:
+        if _runner is None:
+            _runner = SpeculativeRunner(
+                enabled=os.environ.get("SUTANG_SPECULATE", "off").lower() == "on",
+                workers=int(os.environ.get("SUTANG_SPECULATE_WORKERS", 4)),
+                min_chars=int(os.environ.get("SUTANG_SPECULATE_MIN_CHARS", 2)),
+            )
+        return _runner
@@ -0,0 +1,128 @@
+# =================================================================================
+# Game_State.py - 带版本号的游戏状态
+#
+# 1. GameState 是一个 dict，额外记录每个字段最后一次被修改时的版本号。
+#    一轮请求里的修改先记为待提交，commit() 时版本号加一，这些字段都记为新版本。
+# 2. 客户端告诉服务端自己已经确认的版本，patch_since() 只返回之后变化的字段，
+#    格式与 JSON Patch (RFC 6902) 一致：[{"op": "add"|"remove"|"replace", "path": "/closeness", "value": 42}, ...]。
+#    版本不在当前时间线上（开始新游戏、读档之前的版本，或者来自已经重启的服务）时返回整个状态。
+# 3. 开始新游戏或读档时状态被整体替换 (reset)，新时间线的版本号从当前毫秒时间戳起算：
+#    一轮对话远不止一毫秒，旧时间线上的版本号总是小于新时间线的起点，不会被误认为是当前时间线上的版本。
+#    会话换出后再换入（或被其他进程处理过）时沿用存档中的版本号，客户端已确认的版本仍然有效。
+# 4. 只有对字段重新赋值才会被记录（赋给不可变字段相同的值不算修改）；修改字段中的列表/字典后需要调用 touch(key)。
+# =================================================================================
+
+import time
+
+_IMMUTABLE = (str, int, float, bool, type(None), tuple)
+
+
+def _pointer(key) -> str:
+    """字段名 -> JSON Pointer"""
+    return "/" + str(key).replace("~", "~0").replace("/", "~1")
+
+
+class GameState(dict):
+    __slots__ = ("version", "base", "_changed", "_removed", "_pending")
+
+    def __init__(self, values=(), version=0):
+        """
+        初始化 GameState。
+
+        Args:
+            values (dict): 初始字段。
+            version (int): 初始版本号，也是这条时间线的起点。
+        """
+        super().__init__(values)
+        self.version = version
+        self.base = version  # 早于这个版本的客户端只能拿到整个状态
+        self._changed = {}  # 字段 -> 最后一次被修改时的版本号
+        self._removed = {}  # 被删除的字段 -> 删除时的版本号
+        self._pending = set()  # 本轮修改过、还没有提交的字段
+
+    # --- 记录修改 ---
+    def __setitem__(self, key, value):
+        if key in self and isinstance(value, _IMMUTABLE) and type(self[key]) is type(value) and self[key] == value:
+            return
+        super().__setitem__(key, value)
+        self._pending.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._pending.add(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            self._pending.add(key)
+        return super().pop(key, *default)
+
+    def clear(self):
+        self._pending.update(self)
+        super().clear()
+
+    def touch(self, key):
+        """字段的值被原地修改（例如往列表里追加）后调用，让它出现在下一次的增量中"""
+        self._pending.add(key)
+
+    # --- 版本 ---
+    def commit(self) -> int:
+        """提交本轮的修改：有修改时版本号加一。返回当前版本号"""
+        if self._pending:
+            self.version += 1
+            for key in self._pending:
+                if key in self:
+                    self._changed[key] = self.version
+                    self._removed.pop(key, None)
+                else:
+                    self._removed[key] = self.version
+                    self._changed.pop(key, None)
+            self._pending.clear()
+        return self.version
+
+    def reset(self, values, version=None):
+        """
+        整体替换状态（开始新游戏、读档、从存储换入）。
+
+        Args:
+            values (dict): 新的字段。
+            version (int, optional): 从存储换入同一局游戏时传入存档中记录的版本号，沿用原来的时间线，
+                                     客户端已确认的版本仍然有效；省略时开始一条新的时间线。
+        """
+        super().clear()
+        super().update(values)
+        self.version = self.base = version if version is not None else max(self.version + 1, int(time.time() * 1000))
+        self._changed.clear()
+        self._removed.clear()
+        self._pending.clear()
+
+    def patch_since(self, since) -> list:
+        """
+        客户端已确认版本 since 之后的变化，JSON Patch 格式。
+
+        Args:
+            since (int): 客户端已确认的版本号。
+
+        Returns:
+            list: 操作列表；没有变化时为空列表，版本不在当前时间线上时为一个替换整个状态的操作。
+        """
+        self.commit()
+        if since is None or since < self.base or since > self.version:
+            return [{"op": "replace", "path": "", "value": dict(self)}]
+        patch = [{"op": "add", "path": _pointer(key), "value": self[key]}
+                 for key, changed in self._changed.items() if changed > since]
+        patch += [{"op": "remove", "path": _pointer(key)} for key, removed in self._removed.items() if removed > since]
+        return patch
+
+    @property
+    def etag(self) -> str:
+        """当前版本的 HTTP ETag（先提交待提交的修改）"""
+        return f'"{self.commit()}"'
@@ -1,5 +1,11 @@
 import json
 import os
+import struct
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
 class GameStorage:
@@ -13,6 +19,31 @@ class GameStorage:
         self.save_dir = save_dir
         os.makedirs(save_dir, exist_ok=True)  # 确保存档目录存在
     
+    @contextmanager
+    def write_batch(self, fsync="always"):
+        """
+        把当前线程接下来的若干次 save_game 作为一批写入（后台自动存档使用）。
+        旧版 JSON 格式从不 fsync，SQLite 由 WAL 日志保证一致性，这里什么也不做。
+
+        Args:
+            fsync (str): "always" 按存储本身的设置每次写入都 fsync；"batch" 批内不单独 fsync，
+                         整批写完后统一落盘；"off" 不 fsync，交给操作系统。
+        """
+        yield
+
+    @staticmethod
+    def _owned_slot(slot, owner=None):
+        """文件存储没有单独的所有者字段：所有者（会话或用户ID）写进槽位名，不同所有者的同名槽位互不干扰"""
+        return f"{owner}_{slot}" if owner else slot
+
+    def _list_files(self, extensions, owner=None):
+        """存档目录中指定扩展名的文件名；给出 owner 时只列出该所有者的存档，并去掉文件名中的所有者前缀"""
+        files = [f for f in os.listdir(self.save_dir) if f.endswith(extensions)]
+        if not owner:
+            return files
+        prefix = f"save_{owner}_"
+        return ["save_" + f[len(prefix):] for f in files if f.startswith(prefix)]
+
     def _get_filepath(self, slot=1):
         """
         根据槽位号生成存档文件的完整路径。
@@ -25,7 +56,7 @@ class GameStorage:
         """
         return os.path.join(self.save_dir, f"save_{slot}.json")
 
-    def save_game(self, data, slot=1):
+    def save_game(self, data, slot=1, owner=None):
         """
         将游戏数据保存到指定的存档槽位。
 
@@ -35,10 +66,12 @@ class GameStorage:
         Args:
             data (dict): 需要保存的游戏数据。
             slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者（会话或用户ID）。
 
         Returns:
             bool: 如果保存成功则返回 True，否则返回 False。
         """
+        slot = self._owned_slot(slot, owner)
         data["meta"] = {
             "timestamp": datetime.now().isoformat(),
             "version": "1.0"
@@ -56,17 +89,19 @@ class GameStorage:
             print(f"保存失败: {str(e)}")
             return False
 
-    def load_game(self, slot=1):
+    def load_game(self, slot=1, owner=None):
         """
         从指定的存档槽位加载游戏数据。
 
         Args:
             slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者（会话或用户ID）。
 
         Returns:
             dict or None: 如果加载成功，则返回包含游戏数据的字典；
                           如果存档文件不存在或加载失败，则返回 None。
         """
+        slot = self._owned_slot(slot, owner)
         try:
             with open(self._get_filepath(slot), 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -81,11 +116,394 @@ class GameStorage:
             print(f"读取失败: {str(e)}")
             return None
 
-    def list_saves(self):
+    def has_save(self, slot=1, owner=None):
+        """
+        检查指定槽位是否存在存档文件。
+
+        Args:
+            slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者（会话或用户ID）。
+
+        Returns:
+            bool: 存档文件存在时返回 True。
+        """
+        return os.path.exists(self._get_filepath(self._owned_slot(slot, owner)))
+
+    def save_version(self, slot=1, owner=None):
+        """
+        返回指定槽位存档的保存时间戳，用于判断存档是否被其他进程更新过。
+
+        Returns:
+            str or None: 存档不存在时返回 None。
+        """
+        if not self.has_save(slot, owner):
+            return None
+        data = self.load_game(slot, owner)
+        return data.get("meta", {}).get("timestamp") if data else None
+
+    def list_saves(self, owner=None):
         """
         列出存档目录中所有可用的存档文件。
 
+        Args:
+            owner (str, optional): 只列出该所有者的存档（文件名中不含所有者前缀）。
+
         Returns:
             list: 包含所有存档文件名的列表 (例如, ["save_1.json", "save_happy_ending.json"])。
         """
-        return [f for f in os.listdir(self.save_dir) if f.endswith(".json")]
\ No newline at end of file
+        return self._list_files(".json", owner)
+
+    def referenced_archives(self, field):
+        """
+        所有所有者的存档中某个归档字段引用的文件名，用于清理没有存档引用的归档文件（tools/gc_archives.py）。
+
+        Args:
+            field (str): "history_archive"（对话历史归档）或 "memory_index"（记忆向量文件）。
+
+        Returns:
+            set: 被引用的文件名（不含扩展名）。
+        """
+        referenced = set()
+        for name in self.list_saves():
+            archive = (self.load_game(os.path.splitext(name)[0][len("save_"):]) or {}).get(field)
+            if archive and archive.get("id"):
+                referenced.add(archive["id"])
+        return referenced
+
+
+class CompactGameStorage(GameStorage):
+    """
+    紧凑、原子、增量的存档格式。
+
+    每个槽位由两个文件组成：
+    - save_<slot>.snap: 完整快照，zlib 压缩的紧凑 JSON，先写临时文件再 rename，写到一半崩溃也不会损坏旧存档。
+    - save_<slot>.delta: 只追加的增量日志。每条记录为 4 字节长度 + zlib 压缩的 JSON，
+      只包含上次保存后新增的对话和发生变化的字段。
+    增量记录达到 compact_every 条或日志比快照还大时，重新写一份快照并清空日志。
+    读取时仍兼容旧版的 save_<slot>.json。
+    """
+    LOCK_STRIPES = 64
+
+    def __init__(self, save_dir="saves", compact_every=20, fsync=True, cache_slots=512):
+        """
+        初始化 CompactGameStorage 实例。
+
+        Args:
+            save_dir (str, optional): 存档文件存放的目录路径。默认为 "saves"。
+            compact_every (int, optional): 累计多少条增量记录后合并为新快照。默认为 20。
+            fsync (bool, optional): 每次写入后是否调用 fsync 确保落盘。默认为 True。
+            cache_slots (int, optional): 最多为多少个槽位记住上次写入的内容（用于计算增量），超出时丢弃最久没写过的；
+                                         被丢弃的槽位下次保存时写完整快照。默认为 512。
+        """
+        super().__init__(save_dir)
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.cache_slots = cache_slots
+        self._slot_cache = OrderedDict()  # slot -> 上次写入后的状态，用于计算增量；越靠后越新
+        self._cache_lock = threading.Lock()  # 只保护 _slot_cache 本身
+        # 槽位散列到固定数量的锁上：同一槽位的写入串行，不同会话的存档不必排队等彼此的磁盘 I/O
+        self._slot_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._batch = threading.local()  # 当前线程进行中的 write_batch：fsync 策略和待落盘的文件
+
+    @contextmanager
+    def write_batch(self, fsync="always"):
+        if fsync == "always" or getattr(self._batch, "mode", None):
+            yield
+            return
+        self._batch.mode, self._batch.paths = fsync, set()
+        try:
+            yield
+        finally:
+            paths, self._batch.mode, self._batch.paths = self._batch.paths, None, None
+            if fsync == "batch" and self.fsync:
+                self._sync_paths(paths)
+
+    def _sync_file(self, f, path):
+        """写完一个文件后落盘；在 write_batch 中时推迟到整批结束"""
+        mode = getattr(self._batch, "mode", None)
+        if mode == "batch":
+            self._batch.paths.add(path)
+        elif mode is None and self.fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _sync_paths(self, paths):
+        """整批写完后依次 fsync 写过的文件，再 fsync 存档目录让文件替换（rename）也落盘"""
+        for path in paths:
+            try:
+                with open(path, "ab") as f:
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                pass  # 批内写过的日志又被新快照删掉了
+        if paths and hasattr(os, "O_DIRECTORY"):  # Windows 上不能对目录 fsync
+            fd = os.open(self.save_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _slot_lock(self, slot):
+        return self._slot_locks[zlib.crc32(str(slot).encode("utf-8")) % self.LOCK_STRIPES]
+
+    def _cached(self, slot):
+        """上次写入该槽位后记下的状态（没有时为 None），并把它移到 LRU 末尾"""
+        with self._cache_lock:
+            cache = self._slot_cache.get(slot)
+            if cache is not None:
+                self._slot_cache.move_to_end(slot)
+            return cache
+
+    def _snapshot_path(self, slot):
+        return os.path.join(self.save_dir, f"save_{slot}.snap")
+
+    def _delta_path(self, slot):
+        return os.path.join(self.save_dir, f"save_{slot}.delta")
+
+    @staticmethod
+    def _encode(obj):
+        return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _decode(blob):
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    @staticmethod
+    def _dump(obj):
+        return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+    @staticmethod
+    def _history_total(data):
+        archive = data.get("history_archive") or {}
+        return archive.get("count", 0) + len(data.get("history", []))
+
+    def save_game(self, data, slot=1, owner=None):
+        """
+        将游戏数据保存到指定的存档槽位。能接上一次保存时只追加增量，否则写入完整快照。
+
+        Args:
+            data (dict): 需要保存的游戏数据。
+            slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者（会话或用户ID）。
+
+        Returns:
+            bool: 如果保存成功则返回 True，否则返回 False。
+        """
+        slot = self._owned_slot(slot, owner)
+        data["meta"] = {
+            "timestamp": datetime.now().isoformat(),
+            "version": "2.0"
+        }
+        if "state" in data and "date" in data["state"] and isinstance(data["state"]["date"], datetime):
+            data["state"]["date"] = data["state"]["date"].strftime("%Y-%m-%d")
+
+        try:
+            with self._slot_lock(slot):
+                cache = self._cached(slot)
+                record = self._make_delta(data, slot, cache)
+                if record is None:
+                    gen, deltas = self._write_snapshot(data, slot), 0
+                else:
+                    self._append_delta(record, slot)
+                    gen, deltas = record["gen"], cache["deltas"] + 1
+                    # 日志比快照还大时，下次保存直接写快照
+                    if os.path.getsize(self._delta_path(slot)) > os.path.getsize(self._snapshot_path(slot)):
+                        deltas = self.compact_every
+                self._remember(data, slot, gen, deltas)
+            return True
+        except Exception as e:
+            with self._cache_lock:
+                self._slot_cache.pop(slot, None)
+            print(f"保存失败: {str(e)}")
+            return False
+
+    def _make_delta(self, data, slot, cache):
+        """与上次写入的内容 cache 比较，生成增量记录；无法增量时返回 None"""
+        if cache is None or cache["deltas"] >= self.compact_every:
+            return None
+        # 文件被其他进程或实例改写过时，缓存不再可信
+        if self._file_signature(slot) != cache["signature"]:
+            return None
+
+        history = data.get("history", [])
+        archived = (data.get("history_archive") or {}).get("count", 0)
+        old_total = cache["total"]
+        if archived > old_total or self._history_total(data) < old_total:
+            return None
+        last_index = old_total - 1 - archived
+        if last_index >= 0 and self._dump(history[last_index]) != cache["last_message"]:
+            return None  # 历史不是在上次的基础上追加的（例如读档后分叉）
+
+        record = {"gen": cache["gen"], "base": old_total, "append": history[old_total - archived:],
+                  "history_archive": data.get("history_archive"), "set": {}, "state_set": {}, "state_del": []}
+        for key, value in data.items():
+            if key in ("history", "history_archive", "state"):
+                continue
+            if cache["fields"].get(key) != self._dump(value):
+                record["set"][key] = value
+        state = data.get("state", {})
+        for key, value in state.items():
+            if cache["state"].get(key) != self._dump(value):
+                record["state_set"][key] = value
+        record["state_del"] = [key for key in cache["state"] if key not in state]
+        return record
+
+    def _remember(self, data, slot, gen, deltas):
+        history = data.get("history", [])
+        cache = {
+            "gen": gen,
+            "deltas": deltas,
+            "signature": self._file_signature(slot),
+            "total": self._history_total(data),
+            "last_message": self._dump(history[-1]) if history else None,
+            "fields": {k: self._dump(v) for k, v in data.items() if k not in ("history", "history_archive", "state")},
+            "state": {k: self._dump(v) for k, v in data.get("state", {}).items()},
+        }
+        with self._cache_lock:
+            self._slot_cache[slot] = cache
+            self._slot_cache.move_to_end(slot)
+            while len(self._slot_cache) > self.cache_slots:
+                self._slot_cache.popitem(last=False)
+
+    def _file_signature(self, slot):
+        signature = []
+        for path in (self._snapshot_path(slot), self._delta_path(slot)):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _write_snapshot(self, data, slot):
+        """原子地写入完整快照，返回新快照的 gen"""
+        gen = uuid.uuid4().hex
+        blob = self._encode({"gen": gen, "data": data})
+        path = self._snapshot_path(slot)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+            self._sync_file(f, path)
+        os.replace(tmp_path, path)  # 原子替换
+        # 新快照已包含全部内容，旧日志里的记录属于旧 gen，读取时会被忽略；这里顺手删除
+        try:
+            os.remove(self._delta_path(slot))
+        except FileNotFoundError:
+            pass
+        return gen
+
+    def _append_delta(self, record, slot):
+        blob = self._encode(record)
+        with open(self._delta_path(slot), "ab") as f:
+            f.write(struct.pack(">I", len(blob)) + blob)
+            self._sync_file(f, self._delta_path(slot))
+
+    def load_game(self, slot=1, owner=None):
+        """
+        从指定的存档槽位加载游戏数据：读取快照并依次应用增量记录。没有新格式存档时读取旧版 JSON 存档。
+
+        Args:
+            slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者（会话或用户ID）。
+
+        Returns:
+            dict or None: 如果加载成功，则返回包含游戏数据的字典；
+                          如果存档文件不存在或加载失败，则返回 None。
+        """
+        slot = self._owned_slot(slot, owner)
+        if not os.path.exists(self._snapshot_path(slot)):
+            return super().load_game(slot)
+        try:
+            with open(self._snapshot_path(slot), "rb") as f:
+                snapshot = self._decode(f.read())
+            data = snapshot["data"]
+            for record in self._read_deltas(slot):
+                if record.get("gen") != snapshot["gen"]:
+                    continue
+                self._apply_delta(data, record)
+            if "history" not in data:
+                raise ValueError("存档格式错误")
+            return data
+        except Exception as e:
+            print(f"读取失败: {str(e)}")
+            return None
+
+    def _read_deltas(self, slot):
+        try:
+            with open(self._delta_path(slot), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset + 4 <= len(blob):
+            (length,) = struct.unpack_from(">I", blob, offset)
+            chunk = blob[offset + 4:offset + 4 + length]
+            if len(chunk) < length:
+                break  # 最后一条记录没写完（写入时崩溃），忽略
+            try:
+                yield self._decode(chunk)
+            except (zlib.error, ValueError):
+                break
+            offset += 4 + length
+
+    def _apply_delta(self, data, record):
+        if self._history_total(data) != record["base"]:
+            raise ValueError("增量记录与快照不连续")
+        history = data.setdefault("history", [])
+        history.extend(record["append"])
+        old_archived = (data.get("history_archive") or {}).get("count", 0)
+        new_archived = (record.get("history_archive") or {}).get("count", 0)
+        if new_archived > old_archived:
+            del history[:new_archived - old_archived]
+        data["history_archive"] = record.get("history_archive")
+        data.update(record["set"])
+        state = data.setdefault("state", {})
+        state.update(record["state_set"])
+        for key in record["state_del"]:
+            state.pop(key, None)
+
+    def has_save(self, slot=1, owner=None):
+        slot = self._owned_slot(slot, owner)
+        return os.path.exists(self._snapshot_path(slot)) or super().has_save(slot)
+
+    def list_saves(self, owner=None):
+        """
+        列出存档目录中所有可用的存档文件（新格式的快照与旧版 JSON 存档）。
+
+        Args:
+            owner (str, optional): 只列出该所有者的存档（文件名中不含所有者前缀）。
+
+        Returns:
+            list: 包含所有存档文件名的列表 (例如, ["save_1.snap", "save_2.json"])。
+        """
+        return self._list_files((".json", ".snap"), owner)
+
+
+def create_storage(save_dir="saves", save_format=None):
+    """
+    按 SUTANG_SAVE_FORMAT 环境变量创建存储：compact（默认）、sqlite 或 json（旧格式）。
+
+    Args:
+        save_dir (str, optional): 存档文件存放的目录路径。默认为 "saves"。
+        save_format (str, optional): 指定格式，省略时读取 SUTANG_SAVE_FORMAT。
+    """
+    save_format = save_format or os.environ.get("SUTANG_SAVE_FORMAT", "compact")
+    if save_format == "json":
+        return GameStorage(save_dir)
+    if save_format == "sqlite":
+        from Sqlite_Storage import SqliteGameStorage
+        return SqliteGameStorage(save_dir)
+    # 增量缓存按会话池的上限留出空间：驻留内存的会话之外，再留一些给玩家手动存档的槽位
+    return CompactGameStorage(save_dir, cache_slots=int(os.environ.get("SUTANG_MAX_AGENTS", 500)) + 64)
+
+
+_storages = {}  # (存档目录, 格式) -> 存储对象
+_storages_lock = threading.Lock()
+
+
+def get_storage(save_dir="saves", save_format=None):
+    """同一目录的存储在进程内只创建一次，所有 Agent 共用（各存储的方法都可以在多个线程中调用）"""
+    with _storages_lock:
+        storage = _storages.get((save_dir, save_format))
+        if storage is None:
+            storage = _storages[save_dir, save_format] = create_storage(save_dir, save_format)
+        return storage
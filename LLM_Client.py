@@ -0,0 +1,275 @@
+# =================================================================================
+# LLM_Client.py - 共享的大模型API客户端
+#
+# 对话和记忆总结共用同一个客户端：
+# 1. 基于 asyncio + httpx，在一个后台事件循环线程里运行，连接池复用 keep-alive 连接，
+#    不必每轮都重新进行TLS握手。
+# 2. 每个主机有并发上限，超出的请求在本地排队，不会把服务商打爆。
+# 3. 遇到 429/5xx 或网络错误时，按带抖动的指数退避自动重试。读写超时不重试（服务端可能已经在生成，
+#    重试会重复计费），所有重试加起来也不超过调用方给出的 timeout。
+# 4. 为Flask的同步请求线程提供 complete()/stream() 同步接口。
+# 5. 累计响应中的 usage，统计服务商前缀缓存命中的 prompt token 比例。
+# 6. httpx 在第一次发请求时才导入（连同 certifi 约 30ms），不拖慢服务启动。
+# =================================================================================
+
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+from urllib.parse import urlsplit
+
+DEFAULT_API_BASE = "https://api.deepseek.com/v1"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """API调用失败（已用尽重试次数或遇到不可重试的错误）"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMClient:
+    def __init__(self, base_url=None, api_key=None, max_connections=32, max_keepalive=16,
+                 per_host_limit=16, max_retries=3, backoff_base=0.5, backoff_max=8.0, timeout=45):
+        """
+        初始化 LLMClient。
+
+        Args:
+            base_url (str, optional): API根地址，默认读取 DEEPSEEK_API_BASE 环境变量。
+            api_key (str, optional): API密钥，默认在每次请求时读取 DEEPSEEK_API_KEY 环境变量。
+            max_connections (int): 连接池的最大连接数。
+            max_keepalive (int): 连接池中保持空闲的 keep-alive 连接数。
+            per_host_limit (int): 单个主机同时进行中的请求上限。
+            max_retries (int): 429/5xx/网络错误时的最大重试次数（读写超时不重试）。
+            backoff_base (float): 退避的基准秒数，第 n 次重试最多等待 backoff_base * 2**n 秒。
+            backoff_max (float): 单次退避的最长秒数。
+            timeout (float): 默认的请求超时（秒）。
+        """
+        self.base_url = (base_url or os.environ.get("DEEPSEEK_API_BASE") or DEFAULT_API_BASE).rstrip("/")
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.retries = 0  # 累计重试次数，便于观察服务商限流情况
+        self.usage = {"requests": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._host_limits = {}
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 异步接口
+    # ------------------------------------------------------------------
+    async def acomplete(self, payload: dict, timeout=None) -> dict:
+        """发送一次非流式的 chat/completions 请求，返回完整的响应JSON"""
+        url = f"{self.base_url}/chat/completions"
+        async with self._host_limit(url):
+            response = await self._send_with_retry(url, payload, timeout, stream=False)
+            result = response.json()
+            self._record_usage(result.get("usage"))
+            return result
+
+    async def astream(self, payload: dict, timeout=None, on_usage=None):
+        """发送流式请求，逐段产出模型生成的文本。on_usage 在收到 usage 时被调用（在后台事件循环线程中）"""
+        url = f"{self.base_url}/chat/completions"
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        async with self._host_limit(url):
+            response = await self._send_with_retry(url, payload, timeout, stream=True)
+            try:
+                # 服务端以SSE格式返回：每行 "data: {json}"，以 "data: [DONE]" 结束
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        self._record_usage(chunk["usage"])  # 最后一个分片带 usage，choices 为空
+                        if on_usage is not None:
+                            on_usage(chunk["usage"])
+                    if not chunk.get("choices"):
+                        continue
+                    delta = chunk["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+            finally:
+                await response.aclose()
+
+    def _record_usage(self, usage):
+        """DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 兼容接口返回 prompt_tokens_details.cached_tokens"""
+        if not usage:
+            return
+        cached = usage.get("prompt_cache_hit_tokens")
+        if cached is None:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        self.usage["requests"] += 1
+        self.usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.usage["cached_prompt_tokens"] += cached or 0
+        self.usage["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def usage_stats(self) -> dict:
+        stats = dict(self.usage, retries=self.retries)
+        stats["prompt_cache_hit_ratio"] = round(stats["cached_prompt_tokens"] / stats["prompt_tokens"], 4) \
+            if stats["prompt_tokens"] else 0.0
+        return stats
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    async def _send_with_retry(self, url, payload, timeout, stream):
+        import httpx
+
+        api_key = self.api_key or os.environ.get("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise LLMError("API密钥未设置或无效")
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        http = self._get_http()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)  # 包括重试和退避在内的总时限
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                request = http.build_request("POST", url, headers=headers, json=payload,
+                                             timeout=max(0.1, deadline - loop.time()))
+                response = await http.send(request, stream=stream)
+                if response.status_code == 200:
+                    return response
+                body = (await response.aread()).decode("utf-8", "replace")
+                await response.aclose()
+                error = LLMError(f"API Error {response.status_code}: {body}", response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+                retry_after = response.headers.get("Retry-After")
+            except (httpx.ReadTimeout, httpx.WriteTimeout) as e:
+                # 请求已经发出：服务端可能还在生成，重试会重复计费，调用方也已经等满了 timeout
+                raise LLMError(f"请求超时: {e!r}") from e
+            except httpx.TransportError as e:
+                error = LLMError(f"网络错误: {e!r}")
+
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt == self.max_retries or loop.time() + delay >= deadline:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def _backoff_delay(self, attempt, retry_after=None) -> float:
+        """带完全抖动的指数退避；服务商给出 Retry-After 时以它为下限"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def _get_http(self):
+        if self._http is None:
+            import httpx
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_keepalive)
+            self._http = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # ------------------------------------------------------------------
+    # 同步接口：在后台事件循环中执行，供Flask的请求线程调用
+    # ------------------------------------------------------------------
+    def complete(self, payload: dict, timeout=None) -> dict:
+        return self._run(self.acomplete(payload, timeout))
+
+    def stream(self, payload: dict, timeout=None, on_usage=None):
+        """同步生成器：逐段产出文本。调用方提前停止迭代时，后台请求会被取消"""
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for text in self.astream(payload, timeout, on_usage):
+                    chunks.put(text)
+            except BaseException as e:
+                chunks.put(e)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+            finally:
+                chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def close(self):
+        """关闭连接池并停止后台事件循环"""
+        if self._loop is None:
+            return
+        self._run(self.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = self._thread = None
+        self._host_limits = {}
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """取得进程内共享的 LLMClient（第一次调用时按环境变量创建）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                max_connections=int(os.environ.get("SUTANG_LLM_MAX_CONNECTIONS", 32)),
+                per_host_limit=int(os.environ.get("SUTANG_LLM_HOST_CONCURRENCY", 16)),
+                max_retries=int(os.environ.get("SUTANG_LLM_MAX_RETRIES", 3)),
+            )
+        return _client
+
+
+def set_llm_client(client):
+    """
+    替换进程内共享的客户端，例如离线模拟时换成不联网的替身（见 tools/simulate_sessions.py）。
+
+    Args:
+        client: 提供 complete()、stream()、usage_stats() 和 close() 的对象。
+    """
+    global _client
+    with _client_lock:
+        _client = client
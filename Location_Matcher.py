@@ -0,0 +1,113 @@
+# =================================================================================
+# Location_Matcher.py - 移动意图中的地点识别
+#
+# 用地点的名称、别名和拼音写法建一个 Aho-Corasick 自动机，
+# 扫描一遍玩家输入就能找出其中提到的所有地点，与地点数量无关。
+# 多个地点重叠时（如“二楼走廊”和“走廊”）取最长、最具体的那个。
+#
+# locations.yaml 中可选的字段:
+#   aliases: [图书室, 阅览室]
+#   pinyin: [tushuguan]
+# 英文与拼音不区分大小写。
+# =================================================================================
+
+import threading
+from collections import deque
+
+
+class LocationMatcher:
+    def __init__(self, locations: dict):
+        """
+        根据地点数据建立自动机。
+
+        Args:
+            locations (dict): locations.yaml 的内容，key 为地点key。
+        """
+        self.patterns = []  # 模式编号 -> (地点key, 模式文本)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]  # 状态 -> 在该状态结束的模式编号
+
+        seen = set()
+        for key, data in locations.items():
+            data = data or {}
+            for text in self.variants(data):
+                text = text.lower()
+                if text and (key, text) not in seen:
+                    seen.add((key, text))
+                    self._add(text, len(self.patterns))
+                    self.patterns.append((key, text))
+        self._build_failure_links()
+
+    @staticmethod
+    def variants(data: dict) -> list:
+        """一个地点的所有可匹配写法：名称、别名、拼音"""
+        texts = [data.get("name")]
+        texts.extend(data.get("aliases", []) or [])
+        texts.extend(data.get("pinyin", []) or [])
+        return [str(t) for t in texts if t]
+
+    def _add(self, text, pattern_id):
+        state = 0
+        for ch in text:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = nxt
+        self._output[state] = self._output[state] + (pattern_id,)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                if state == 0:
+                    continue  # 第一层的失败指针指向根
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> list:
+        """返回输入中提到的所有地点，每项为 (起始位置, 结束位置, 地点key)"""
+        matches = []
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for i, ch in enumerate(text.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern_id in output[state]:
+                key, pattern = self.patterns[pattern_id]
+                matches.append((i + 1 - len(pattern), i + 1, key))
+        return matches
+
+    def best_match(self, text: str):
+        """输入中最长（最具体）的地点；长度相同时取先出现的。没有提到地点时返回 None"""
+        best = None
+        for start, end, key in self.find_all(text):
+            if best is None or end - start > best[1] - best[0] or (end - start == best[1] - best[0] and start < best[0]):
+                best = (start, end, key)
+        return best[2] if best else None
+
+
+_cache = (None, None)  # (locations 对象, LocationMatcher)
+_cache_lock = threading.Lock()
+
+
+def get_location_matcher(locations: dict) -> LocationMatcher:
+    """同一份地点数据只建一次自动机（地点数据由 World_Data 在进程内共享）"""
+    global _cache
+    with _cache_lock:
+        if _cache[0] is locations:
+            return _cache[1]
+    matcher = LocationMatcher(locations)
+    with _cache_lock:
+        _cache = (locations, matcher)
+    return matcher
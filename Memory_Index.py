@@ -0,0 +1,297 @@
+# =================================================================================
+# Memory_Index.py - 长期记忆的本地检索索引
+#
+# 长期记忆会随着游戏进行一直增长，全部塞进Prompt会让每轮对话越来越慢、越来越贵。
+# 这里为每条记忆建立一个 BM25 词频向量，每轮只取与玩家输入和当前地点最相关的 top_k 条，
+# 并且总长度不超过 token_budget。完全在本地计算，不需要网络或额外的模型。
+#
+# 1. 分词：中文按单字和相邻两字，英文和数字按单词；用 crc32 把词哈希到 dims（最多 65536）个维度。
+#    一条记忆只出现几十个不同的词，所以按稀疏行存储（CSR）：所有记忆的词编号 (uint16) 和词频 (uint8)
+#    依次排在两个可以增量追加的 NumPy 数组里，另有每行的起始位置。每条记忆只占几百字节。
+# 2. 增量：后台总结追加到 long_term_memory 后，下一次检索或存档时只为新记忆计算向量。
+# 3. 存储：每条记忆写成一条 uint16 记录 [词数 n, n 个词编号, n 个词频]，追加到存档目录下的 memory_index/ 文件，
+#    存档里只记录文件名、记忆条数和字数，和 Dialogue_History 的归档一样只追加，时间线分叉时换新文件。
+#    文件缺失或长度不符时从记忆文本重建。没有任何存档引用的文件由 tools/gc_archives.py 清理。
+# 4. NumPy 在第一次为记忆计算向量时才导入（约 50ms）：服务启动和还没有长期记忆的 Agent 都用不到它。
+# =================================================================================
+
+import os
+import re
+import time
+import uuid
+import zlib
+
+from Token_Counter import get_token_counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿]")
+ARCHIVE_EXT = ".u16"
+LEGACY_ARCHIVE_EXT = ".u8"  # 旧版的稠密 uint8 向量文件，已不再读取
+
+np = None  # 由 _numpy() 在第一次用到时导入
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def tokenize(text: str) -> list:
+    """中文取单字和相邻两字，英文和数字取整个单词"""
+    pieces = TOKEN_PATTERN.findall(text.lower())
+    terms = list(pieces)
+    for first, second in zip(pieces, pieces[1:]):
+        if first >= "一" and second >= "一":  # 英文单词都排在汉字之前
+            terms.append(first + second)
+    return terms
+
+
+def remove_unreferenced(archive_dir, referenced, min_age=86400.0, dry_run=False) -> list:
+    """
+    删除 archive_dir 中没有被任何存档引用的向量文件（以及旧版的 .u8 文件）。
+
+    Args:
+        archive_dir (str): memory_index/ 目录。
+        referenced (set): 存档中引用的向量文件名（不含扩展名）。
+        min_age (float): 只删除至少这么多秒没有修改过的文件：还在内存中、尚未存档的 Agent 的文件不会被误删。
+        dry_run (bool): 只列出，不删除。
+
+    Returns:
+        list: 删除（或将要删除）的文件路径。
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    removed = []
+    cutoff = time.time() - min_age
+    for filename in os.listdir(archive_dir):
+        name, ext = os.path.splitext(filename)
+        if ext not in (ARCHIVE_EXT, LEGACY_ARCHIVE_EXT) or (ext == ARCHIVE_EXT and name in referenced):
+            continue
+        path = os.path.join(archive_dir, filename)
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+    return removed
+
+
+class MemoryIndex:
+    def __init__(self, archive_dir, dims=65536, k1=1.2, b=0.75):
+        """
+        初始化 MemoryIndex。
+
+        Args:
+            archive_dir (str): 向量文件所在目录。
+            dims (int): 词哈希的维度数，词编号按 uint16 存储，最多 65536。
+            k1 (float): BM25 的词频饱和参数。
+            b (float): BM25 的文档长度归一化参数。
+        """
+        if not 0 < dims <= 65536:
+            raise ValueError(f"dims 必须在 1 到 65536 之间: {dims}")
+        self.archive_dir = archive_dir
+        self.dims = dims
+        self.k1 = k1
+        self.b = b
+        self._source = None  # 建立索引时对应的记忆列表（新游戏或读档后会换成新的列表）
+        # CSR 稀疏矩阵：第 i 条记忆的词编号和词频是 _ids/_counts[_offsets[i]:_offsets[i + 1]]。
+        # 数组容量按倍数增长，第一次追加时才分配
+        self._ids = None
+        self._counts = None
+        self._offsets = None
+        self._lengths = None
+        self.count = 0
+
+        self.archive_id = None  # 向量文件名（不含扩展名），第一次写入时才创建
+        self.archived_count = 0  # 向量文件中属于本时间线的记忆条数
+        self.archived_words = 0  # 这些记录在向量文件中占用的 uint16 字数
+
+    # ------------------------------------------------------------------
+    # 建立与增量更新
+    # ------------------------------------------------------------------
+    def _vectorize(self, text: str):
+        """一条记忆的稀疏词频向量：(升序的词编号 uint16, 词频 uint8)"""
+        hashes = np.fromiter((zlib.crc32(term.encode("utf-8")) % self.dims for term in tokenize(text)), dtype=np.int64)
+        ids, counts = np.unique(hashes, return_counts=True)
+        return ids.astype(np.uint16), np.minimum(counts, 255).astype(np.uint8)
+
+    def _append_rows(self, rows):
+        """追加若干条记忆的 (词编号, 词频)"""
+        needed = self.count + len(rows)
+        nnz = 0 if self._offsets is None else int(self._offsets[self.count])
+        needed_nnz = nnz + sum(len(ids) for ids, _ in rows)
+        capacity = 0 if self._lengths is None else len(self._lengths)
+        if needed > capacity:
+            capacity = max(16, needed, capacity * 2)
+            offsets = np.zeros(capacity + 1, dtype=np.int64)
+            lengths = np.zeros(capacity, dtype=np.float32)
+            if self.count:
+                offsets[:self.count + 1] = self._offsets[:self.count + 1]
+                lengths[:self.count] = self._lengths[:self.count]
+            self._offsets, self._lengths = offsets, lengths
+        nnz_capacity = 0 if self._ids is None else len(self._ids)
+        if needed_nnz > nnz_capacity:
+            nnz_capacity = max(256, needed_nnz, nnz_capacity * 2)
+            ids = np.zeros(nnz_capacity, dtype=np.uint16)
+            counts = np.zeros(nnz_capacity, dtype=np.uint8)
+            if nnz:
+                ids[:nnz] = self._ids[:nnz]
+                counts[:nnz] = self._counts[:nnz]
+            self._ids, self._counts = ids, counts
+        for i, (ids, counts) in enumerate(rows, start=self.count):
+            end = nnz + len(ids)
+            self._ids[nnz:end] = ids
+            self._counts[nnz:end] = counts
+            self._offsets[i + 1] = end
+            self._lengths[i] = counts.sum(dtype=np.float32)
+            nnz = end
+        self.count = needed
+
+    def sync(self, memories: list):
+        """让索引跟上记忆列表：同一个列表只为新增的记忆计算向量，换了列表就重建"""
+        if memories is not self._source or len(memories) < self.count:
+            self._source = memories
+            self.count = 0
+            self.archive_id, self.archived_count, self.archived_words = None, 0, 0
+        new_texts = memories[self.count:len(memories)]
+        if new_texts:
+            _numpy()
+            self._append_rows([self._vectorize(text) for text in new_texts])
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+    def scores(self, query: str):
+        """每条记忆对查询的 BM25 得分 (float32 数组)"""
+        _numpy()
+        query_terms = np.unique([zlib.crc32(t.encode("utf-8")) % self.dims for t in tokenize(query)])
+        if not self.count or not len(query_terms):
+            return np.zeros(self.count, dtype=np.float32)
+        # 只取出命中查询词的非零项（按词编号查表，比 np.isin 快），展开成 (记忆数 x 查询词数) 的词频表
+        is_query = np.zeros(self.dims, dtype=bool)
+        is_query[query_terms] = True
+        offsets = self._offsets[:self.count + 1]
+        ids = self._ids[:offsets[-1]]
+        hits = np.flatnonzero(is_query[ids])
+        tf = np.zeros((self.count, len(query_terms)), dtype=np.float32)
+        if len(hits):
+            rows = np.searchsorted(offsets, hits, side="right") - 1
+            tf[rows, np.searchsorted(query_terms, ids[hits])] = self._counts[hits]
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log1p((self.count - df + 0.5) / (df + 0.5))
+        lengths = self._lengths[:self.count]
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0))
+        return (idf * tf * (self.k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+    def search(self, memories: list, query: str, top_k=5, token_budget=300, count_tokens=None) -> list:
+        """
+        取出与查询最相关的记忆。
+
+        Args:
+            memories (list): 长期记忆列表（与索引同步）。
+            query (str): 检索用的文本（玩家输入 + 当前地点等）。
+            top_k (int): 最多返回几条。
+            token_budget (int): 返回记忆（每条一行）的token总数上限。
+            count_tokens (callable, optional): 计数函数（Prompt组装时按组装固定的校准比例计数），省略时用共享的 TokenCounter。
+
+        Returns:
+            list: 选中的记忆，按原有的时间顺序排列。
+        """
+        self.sync(memories)
+        if not self.count:
+            return []
+        # 得分相同（包括都不相关）时优先较新的记忆
+        order = np.lexsort((-np.arange(self.count), -self.scores(query)))
+        count_tokens = count_tokens or get_token_counter().count
+        chosen, used = [], 0
+        for i in order[:top_k]:
+            cost = count_tokens(f"- {memories[i]}") + 1
+            if used + cost > token_budget:
+                continue
+            chosen.append(int(i))
+            used += cost
+        return [memories[i] for i in sorted(chosen)]
+
+    @property
+    def nbytes(self) -> int:
+        if self._lengths is None:
+            return 0
+        return self._ids.nbytes + self._counts.nbytes + self._offsets.nbytes + self._lengths.nbytes
+
+    # ------------------------------------------------------------------
+    # 存档
+    # ------------------------------------------------------------------
+    def _archive_path(self, archive_id):
+        return os.path.join(self.archive_dir, f"{archive_id}{ARCHIVE_EXT}")
+
+    def _records(self, start, end):
+        """第 start 到 end 条记忆的文件记录：每条为 [词数, 词编号..., 词频...] (小端 uint16)"""
+        parts = []
+        for i in range(start, end):
+            first, last = self._offsets[i], self._offsets[i + 1]
+            parts += [np.array([last - first]), self._ids[first:last], self._counts[first:last]]
+        return np.concatenate(parts).astype("<u2")
+
+    def export(self, memories: list):
+        """把尚未写入的向量追加到文件，返回存档中记录的索引信息"""
+        self.sync(memories)
+        if self.count > self.archived_count:
+            path = self._archive_path(self.archive_id) if self.archive_id else None
+            if path is None or not os.path.exists(path) or os.path.getsize(path) != self.archived_words * 2:
+                self._fork_archive()
+            records = self._records(self.archived_count, self.count)
+            with open(self._archive_path(self.archive_id), "ab") as f:
+                records.tofile(f)
+            self.archived_count = self.count
+            self.archived_words += len(records)
+        if not self.archive_id:
+            return None
+        return {"id": self.archive_id, "count": self.archived_count, "words": self.archived_words, "dims": self.dims}
+
+    def _fork_archive(self):
+        """
+        向量文件可以被多个存档共享，各自只读前 count 条记录。文件在本时间线之后又被追加过
+        （例如读取了较早的存档后继续游戏）或者已经不存在时，换一个新文件从头写入。
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self.archive_id = uuid.uuid4().hex
+        self.archived_count, self.archived_words = 0, 0
+
+    @staticmethod
+    def _parse_records(words, count):
+        """把文件中的 count 条记录解析为 [(词编号, 词频)]；长度对不上时抛出 ValueError"""
+        rows, pos = [], 0
+        for _ in range(count):
+            n = int(words[pos])
+            ids, counts = words[pos + 1:pos + 1 + n], words[pos + 1 + n:pos + 1 + 2 * n]
+            if len(counts) != n:
+                raise ValueError("向量文件被截断")
+            rows.append((ids.astype(np.uint16), counts.astype(np.uint8)))
+            pos += 1 + 2 * n
+        if pos != len(words):
+            raise ValueError("向量文件记录数不符")
+        return rows
+
+    @classmethod
+    def restore(cls, memories, archive, archive_dir, **kwargs):
+        """从存档恢复：向量文件可用时直接读取，否则（旧存档、旧版稠密格式、文件缺失）从记忆文本重建"""
+        index = cls(archive_dir, **kwargs)
+        index._source = memories
+        if archive and archive.get("dims") == index.dims and archive.get("count") == len(memories) and "words" in archive:
+            path = index._archive_path(archive["id"])
+            count, words = archive["count"], archive["words"]
+            try:
+                if count and os.path.getsize(path) >= words * 2:
+                    _numpy()
+                    rows = cls._parse_records(np.fromfile(path, dtype="<u2", count=words), count)
+                    index._append_rows(rows)
+                    index.archive_id, index.archived_count, index.archived_words = archive["id"], count, words
+            except (OSError, ValueError):
+                pass
+        index.sync(memories)
+        return index
@@ -0,0 +1,266 @@
+# =================================================================================
+# Memory_Summarizer.py - 后台长期记忆总结
+#
+# 每隔 SUMMARY_TRIGGER_THRESHOLD 条对话，Agent 会把最近的对话快照交给这里，
+# 由后台工作线程调用LLM生成总结，完成后追加到该 Agent 的 long_term_memory。
+# 玩家的聊天请求不再等待总结完成。
+# 同一个 Agent 还在排队的总结任务会被合并，不会重复调用LLM。
+# batch_size > 1 时，工作线程一次取出多个玩家的任务，在一次LLM调用中批量总结；
+# 批量结果不可用时自动退回逐个总结。
+# 总结超过 timeout 秒仍未完成（LLM 很慢或不可用）时可以放弃 (abandon)：结果不再写入记忆，
+# 这段对话记回 Agent 的待总结计数，随存档保存，下次对话时重新总结。
+# =================================================================================
+
+import os
+import queue
+import threading
+import time
+
+
+class _SummaryJob:
+    __slots__ = ("agent", "memory", "messages", "enqueued_at", "dropped")
+
+    def __init__(self, agent, messages):
+        self.agent = agent
+        # 记住提交时的记忆列表：如果期间玩家开了新游戏或读了档，旧对话的总结不会混进新的记忆里
+        self.memory = agent.long_term_memory
+        self.messages = messages
+        self.enqueued_at = time.monotonic()
+        self.dropped = False  # 已放弃：结果不再写入记忆
+
+
+class SummaryQueue:
+    def __init__(self, workers=2, batch_size=1, batch_window=0.0, timeout=120.0):
+        """
+        初始化 SummaryQueue。
+
+        Args:
+            workers (int): 后台工作线程的数量。
+            batch_size (int): 一次LLM调用最多总结几个任务，1 表示不批量。
+            batch_window (float): 取到第一个任务后，最多再等多少秒凑满一批。
+            timeout (float): 一个 Agent 的总结提交后超过该秒数仍未完成，就视为超时（见 overdue / abandon）。
+        """
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._pending = {}  # id(agent) -> 还在排队、尚未开始的任务
+        self._unfinished = {}  # id(agent) -> 已提交但尚未完成的任务列表
+        self._lock = threading.Lock()
+        self._threads = []
+        self.on_change = None  # 总结写入记忆、或放弃后待总结计数改变时调用 on_change(agent)，用于把会话标记为需要存档
+
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.merged = 0
+        self.batched = 0  # 通过批量调用完成总结的任务数
+        self.abandoned = 0  # 超时或关闭服务时放弃的任务数
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    def submit(self, agent, messages):
+        """
+        提交一段对话快照。该 Agent 已有排队中的任务时，把新对话并入那个任务。
+
+        Args:
+            agent (GalGameAgent): 总结完成后写入记忆的 Agent。
+            messages (list): 触发时刻的对话快照（user/assistant 消息）。
+        """
+        self._ensure_workers()
+        with self._lock:
+            job = self._pending.get(id(agent))
+            if job is not None and job.memory is agent.long_term_memory:
+                job.messages.extend(messages)
+                self.merged += 1
+                return
+            job = _SummaryJob(agent, list(messages))
+            self._pending[id(agent)] = job  # 若有旧游戏的排队任务，它仍在队列里，只是不再接受合并
+            unfinished = self._unfinished.setdefault(id(agent), [])
+            if not unfinished:
+                agent.summary_pending_since = job.enqueued_at
+            unfinished.append(job)
+            agent.summary_pending = True
+        self._queue.put(job)
+
+    def _ensure_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, name=f"memory-summarizer-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            with self._lock:
+                for job in jobs:
+                    if self._pending.get(id(job.agent)) is job:
+                        del self._pending[id(job.agent)]
+                dropped = [job for job in jobs if job.dropped]
+                jobs = [job for job in jobs if not job.dropped]
+                self.in_flight += len(jobs)
+            for _ in dropped:
+                self._queue.task_done()
+            if not jobs:
+                continue
+            try:
+                summaries = self._summarize(jobs)
+            except Exception as e:
+                print(f"[SUMMARY] 后台记忆总结失败: {e}")
+                summaries = [""] * len(jobs)
+            for job, summary in zip(jobs, summaries):
+                self._finish(job, summary)
+
+    def _summarize(self, jobs):
+        snippets = [job.agent._format_history_for_prompt(custom_history=job.messages) for job in jobs]
+        if len(jobs) > 1:
+            summaries = jobs[0].agent._generate_memory_summaries(snippets)
+            if summaries is not None:
+                with self._lock:
+                    self.batched += len(jobs)
+                return summaries
+        return [job.agent._generate_memory_summary(snippet) for job, snippet in zip(jobs, snippets)]
+
+    def _finish(self, job, summary):
+        agent = job.agent
+        lag = time.monotonic() - job.enqueued_at
+        with self._lock:
+            self.in_flight -= 1
+            if not job.dropped:
+                if summary:
+                    job.memory.append(summary)
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self._total_lag += lag
+                self._forget(job)
+        if summary and not job.dropped and self.on_change is not None:
+            self.on_change(agent)
+        self._queue.task_done()
+
+    def _forget(self, job):
+        """任务完成或被放弃后从未完成列表中移除，更新 Agent 的 summary_pending。调用方需持有 self._lock"""
+        agent = job.agent
+        unfinished = self._unfinished.get(id(agent), [])
+        if job in unfinished:
+            unfinished.remove(job)
+        if not unfinished:
+            self._unfinished.pop(id(agent), None)
+        agent.summary_pending = bool(unfinished)
+
+    def overdue(self, agent) -> bool:
+        """该 Agent 的后台总结提交后已超过 timeout 秒仍未完成"""
+        return agent.summary_pending and time.monotonic() - agent.summary_pending_since > self.timeout
+
+    def abandon(self, agent=None) -> int:
+        """
+        放弃尚未完成的总结任务（某个 Agent 的，或省略时全部）：结果不再写入记忆，
+        这些对话记回 Agent 的 dialogue_turns_since_last_summary（随存档保存），下一次触发总结时一并总结。
+        调用方需保证 Agent 此时没有在处理请求（持有会话锁，或服务正在关闭）。
+
+        Returns:
+            int: 放弃的任务数。
+        """
+        with self._lock:
+            keys = [id(agent)] if agent is not None else list(self._unfinished)
+            jobs = [job for key in keys for job in self._unfinished.get(key, [])]
+            for job in jobs:
+                job.dropped = True
+                if self._pending.get(id(job.agent)) is job:
+                    del self._pending[id(job.agent)]
+                if job.memory is job.agent.long_term_memory:  # 期间开了新游戏或读了档时，旧对话不必再总结
+                    job.agent.dialogue_turns_since_last_summary += len(job.messages)
+                self._forget(job)
+            self.abandoned += len(jobs)
+        if jobs:
+            print(f"[SUMMARY] 放弃了 {len(jobs)} 个未完成的记忆总结，对应的对话将在下次总结时处理")
+            if self.on_change is not None:
+                for changed in {id(job.agent): job.agent for job in jobs}.values():
+                    self.on_change(changed)
+        return len(jobs)
+
+    def transfer(self, old_agent, new_agent):
+        """
+        会话的 Agent 被替换（其他进程处理过，从存储重新换入）时，把旧 Agent 未完成的总结改为写入新 Agent，
+        总结不会落进已经没人引用的旧对象。调用方需持有会话锁。
+        """
+        with self._lock:
+            jobs = [job for job in self._unfinished.pop(id(old_agent), []) if job.memory is old_agent.long_term_memory]
+            old_agent.summary_pending = False
+            pending = self._pending.pop(id(old_agent), None)
+            if not jobs:
+                return
+            for job in jobs:
+                job.agent, job.memory = new_agent, new_agent.long_term_memory
+            if pending in jobs:
+                self._pending[id(new_agent)] = pending
+            self._unfinished.setdefault(id(new_agent), []).extend(jobs)
+            new_agent.summary_pending = True
+            new_agent.summary_pending_since = min(job.enqueued_at for job in jobs)
+
+    def join(self, timeout=None) -> bool:
+        """
+        等待所有已提交的总结任务完成。
+
+        Args:
+            timeout (float, optional): 最多等待的秒数，省略时一直等。
+
+        Returns:
+            bool: 全部完成时返回 True，超时返回 False（未完成的任务可用 abandon 放弃）。
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "merged": self.merged,
+                "batched": self.batched,
+                "abandoned": self.abandoned,
+                "last_lag_seconds": round(self.last_lag, 3),
+                "avg_lag_seconds": round(self._total_lag / finished, 3) if finished else 0.0,
+                "max_lag_seconds": round(self.max_lag, 3),
+            }
+
+
+_summary_queue = None
+_summary_queue_lock = threading.Lock()
+
+
+def get_summary_queue() -> SummaryQueue:
+    """取得进程内共享的 SummaryQueue"""
+    global _summary_queue
+    with _summary_queue_lock:
+        if _summary_queue is None:
+            _summary_queue = SummaryQueue(
+                workers=int(os.environ.get("SUTANG_SUMMARY_WORKERS", 2)),
+                batch_size=int(os.environ.get("SUTANG_SUMMARY_BATCH", 1)),
+                batch_window=float(os.environ.get("SUTANG_SUMMARY_BATCH_WINDOW", 0.2)),
+                timeout=float(os.environ.get("SUTANG_SUMMARY_TIMEOUT", 120)),
+            )
+        return _summary_queue
@@ -0,0 +1,209 @@
+# =================================================================================
+# Metrics.py - 对话轮次的耗时统计与慢请求追踪
+#
+# 1. span(名称) 记录一段代码的耗时：意图识别、Prompt构建、LLM网络时间、首个token、
+#    解析、状态更新、存档等。每个阶段维护一个最近样本的滑动窗口，用于计算 p50/p95/p99。
+# 2. turn(类型) 包住一整轮对话。轮次内的 span 和 API 返回的 usage 会记在这一轮的追踪里；
+#    设置了 SUTANG_TRACE_FILE 时，耗时超过 SUTANG_SLOW_TURN_MS 的轮次按
+#    SUTANG_TRACE_SAMPLE 的比例写入 JSONL 文件，便于离线分析。
+# 3. render() 输出 Prometheus 文本格式，由 /metrics 路由提供。
+# =================================================================================
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _SpanStats:
+    __slots__ = ("count", "total", "recent")
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)  # 最近的样本，用于计算分位数
+
+    def quantiles(self):
+        samples = sorted(self.recent)
+        if not samples:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+
+class TurnTrace:
+    """一轮对话的追踪记录：各阶段耗时与token用量"""
+    __slots__ = ("kind", "started_at", "start", "spans", "tokens")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []  # [(阶段名, 毫秒)]
+        self.tokens = {}
+
+    def add_usage(self, usage):
+        """累加 API 返回的 usage（一轮里可能有多次调用）"""
+        for key in ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens"):
+            if usage.get(key):
+                self.tokens[key] = self.tokens.get(key, 0) + usage[key]
+
+    def to_dict(self, total_ms):
+        return {
+            "ts": self.started_at,
+            "kind": self.kind,
+            "total_ms": round(total_ms, 2),
+            "spans": [{"name": name, "ms": round(ms, 2)} for name, ms in self.spans],
+            "tokens": self.tokens,
+        }
+
+
+class Metrics:
+    def __init__(self, window=1024, trace_file=None, slow_turn_ms=3000.0, trace_sample=1.0):
+        """
+        初始化 Metrics。
+
+        Args:
+            window (int): 每个阶段保留多少个最近样本用于计算分位数。
+            trace_file (str, optional): 慢轮次追踪的 JSONL 文件路径，None 表示不写追踪。
+            slow_turn_ms (float): 耗时超过该毫秒数的轮次视为慢轮次。
+            trace_sample (float): 慢轮次写入追踪文件的比例 (0~1)。
+        """
+        self.window = window
+        self.trace_file = trace_file
+        self.slow_turn_ms = slow_turn_ms
+        self.trace_sample = trace_sample
+        self._spans = {}  # 阶段名 -> _SpanStats
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.turns = 0
+        self.slow_turns = 0
+        self.traced_turns = 0
+
+    def observe(self, name, seconds):
+        """记录一个阶段的耗时；当前线程有进行中的轮次时一并记入该轮的追踪"""
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = _SpanStats(self.window)
+            stats.count += 1
+            stats.total += seconds
+            stats.recent.append(seconds)
+        trace = self.current_turn()
+        if trace is not None:
+            trace.spans.append((name, seconds * 1000))
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def average(self, name):
+        """某个阶段的平均耗时（秒），没有样本时为 None"""
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None or not stats.recent:
+                return None
+            return sum(stats.recent) / len(stats.recent)
+
+    def current_turn(self):
+        return getattr(self._local, "turn", None)
+
+    @contextmanager
+    def turn(self, kind):
+        """包住一整轮对话。可以嵌套，只有最外层的轮次会被统计"""
+        if self.current_turn() is not None:
+            yield self.current_turn()
+            return
+        trace = TurnTrace(kind)
+        self._local.turn = trace
+        try:
+            yield trace
+        finally:
+            self._local.turn = None
+            elapsed = time.perf_counter() - trace.start
+            self.observe(f"turn_{kind}", elapsed)
+            self._finish_turn(trace, elapsed * 1000)
+
+    def _finish_turn(self, trace, total_ms):
+        with self._lock:
+            self.turns += 1
+            if total_ms < self.slow_turn_ms:
+                return
+            self.slow_turns += 1
+            if not self.trace_file or random.random() >= self.trace_sample:
+                return
+            self.traced_turns += 1
+            try:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(total_ms), ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"[METRICS] 写入追踪文件失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            spans = {}
+            for name, stats in self._spans.items():
+                q = stats.quantiles()
+                spans[name] = {
+                    "count": stats.count,
+                    "avg_ms": round(stats.total / stats.count * 1000, 3) if stats.count else 0.0,
+                    "p50_ms": round(q[0.5] * 1000, 3),
+                    "p95_ms": round(q[0.95] * 1000, 3),
+                    "p99_ms": round(q[0.99] * 1000, 3),
+                }
+            return {"turns": self.turns, "slow_turns": self.slow_turns, "traced_turns": self.traced_turns, "spans": spans}
+
+    def render(self, counters=None, gauges=None) -> str:
+        """
+        以 Prometheus 文本格式输出所有指标。
+
+        Args:
+            counters (dict, optional): 额外的计数器，名称 -> (说明, 值)。
+            gauges (dict, optional): 额外的仪表值，名称 -> (说明, 值)。
+        """
+        lines = [
+            "# HELP sutang_span_seconds Time spent in each stage of a chat turn.",
+            "# TYPE sutang_span_seconds summary",
+        ]
+        with self._lock:
+            for name in sorted(self._spans):
+                stats = self._spans[name]
+                for q, value in stats.quantiles().items():
+                    lines.append(f'sutang_span_seconds{{span="{name}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'sutang_span_seconds_sum{{span="{name}"}} {stats.total:.6f}')
+                lines.append(f'sutang_span_seconds_count{{span="{name}"}} {stats.count}')
+            own_counters = {
+                "sutang_turns_total": ("Chat turns handled.", self.turns),
+                "sutang_slow_turns_total": ("Chat turns slower than SUTANG_SLOW_TURN_MS.", self.slow_turns),
+            }
+        for kind, metrics in (("counter", dict(own_counters, **(counters or {}))), ("gauge", gauges or {})):
+            for name, (help_text, value) in metrics.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """取得进程内共享的 Metrics（第一次调用时按环境变量创建）"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(
+                trace_file=os.environ.get("SUTANG_TRACE_FILE") or None,
+                slow_turn_ms=float(os.environ.get("SUTANG_SLOW_TURN_MS", 3000)),
+                trace_sample=float(os.environ.get("SUTANG_TRACE_SAMPLE", 1.0)),
+            )
+        return _metrics
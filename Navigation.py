@@ -0,0 +1,147 @@
+# =================================================================================
+# Navigation.py - 地点图的导航索引
+#
+# 1. 地点key映射为整数编号，邻接关系存成紧凑的 (邻居编号, 步行时间) 元组。
+# 2. 每个起点一行“父节点表”：parent[起点][终点] = 最短路线上终点的前一个地点编号，
+#    查路线时从终点沿父节点回溯即可，耗时与路径长度成正比。
+# 3. 父节点表按起点惰性计算并缓存，也可以在启动时一次性算好 (warm_up)；
+#    locations.yaml 改动后只需换一个新索引，各行会在用到时重新计算。
+# 4. connections 中的连接可以带步行时间，此时用 Dijkstra 求最短时间路线；
+#    全部不带时间时退化为BFS（最少步数），与旧实现结果一致。
+#
+# connections 支持两种写法:
+#   connections: [library, canteen]
+#   connections: [{to: library, walk_time: 60}, canteen]
+# =================================================================================
+
+import heapq
+import os
+import threading
+from collections import deque
+from collections.abc import Mapping
+
+DEFAULT_WALK_TIME = 1
+
+
+class NavigationIndex:
+    def __init__(self, locations: dict):
+        """
+        根据地点数据建立导航索引。
+
+        Args:
+            locations (dict): locations.yaml 的内容，key 为地点key。
+        """
+        self.keys = list(locations)
+        self.ids = {key: i for i, key in enumerate(self.keys)}
+        self.adjacency = []
+        weighted = False
+        for key in self.keys:
+            edges = []
+            for conn in (locations[key] or {}).get("connections", []) or []:
+                if isinstance(conn, Mapping):
+                    target, walk_time = conn.get("to"), conn.get("walk_time", DEFAULT_WALK_TIME)
+                    weighted = weighted or "walk_time" in conn
+                else:
+                    target, walk_time = conn, DEFAULT_WALK_TIME
+                if target in self.ids:
+                    edges.append((self.ids[target], walk_time))
+            self.adjacency.append(tuple(edges))
+        self.weighted = weighted
+        self._parents = [None] * len(self.keys)  # 每个起点一行，惰性计算
+        self._lock = threading.Lock()
+
+    def neighbors(self, key: str) -> list:
+        """可以从 key 直接到达的地点"""
+        node = self.ids.get(key)
+        if node is None:
+            return []
+        return [self.keys[n] for n, _ in self.adjacency[node]]
+
+    def find_path(self, start_key: str, end_key: str):
+        """返回从起点到终点的地点key列表（含两端），不可达时返回 None"""
+        start, end = self.ids.get(start_key), self.ids.get(end_key)
+        if start is None or end is None:
+            return None
+        if start == end:
+            return [start_key]
+        parent = self._row(start)
+        if parent[end] < 0:
+            return None
+        path = []
+        node = end
+        while node != start:
+            path.append(self.keys[node])
+            node = parent[node]
+        path.append(start_key)
+        path.reverse()
+        return path
+
+    def warm_up(self):
+        """一次性计算所有起点的父节点表（全源最短路）"""
+        for start in range(len(self.keys)):
+            self._row(start)
+
+    def _row(self, start: int) -> list:
+        row = self._parents[start]
+        if row is None:
+            row = self._dijkstra_row(start) if self.weighted else self._bfs_row(start)
+            with self._lock:
+                self._parents[start] = row
+        return row
+
+    def _bfs_row(self, start: int) -> list:
+        """BFS，只记录每个节点的父节点，不复制路径"""
+        parent = [-1] * len(self.keys)
+        parent[start] = start
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbor, _ in self.adjacency[node]:
+                if parent[neighbor] < 0:
+                    parent[neighbor] = node
+                    queue.append(neighbor)
+        return parent
+
+    def _dijkstra_row(self, start: int) -> list:
+        parent = [-1] * len(self.keys)
+        dist = [float("inf")] * len(self.keys)
+        parent[start], dist[start] = start, 0
+        heap = [(0, start)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for neighbor, walk_time in self.adjacency[node]:
+                nd = d + walk_time
+                if nd < dist[neighbor]:
+                    dist[neighbor] = nd
+                    parent[neighbor] = node
+                    heapq.heappush(heap, (nd, neighbor))
+        return parent
+
+
+_cache = {}  # 文件路径 -> (mtime, locations, NavigationIndex)
+_cache_lock = threading.Lock()
+
+
+def load_navigation(path, loader):
+    """
+    读取地点文件并建立导航索引。文件未修改时直接返回缓存，所有 Agent 共用同一份索引。
+
+    Args:
+        path (str or Path): locations.yaml 的路径。
+        loader (callable): 接收路径、返回地点字典的函数。
+
+    Returns:
+        tuple: (locations, NavigationIndex)
+    """
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        cached = _cache.get(str(path))
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+    locations = loader(path) or {}
+    index = NavigationIndex(locations)
+    with _cache_lock:
+        _cache[str(path)] = (mtime, locations, index)
+    return locations, index
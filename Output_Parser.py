@@ -0,0 +1,249 @@
+# =================================================================================
+# Output_Parser.py - LLM输出的解析
+#
+# 模型的输出格式固定为 <analysis>{...}</analysis><response>...</response>。
+# 流式生成时，<analysis> 里的JSON只在内部使用，玩家不应看到；
+# <response> 里的文字则要尽快转发给前端。
+#
+# 1. ResponseStreamParser 是单遍的标签切分器：逐段喂入时边收边转发回复，
+#    同时收集分析部分；完整文本也只需喂一次 (parse_llm_output)。
+# 2. 分析JSON解码为带 __slots__ 的 Analysis 对象，字段类型在解码时校验，不合法立即报错。
+# =================================================================================
+
+import json
+
+ANALYSIS_OPEN, ANALYSIS_CLOSE = "<analysis>", "</analysis>"
+RESPONSE_OPEN, RESPONSE_CLOSE = "<response>", "</response>"
+_OUTSIDE_TAGS = (ANALYSIS_OPEN, RESPONSE_OPEN, RESPONSE_CLOSE)
+
+
+def _partial_suffix_len(text: str, tag: str) -> int:
+    """text 的结尾如果是 tag 的前缀（标签被切断在两个片段之间），返回该前缀的长度"""
+    for n in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-n:]):
+            return n
+    return 0
+
+
+class ResponseStreamParser:
+    """
+    逐段接收模型输出，只放出 <response> 标签内的文字。
+
+    用法：对每个到达的片段调用 feed()，把返回值转发给玩家；结束时调用 close()。
+    完整的原始输出保存在 text 属性中，供最终的完整解析使用。
+    如果模型省略了 <response> 标签，</analysis> 之后的文字也会被当作回复转发，
+    与 GalGameAgent._parse_llm_output 的兜底行为一致。
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._analysis_parts = []
+        self._analysis_done = False
+        self._buffer = ""
+        self._state = "outside"  # outside / analysis / response
+        self._analysis_closed = False
+        self._emitted = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def analysis_text(self):
+        """<analysis> 标签内的原始文本；没有完整的分析标签时为 None"""
+        return "".join(self._analysis_parts) if self._analysis_done else None
+
+    def feed(self, chunk: str) -> str:
+        self._parts.append(chunk)
+        self._buffer += chunk
+        out = []
+
+        while self._buffer:
+            if self._state == "analysis":
+                idx = self._buffer.find(ANALYSIS_CLOSE)
+                if idx < 0:
+                    # 分析内容不需要转发，只保留可能被切断的结束标签
+                    keep = _partial_suffix_len(self._buffer, ANALYSIS_CLOSE)
+                    if not self._analysis_done:
+                        self._analysis_parts.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                if not self._analysis_done:
+                    self._analysis_parts.append(self._buffer[:idx])
+                self._buffer = self._buffer[idx + len(ANALYSIS_CLOSE):]
+                self._state = "outside"
+                self._analysis_closed = True
+                self._analysis_done = True
+
+            elif self._state == "response":
+                idx = self._buffer.find(RESPONSE_CLOSE)
+                if idx >= 0:
+                    out.append(self._buffer[:idx])
+                    self._buffer = self._buffer[idx + len(RESPONSE_CLOSE):]
+                    self._state = "outside"
+                    continue
+                safe = len(self._buffer) - _partial_suffix_len(self._buffer, RESPONSE_CLOSE)
+                out.append(self._buffer[:safe])
+                self._buffer = self._buffer[safe:]
+                break
+
+            else:
+                lt = self._buffer.find("<")
+                plain = self._buffer if lt < 0 else self._buffer[:lt]
+                if self._analysis_closed:
+                    out.append(plain)  # 兜底：</analysis> 之后、标签之外的文字也是回复
+                if lt < 0:
+                    self._buffer = ""
+                    break
+                rest = self._buffer[lt:]
+                if rest.startswith(ANALYSIS_OPEN):
+                    self._buffer = rest[len(ANALYSIS_OPEN):]
+                    self._state = "analysis"
+                    if not self._analysis_done:
+                        self._analysis_parts = []  # 只保留第一个完整的分析块
+                elif rest.startswith(RESPONSE_OPEN):
+                    self._buffer = rest[len(RESPONSE_OPEN):]
+                    self._state = "response"
+                elif rest.startswith(RESPONSE_CLOSE):
+                    self._buffer = rest[len(RESPONSE_CLOSE):]
+                elif any(tag.startswith(rest) for tag in _OUTSIDE_TAGS):
+                    self._buffer = rest  # 标签还没收完整，等下一个片段
+                    break
+                else:
+                    if self._analysis_closed:
+                        out.append("<")
+                    self._buffer = rest[1:]
+
+        return self._emit("".join(out))
+
+    def close(self) -> str:
+        """输出结束：放出缓冲区里剩下的回复文字"""
+        rest, self._buffer = self._buffer, ""
+        if self._state == "response" or (self._state == "outside" and self._analysis_closed):
+            return self._emit(rest)
+        return ""
+
+    def _emit(self, text: str) -> str:
+        # 与完整解析一致，去掉回复开头的空白
+        if not self._emitted:
+            text = text.lstrip()
+            if text:
+                self._emitted = True
+        return text
+
+
+def parse_llm_output(text: str) -> tuple:
+    """
+    一遍扫描完整的模型输出。
+
+    Returns:
+        tuple: (分析部分的原始文本或 None, 回复文字)
+    """
+    parser = ResponseStreamParser()
+    response = parser.feed(text) + parser.close()
+    return parser.analysis_text, response.strip()
+
+
+# ---------------------------------------------------------------------------------
+# 分析JSON的类型化结构
+# ---------------------------------------------------------------------------------
+class AnalysisError(ValueError):
+    """分析JSON缺失、语法错误或字段类型不合法"""
+
+
+def _as_int(data, key):
+    value = data.get(key, 0)
+    if isinstance(value, bool):
+        raise AnalysisError(f"字段 '{key}' 应为整数，实际为 {value!r}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())  # 模型偶尔会输出 "+2" 这样的字符串
+        except ValueError:
+            pass
+    raise AnalysisError(f"字段 '{key}' 应为整数，实际为 {value!r}")
+
+
+def _as_str(data, key, default=""):
+    value = data.get(key, default)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise AnalysisError(f"字段 '{key}' 应为字符串，实际为 {type(value).__name__}")
+    return value
+
+
+class SuggestedAction:
+    """AI 提议的动作，目前只有 propose_location_change"""
+    __slots__ = ("type", "target_location_key")
+
+    def __init__(self, type: str, target_location_key: str = None):
+        self.type = type
+        self.target_location_key = target_location_key
+
+    @classmethod
+    def from_json(cls, value):
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            raise AnalysisError(f"字段 'suggested_action' 应为对象或 null，实际为 {type(value).__name__}")
+        action_type = _as_str(value, "type")
+        if not action_type:
+            raise AnalysisError("suggested_action 缺少 'type'")
+        target = value.get("target_location_key")
+        if target is not None and not isinstance(target, str):
+            raise AnalysisError("suggested_action.target_location_key 应为字符串")
+        return cls(action_type, target)
+
+
+class Analysis:
+    """<analysis> 中的JSON。字段与 analysis_prompt 中要求的一致"""
+    __slots__ = ("thought_process", "player_emotion_guess", "player_intent_guess", "response_strategy",
+                 "affection_delta_reason", "affection_delta", "boredom_delta", "mood_change",
+                 "triggered_topics", "suggested_action")
+
+    def __init__(self, affection_delta=0, boredom_delta=0, mood_change="unchanged", triggered_topics=(),
+                 suggested_action=None, thought_process="", player_emotion_guess="", player_intent_guess="",
+                 response_strategy="", affection_delta_reason=""):
+        self.affection_delta = affection_delta
+        self.boredom_delta = boredom_delta
+        self.mood_change = mood_change
+        self.triggered_topics = triggered_topics
+        self.suggested_action = suggested_action
+        self.thought_process = thought_process
+        self.player_emotion_guess = player_emotion_guess
+        self.player_intent_guess = player_intent_guess
+        self.response_strategy = response_strategy
+        self.affection_delta_reason = affection_delta_reason
+
+    @classmethod
+    def decode(cls, text: str) -> "Analysis":
+        """从 <analysis> 标签内的文本解码：取第一个 '{' 到最后一个 '}' 之间的JSON并校验字段类型"""
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end < start:
+            raise AnalysisError("在<analysis>标签内未找到有效的JSON结构。")
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError as e:
+            raise AnalysisError(f"分析JSON语法错误: {e}") from e
+        if not isinstance(data, dict):
+            raise AnalysisError("分析JSON应为对象")
+
+        topics = data.get("triggered_topics") or []
+        if not isinstance(topics, list) or not all(isinstance(t, str) for t in topics):
+            raise AnalysisError("字段 'triggered_topics' 应为字符串列表")
+        return cls(
+            affection_delta=_as_int(data, "affection_delta"),
+            boredom_delta=_as_int(data, "boredom_delta"),
+            mood_change=_as_str(data, "mood_change", "unchanged"),
+            triggered_topics=tuple(topics),
+            suggested_action=SuggestedAction.from_json(data.get("suggested_action")),
+            thought_process=_as_str(data, "thought_process"),
+            player_emotion_guess=_as_str(data, "player_emotion_guess"),
+            player_intent_guess=_as_str(data, "player_intent_guess"),
+            response_strategy=_as_str(data, "response_strategy"),
+            affection_delta_reason=_as_str(data, "affection_delta_reason"),
+        )
@@ -0,0 +1,185 @@
+# =================================================================================
+# Prompt_Budget.py - 按token预算组装Prompt
+#
+# 每轮Prompt的长度决定了费用和首字延迟。这里给整段Prompt设一个总预算 (SUTANG_PROMPT_TOKENS)，
+# 各部分按优先级从高到低依次领取：
+#   1. 人设与规则（模板的固定文本）、关系状态、可去的地点、玩家输入 —— 必须完整保留
+#   2. 当前场景的描述 —— 超出时截短
+#   3. 长期记忆 —— 另有上限 (SUTANG_MEMORY_TOKEN_BUDGET)，只放得下的最相关几条
+#   4. 最近的对话历史 —— 从最新的一条往回放，放不下的较早消息先缩写成一行，再省略
+# 优先级越低的部分越先被裁剪。正式发送的Prompt的组装结果（各部分token数）计入 /api/stats 的汇总和本轮的追踪，
+# 与API返回的实际用量一起，使每轮的费用可以预估；按草稿提前组装的Prompt不计入。
+# 逐轮的token日志默认关闭（多进程部署时每个玩家每轮一行会刷满 stdout），调试时设置 SUTANG_LOG_TOKENS=1 打开。
+# 一次组装在开始时固定token计数的校准比例：草稿阶段裁剪过的Prompt，正式发送时按同一比例重新组装，结果逐字节相同。
+# =================================================================================
+
+import os
+import threading
+
+from Token_Counter import get_token_counter
+
+ELLIPSIS = "…"
+
+
+class PromptAssembly:
+    """一次Prompt组装：各部分按优先级依次领取剩余预算，并记录各自的token数"""
+
+    def __init__(self, budget, ratio=None):
+        self.budget = budget
+        self.counter = get_token_counter()
+        self.ratio = self.counter.ratio if ratio is None else ratio  # 本次组装固定使用的校准比例
+        self.remaining = budget.prompt_tokens
+        self.sections = {}  # 部分名称 -> token数
+        self.trimmed = []  # 被裁剪过的部分
+
+    def count(self, text) -> int:
+        """按本次组装的校准比例计数"""
+        return self.counter.count(text, self.ratio)
+
+    def _take(self, section, tokens):
+        self.sections[section] = self.sections.get(section, 0) + tokens
+        self.remaining -= tokens
+
+    def available(self, cap=None) -> int:
+        """本部分最多还能用多少token"""
+        remaining = max(0, self.remaining)
+        return remaining if cap is None else min(cap, remaining)
+
+    def add(self, section, text):
+        """必须完整保留的部分：照单全收，超出预算也不裁剪"""
+        self._take(section, self.count(str(text)))
+        return text
+
+    def fit(self, section, text, cap=None):
+        """放得下就原样保留，否则截短到剩余预算以内"""
+        limit = self.available(cap)
+        tokens = self.count(text)
+        if tokens > limit:
+            text = self.truncate(text, limit)
+            tokens = self.count(text)
+            self.trimmed.append(section)
+        self._take(section, tokens)
+        return text
+
+    def fit_lines(self, section, lines, cap=None, omitted_line=None, shorten_chars=40):
+        """
+        从最后一行（最新）往前放，直到预算用完。第一条放不下的行先尝试缩写，之后的行全部省略。
+
+        Returns:
+            list: 保留下来的行（顺序不变），有省略时以 omitted_line 开头。
+        """
+        limit = self.available(cap)
+        kept, used = [], 0
+        for index in range(len(lines) - 1, -1, -1):
+            cost = self.count(lines[index]) + 1  # +1: 换行
+            if used + cost <= limit:
+                kept.append(lines[index])
+                used += cost
+                continue
+            short = lines[index][:shorten_chars] + ELLIPSIS
+            cost = self.count(short) + 1
+            shortened = len(short) < len(lines[index]) and used + cost <= limit
+            if shortened:
+                kept.append(short)
+                used += cost
+            marker_cost = self.count(omitted_line) + 1 if omitted_line else 0
+            if omitted_line and (index > 0 or not shortened) and used + marker_cost <= limit:
+                kept.append(omitted_line)
+                used += marker_cost
+            self.trimmed.append(section)
+            break
+        kept.reverse()
+        self._take(section, used)
+        return kept
+
+    def truncate(self, text, max_tokens):
+        """截短到不超过 max_tokens 个token（二分查找保留的字数）"""
+        if max_tokens <= 0:
+            return ""
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid] + ELLIPSIS) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low] + ELLIPSIS if low else ""
+
+    @property
+    def total(self) -> int:
+        return sum(self.sections.values())
+
+
+class PromptBudget:
+    def __init__(self, prompt_tokens=3000, memory_tokens=300, completion_tokens=1500, log=False):
+        """
+        初始化 PromptBudget。
+
+        Args:
+            prompt_tokens (int): 整段Prompt的token预算。
+            memory_tokens (int): 长期记忆部分的token上限。
+            completion_tokens (int): 每次对话请求的 max_tokens。
+            log (bool): 每轮把组装结果和API返回的实际用量打印到日志（调试用）。
+        """
+        self.prompt_tokens = prompt_tokens
+        self.memory_tokens = memory_tokens
+        self.completion_tokens = completion_tokens
+        self.log = log
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.trimmed_turns = 0
+        self.max_prompt_tokens = 0
+        self._total_prompt_tokens = 0
+        self._section_totals = {}
+
+    def start(self, ratio=None) -> PromptAssembly:
+        """开始一次组装。ratio 沿用之前某次组装的校准比例（例如草稿阶段的预测性请求），省略时取当前的比例"""
+        return PromptAssembly(self, ratio)
+
+    def record(self, assembly: PromptAssembly):
+        """记录一次正式发送的Prompt的组装结果；开启 log 时同时写入日志"""
+        total = assembly.total
+        with self._lock:
+            self.turns += 1
+            self.trimmed_turns += bool(assembly.trimmed)
+            self.max_prompt_tokens = max(self.max_prompt_tokens, total)
+            self._total_prompt_tokens += total
+            for section, tokens in assembly.sections.items():
+                self._section_totals[section] = self._section_totals.get(section, 0) + tokens
+        if not self.log:
+            return
+        parts = ", ".join(f"{section} {tokens}" for section, tokens in assembly.sections.items())
+        trimmed = f"; trimmed: {', '.join(dict.fromkeys(assembly.trimmed))}" if assembly.trimmed else ""
+        print(f"[TOKENS] prompt ~{total}/{self.prompt_tokens} ({parts}){trimmed}; max completion {self.completion_tokens}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "prompt_tokens_budget": self.prompt_tokens,
+                "completion_tokens_budget": self.completion_tokens,
+                "turns": self.turns,
+                "trimmed_turns": self.trimmed_turns,
+                "avg_prompt_tokens": round(self._total_prompt_tokens / self.turns, 1) if self.turns else 0.0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "avg_section_tokens": {section: round(tokens / self.turns, 1)
+                                       for section, tokens in self._section_totals.items()},
+                "token_counter": get_token_counter().stats(),
+            }
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_prompt_budget() -> PromptBudget:
+    """取得进程内共享的 PromptBudget（第一次调用时按环境变量创建）"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = PromptBudget(
+                prompt_tokens=int(os.environ.get("SUTANG_PROMPT_TOKENS", 3000)),
+                memory_tokens=int(os.environ.get("SUTANG_MEMORY_TOKEN_BUDGET", 300)),
+                completion_tokens=int(os.environ.get("SUTANG_MAX_COMPLETION_TOKENS", 1500)),
+                log=os.environ.get("SUTANG_LOG_TOKENS") == "1",
+            )
+        return _budget
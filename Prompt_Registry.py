@@ -0,0 +1,205 @@
+# =================================================================================
+# Prompt_Registry.py - Prompt模板注册表
+#
+# 1. 启动时一次性读取 prompts/ 下的所有模板，预先拆分成“字面文本 + 占位符”片段，
+#    渲染时只做一次字符串拼接，不再每轮读文件、解析 str.format 语法。
+# 2. 模板名为相对 prompts/ 的路径去掉 .txt 后缀，例如 "su_tang/analysis_prompt"。
+# 3. 调用方登记每个模板会收到哪些字段，加载时即校验占位符，错误在启动时就暴露。
+#    登记可以在模块导入时进行 (expect_fields)：注册表在第一次取用时才创建并读取模板，导入模块不会读文件。
+# 4. 每隔 check_interval 秒才检查一次文件修改时间，修改后的模板会自动重新加载。
+# 5. 记录每个模板的渲染次数与耗时。
+# 6. 模板应当把固定不变的内容（人设、规则）放在最前面，动态字段放在后面，
+#    这样每轮请求的前缀都相同，能命中服务商的前缀缓存；static_prefix 即这段固定前缀。
+# =================================================================================
+
+import os
+import threading
+import time
+from pathlib import Path
+from string import Formatter
+
+PROMPTS_DIR = Path(__file__).resolve().parent / "prompts"
+
+
+class PromptTemplateError(ValueError):
+    """模板不存在、语法错误或占位符与登记的字段不一致"""
+
+
+class CompiledPrompt:
+    """预先拆分好的模板：渲染时按顺序拼接字面文本和字段值"""
+    __slots__ = ("name", "fields", "static_prefix", "literal_text", "_segments", "mtime")
+
+    def __init__(self, name, source, mtime=0.0):
+        self.name = name
+        self.mtime = mtime
+        self._segments = []
+        fields = set()
+        try:
+            for literal, field, spec, conversion in Formatter().parse(source):
+                if literal:
+                    self._segments.append((literal, None, None, None))
+                if field is not None:
+                    if not field.isidentifier():
+                        raise PromptTemplateError(f"模板 '{name}' 中的占位符 '{{{field}}}' 不是简单字段名")
+                    fields.add(field)
+                    self._segments.append((None, field, spec, conversion))
+        except ValueError as e:
+            if isinstance(e, PromptTemplateError):
+                raise
+            raise PromptTemplateError(f"模板 '{name}' 语法错误: {e}") from e
+        self.fields = frozenset(fields)
+        # 第一个占位符之前的字面文本，每次渲染结果都以它开头
+        self.static_prefix = self._segments[0][0] if self._segments and self._segments[0][1] is None else ""
+        # 所有字面文本，即渲染结果中与字段值无关的部分（用于计算模板本身占用的token）
+        self.literal_text = "".join(literal for literal, field, _, _ in self._segments if field is None)
+
+    def render(self, values: dict) -> str:
+        parts = []
+        for literal, field, spec, conversion in self._segments:
+            if field is None:
+                parts.append(literal)
+                continue
+            value = values[field]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "s":
+                value = str(value)
+            parts.append(format(value, spec) if spec else str(value))
+        return "".join(parts)
+
+
+class PromptRegistry:
+    def __init__(self, prompts_dir=PROMPTS_DIR, check_interval=2.0, expected_fields=None):
+        """
+        初始化 PromptRegistry。
+
+        Args:
+            prompts_dir (str or Path): 模板根目录。
+            check_interval (float): 检查模板文件是否被修改的最短间隔（秒），0 表示不自动重新加载。
+            expected_fields (dict, optional): 模板名 -> 渲染时会提供的字段，第一次加载时即按它校验。
+        """
+        self.prompts_dir = Path(prompts_dir)
+        self.check_interval = check_interval
+        self._templates = {}
+        self._expected_fields = {name: frozenset(fields) for name, fields in (expected_fields or {}).items()}
+        self._errors = {}  # name -> 最近一次加载失败的原因
+        self._failed_mtimes = {}  # name -> 加载失败的文件版本，文件没改就不再重试
+        self._render_stats = {}  # name -> [次数, 总耗时, 最大耗时]
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self.reload()
+
+    def expect_fields(self, name, fields):
+        """登记某个模板渲染时会提供的字段，并立即校验已加载的模板"""
+        self._expected_fields[name] = frozenset(fields)
+        template = self._templates.get(name)
+        if template is not None:
+            try:
+                self._validate(template)
+            except PromptTemplateError as e:
+                print(f"[PROMPT] 加载模板失败，该模板不可用: {e}")
+                del self._templates[name]
+                self._errors[name] = str(e)
+                self._failed_mtimes[name] = template.mtime
+
+    def _validate(self, template):
+        expected = self._expected_fields.get(template.name)
+        if expected is None:
+            return
+        unknown = template.fields - expected
+        if unknown:
+            raise PromptTemplateError(f"模板 '{template.name}' 使用了未提供的占位符: {', '.join(sorted(unknown))}")
+        unused = expected - template.fields
+        if unused:
+            print(f"[PROMPT] 提示: 模板 '{template.name}' 没有使用字段: {', '.join(sorted(unused))}")
+
+    def reload(self):
+        """扫描模板目录，重新编译新增或修改过的模板。编译失败的模板保留旧版本"""
+        with self._lock:
+            seen = set()
+            for path in self.prompts_dir.rglob("*"):
+                if not path.is_file() or path.name.startswith("."):
+                    continue
+                name = path.relative_to(self.prompts_dir).with_suffix("").as_posix() if path.suffix == ".txt" \
+                    else path.relative_to(self.prompts_dir).as_posix()
+                seen.add(name)
+                mtime = path.stat().st_mtime
+                current = self._templates.get(name)
+                if (current is not None and current.mtime == mtime) or self._failed_mtimes.get(name) == mtime:
+                    continue
+                try:
+                    template = CompiledPrompt(name, path.read_text(encoding="utf-8"), mtime)
+                    self._validate(template)
+                except PromptTemplateError as e:
+                    print(f"[PROMPT] 加载模板失败，{'继续使用旧版本' if current else '该模板不可用'}: {e}")
+                    self._errors[name] = str(e)
+                    self._failed_mtimes[name] = mtime
+                    continue
+                self._templates[name] = template
+                self._errors.pop(name, None)
+                self._failed_mtimes.pop(name, None)
+                if current is not None:
+                    print(f"[PROMPT] 模板 '{name}' 已重新加载")
+            for name in set(self._templates) - seen:
+                del self._templates[name]
+            self._next_check = time.monotonic() + self.check_interval
+
+    def get(self, name) -> CompiledPrompt:
+        if self.check_interval and time.monotonic() >= self._next_check:
+            self.reload()
+        template = self._templates.get(name)
+        if template is None:
+            raise PromptTemplateError(self._errors.get(name) or f"模板 '{name}' 不存在（目录: {self.prompts_dir}）")
+        return template
+
+    def render(self, name, values: dict) -> str:
+        template = self.get(name)
+        start = time.perf_counter()
+        result = template.render(values)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats = self._render_stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "renders": count,
+                    "avg_ms": round(total / count * 1000, 4) if count else 0.0,
+                    "max_ms": round(max_elapsed * 1000, 4),
+                    "static_prefix_chars": len(self._templates[name].static_prefix) if name in self._templates else 0,
+                }
+                for name, (count, total, max_elapsed) in self._render_stats.items()
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+_expected_fields = {}  # 注册表创建之前登记的字段
+
+
+def expect_fields(name, fields):
+    """
+    登记某个模板渲染时会提供的字段。共享的注册表还没创建时先记下来，
+    第一次 get_prompt_registry() 加载模板时一并校验，因此可以在模块导入时调用。
+    """
+    with _registry_lock:
+        if _registry is None:
+            _expected_fields[name] = fields
+            return
+        registry = _registry
+    registry.expect_fields(name, fields)
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """取得进程内共享的 PromptRegistry（第一次调用时读取并编译全部模板）"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(check_interval=float(os.environ.get("SUTANG_PROMPT_RELOAD_SECONDS", 2)),
+                                       expected_fields=_expected_fields)
+        return _registry
@@ -0,0 +1,135 @@
+# =================================================================================
+# Response_Cache.py - 本地回复缓存
+#
+# 同一场景、同一关系阶段、相同的最近几条对话下，玩家说出同样的短句（“你好”、“嗯”）时，
+# 直接复用之前生成的结果，省掉一次完整的LLM调用。
+#
+# 1. 缓存键为 (地点, 关系阶段, 最近对话的哈希, 规范化后的输入)。
+#    规范化：全角转半角、转小写、去掉空白和标点。
+# 2. LRU + TTL：超过容量时淘汰最久未使用的条目，过期条目在读取时丢弃。
+# 3. 命中策略 (SUTANG_RESPONSE_CACHE):
+#      off   - 不使用缓存（默认）
+#      short - 只缓存规范化后不超过 SUTANG_RESPONSE_CACHE_MAX_INPUT 个字的短输入
+#      all   - 缓存所有输入
+# =================================================================================
+
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+POLICIES = ("off", "short", "all")
+
+
+def normalize_input(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZC")
+
+
+class ResponseCache:
+    def __init__(self, policy="off", max_entries=1024, ttl=600.0, max_input_chars=8, history_messages=2):
+        """
+        初始化 ResponseCache。
+
+        Args:
+            policy (str): 命中策略，off / short / all。
+            max_entries (int): 最多缓存的条目数。
+            ttl (float): 条目的有效期（秒）。
+            max_input_chars (int): short 策略下可缓存输入的最大长度（规范化之后）。
+            history_messages (int): 参与缓存键计算的最近对话条数。
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的回复缓存策略: {policy}（可选: {', '.join(POLICIES)}）")
+        self.policy = policy
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_input_chars = max_input_chars
+        self.history_messages = history_messages
+        self._entries = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0  # 按策略不参与缓存的输入
+
+    def make_key(self, scene, relationship_state, recent_history, user_input):
+        """
+        计算缓存键。按当前策略不应缓存时返回 None。
+
+        Args:
+            scene (str): 当前地点key。
+            relationship_state (str): 当前关系阶段。
+            recent_history (list): 本轮输入之前的对话消息，只取最后 history_messages 条。
+            user_input (str): 玩家输入。
+        """
+        if self.policy == "off":
+            return None
+        normalized = normalize_input(user_input)
+        if not normalized or (self.policy == "short" and len(normalized) > self.max_input_chars):
+            with self._lock:
+                self.skipped += 1
+            return None
+        digest = hashlib.sha1()
+        for msg in recent_history[-self.history_messages:] if self.history_messages else ():
+            digest.update(f"{msg['role']}\x1f{msg['content']}\x1e".encode("utf-8"))
+        return (scene, relationship_state, digest.hexdigest(), normalized)
+
+    def get(self, key):
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "policy": self.policy,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """取得进程内共享的 ResponseCache（第一次调用时按环境变量创建）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                policy=os.environ.get("SUTANG_RESPONSE_CACHE", "off"),
+                max_entries=int(os.environ.get("SUTANG_RESPONSE_CACHE_SIZE", 1024)),
+                ttl=float(os.environ.get("SUTANG_RESPONSE_CACHE_TTL", 600)),
+                max_input_chars=int(os.environ.get("SUTANG_RESPONSE_CACHE_MAX_INPUT", 8)),
+            )
+        return _cache
@@ -0,0 +1,284 @@
+# =================================================================================
+# Sqlite_Storage.py - 基于 SQLite 的存档引擎
+#
+# 1. saves 表每个槽位一行，常用的元数据（时间、好感度、关系、地点）是带索引的独立列，
+#    读档菜单只需一次索引查询，不必解析任何存档内容。
+# 2. 对话历史单独存放在 history 表中，每条消息一行；保存时只插入新增的消息。
+# 3. WAL 模式 + busy_timeout，多个 Web 进程可以同时安全地读写同一个数据库。
+#    进程内所有 Agent 共用一个实例（Game_Storage.get_storage），连接从一个小连接池中借用，用完归还。
+# 4. 旧的 JSON 存档可以用 tools/migrate_saves_to_sqlite.py 导入。
+# =================================================================================
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from Game_Storage import GameStorage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS saves (
+    owner TEXT NOT NULL DEFAULT '',
+    slot TEXT NOT NULL,
+    timestamp TEXT,
+    version TEXT,
+    closeness INTEGER,
+    relationship_state TEXT,
+    current_location TEXT,
+    history_count INTEGER NOT NULL DEFAULT 0,
+    state_json TEXT NOT NULL,
+    extra_json TEXT NOT NULL,
+    PRIMARY KEY (owner, slot)
+);
+CREATE INDEX IF NOT EXISTS idx_saves_timestamp ON saves (owner, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_saves_closeness ON saves (closeness);
+CREATE INDEX IF NOT EXISTS idx_saves_relationship ON saves (relationship_state);
+CREATE INDEX IF NOT EXISTS idx_saves_location ON saves (current_location);
+CREATE TABLE IF NOT EXISTS history (
+    owner TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (owner, slot, seq)
+) WITHOUT ROWID;
+"""
+
+# saves 表中有独立列的字段；其余字段整体存入 extra_json
+_SPLIT_KEYS = ("history", "state", "meta")
+
+
+class SqliteGameStorage(GameStorage):
+    MAX_IDLE_CONNECTIONS = 4  # 连接池中最多保留的空闲连接数，多出的用完即关闭
+
+    def __init__(self, save_dir="saves", db_name="saves.sqlite3", owner=""):
+        """
+        初始化 SqliteGameStorage 实例。
+
+        Args:
+            save_dir (str, optional): 数据库文件（以及旧版 JSON 存档）所在目录。默认为 "saves"。
+            db_name (str, optional): 数据库文件名。默认为 "saves.sqlite3"。
+            owner (str, optional): 默认的存档所有者（会话或用户ID），不同所有者的槽位互不干扰。
+        """
+        super().__init__(save_dir)
+        self.db_path = os.path.join(save_dir, db_name)
+        self.owner = owner
+        self._idle = []  # 空闲连接
+        self._idle_pid = os.getpid()
+        self._idle_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        """从连接池借一个连接，用完归还；fork 出的子进程不能沿用父进程的连接，进程号变了就丢弃旧的池"""
+        with self._idle_lock:
+            if self._idle_pid != os.getpid():
+                self._idle, self._idle_pid = [], os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            # WAL 模式记录在数据库文件里，只有第一次需要切换；多个进程同时切换会遇到 "database is locked"
+            if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+                for attempt in range(50):
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        break
+                    except sqlite3.OperationalError:
+                        if attempt == 49:
+                            raise
+                        time.sleep(0.1)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._idle_lock:
+                if self._idle_pid == os.getpid() and len(self._idle) < self.MAX_IDLE_CONNECTIONS:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def save_game(self, data, slot=1, owner=None):
+        """
+        将游戏数据保存到指定的存档槽位。历史消息只插入上次保存之后新增的部分。
+
+        Args:
+            data (dict): 需要保存的游戏数据。
+            slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者，默认使用实例的 owner。
+
+        Returns:
+            bool: 如果保存成功则返回 True，否则返回 False。
+        """
+        owner = self.owner if owner is None else owner
+        slot = str(slot)
+        data["meta"] = {
+            "timestamp": datetime.now().isoformat(),
+            "version": "3.0"
+        }
+        state = data.get("state", {})
+        if "date" in state and isinstance(state["date"], datetime):
+            state["date"] = state["date"].strftime("%Y-%m-%d")
+
+        history = data.get("history", [])
+        first_seq = (data.get("history_archive") or {}).get("count", 0)
+        total = first_seq + len(history)
+        extra = {k: v for k, v in data.items() if k not in _SPLIT_KEYS}
+
+        with self._connection() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT history_count FROM saves WHERE owner=? AND slot=?", (owner, slot)).fetchone()
+                start_seq = first_seq
+                if row and first_seq <= row[0] <= total:
+                    # 上次保存的最后一条消息没变，说明只是在后面追加了新消息
+                    last = conn.execute("SELECT role, content FROM history WHERE owner=? AND slot=? AND seq=?",
+                                        (owner, slot, row[0] - 1)).fetchone()
+                    if row[0] == first_seq or (last and row[0] - 1 >= first_seq and
+                                               tuple(last) == (history[row[0] - 1 - first_seq]["role"], history[row[0] - 1 - first_seq]["content"])):
+                        start_seq = row[0]
+                conn.execute("DELETE FROM history WHERE owner=? AND slot=? AND (seq < ? OR seq >= ?)",
+                             (owner, slot, first_seq, start_seq))
+                conn.executemany(
+                    "INSERT INTO history (owner, slot, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                    [(owner, slot, first_seq + i, msg["role"], msg["content"])
+                     for i, msg in enumerate(history[start_seq - first_seq:], start=start_seq - first_seq)])
+                conn.execute(
+                    "INSERT OR REPLACE INTO saves (owner, slot, timestamp, version, closeness, relationship_state, "
+                    "current_location, history_count, state_json, extra_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (owner, slot, data["meta"]["timestamp"], data["meta"]["version"], state.get("closeness"),
+                     state.get("relationship_state"), state.get("current_location"), total,
+                     json.dumps(state, ensure_ascii=False), json.dumps(extra, ensure_ascii=False)))
+                conn.execute("COMMIT")
+                return True
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                print(f"保存失败: {str(e)}")
+                return False
+
+    def load_game(self, slot=1, owner=None):
+        """
+        从指定的存档槽位加载游戏数据。数据库中没有该槽位时尝试读取旧版 JSON 存档。
+
+        Args:
+            slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            owner (str, optional): 存档所有者，默认使用实例的 owner。
+
+        Returns:
+            dict or None: 如果加载成功，则返回包含游戏数据的字典；
+                          如果存档不存在或加载失败，则返回 None。
+        """
+        owner = self.owner if owner is None else owner
+        try:
+            with self._connection() as conn:
+                row = conn.execute("SELECT timestamp, version, state_json, extra_json FROM saves WHERE owner=? AND slot=?",
+                                   (owner, str(slot))).fetchone()
+            if row is None:
+                return super().load_game(slot, owner or None)
+            data = json.loads(row[3])
+            data["state"] = json.loads(row[2])
+            data["meta"] = {"timestamp": row[0], "version": row[1]}
+            data["history"] = [{"role": role, "content": content} for role, content in self.iter_history(slot, owner=owner)]
+            return data
+        except Exception as e:
+            print(f"读取失败: {str(e)}")
+            return None
+
+    def iter_history(self, slot=1, offset=0, limit=-1, owner=None):
+        """
+        按顺序逐行读取某个槽位的历史消息，不必一次性载入全部内容。
+
+        Args:
+            slot (int or str, optional): 存档槽位的标识符。默认为 1。
+            offset (int, optional): 跳过的消息条数。
+            limit (int, optional): 最多读取的条数，-1 表示不限。
+            owner (str, optional): 存档所有者，默认使用实例的 owner。
+
+        Yields:
+            tuple: (role, content)
+        """
+        owner = self.owner if owner is None else owner
+        with self._connection() as conn:
+            yield from conn.execute(
+                "SELECT role, content FROM history WHERE owner=? AND slot=? ORDER BY seq LIMIT ? OFFSET ?",
+                (owner, str(slot), limit, offset))
+
+    def has_save(self, slot=1, owner=None):
+        owner = self.owner if owner is None else owner
+        with self._connection() as conn:
+            row = conn.execute("SELECT 1 FROM saves WHERE owner=? AND slot=?", (owner, str(slot))).fetchone()
+        return row is not None or super().has_save(slot, owner or None)
+
+    def save_version(self, slot=1, owner=None):
+        owner = self.owner if owner is None else owner
+        with self._connection() as conn:
+            row = conn.execute("SELECT timestamp FROM saves WHERE owner=? AND slot=?", (owner, str(slot))).fetchone()
+        return row[0] if row else super().save_version(slot, owner or None)
+
+    def list_saves(self, owner=None):
+        """
+        列出某个所有者的存档槽位名（按 owner 索引查询）。
+
+        Args:
+            owner (str, optional): 存档所有者，默认使用实例的 owner。
+
+        Returns:
+            list: 例如 ["save_1", "save_happy_ending"]。
+        """
+        return [f"save_{info['slot']}" for info in self.list_save_info(owner)]
+
+    def list_save_info(self, owner=None, limit=100, offset=0):
+        """
+        读档菜单用的存档列表，按保存时间从新到旧排序。只查询 saves 表的索引列。
+
+        Returns:
+            list: 每项包含 slot, timestamp, closeness, relationship_state, current_location, history_count。
+        """
+        owner = self.owner if owner is None else owner
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT slot, timestamp, closeness, relationship_state, current_location, history_count "
+                "FROM saves WHERE owner=? ORDER BY timestamp DESC LIMIT ? OFFSET ?", (owner, limit, offset)).fetchall()
+        keys = ("slot", "timestamp", "closeness", "relationship_state", "current_location", "history_count")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def referenced_archives(self, field):
+        """所有所有者的存档（以及目录中尚未导入的旧版 JSON 存档）中某个归档字段引用的文件名"""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT extra_json FROM saves").fetchall()
+        referenced = set()
+        for (extra,) in rows:
+            archive = json.loads(extra).get(field)
+            if archive and archive.get("id"):
+                referenced.add(archive["id"])
+        for name in GameStorage.list_saves(self):
+            archive = (GameStorage.load_game(self, name[len("save_"):-len(".json")]) or {}).get(field)
+            if archive and archive.get("id"):
+                referenced.add(archive["id"])
+        return referenced
+
+    def import_legacy_save(self, path, slot, owner=None):
+        """把一个旧版 JSON 存档文件导入数据库"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "history" not in data:
+            raise ValueError("存档格式错误")
+        self.import_save(data, slot, owner)
+
+    def import_save(self, data, slot, owner=None):
+        """导入其他存储读出的存档数据，保留原来的保存时间"""
+        timestamp = (data.get("meta") or {}).get("timestamp")
+        if not self.save_game(data, slot, owner):
+            raise RuntimeError(f"导入存档 {slot} 失败")
+        if timestamp:
+            owner = self.owner if owner is None else owner
+            with self._connection() as conn:
+                conn.execute("UPDATE saves SET timestamp=? WHERE owner=? AND slot=?", (timestamp, owner, str(slot)))
@@ -11,49 +11,102 @@
 import os
 import random
 import json
-import re
-from pathlib import Path
-import requests
+import time
 import traceback
-import yaml
-from collections import deque # 导入双端队列，用于BFS算法
 
-from Game_Storage import GameStorage
+from Dialogue_History import DialogueHistory
+from Event_Engine import get_event_engine
+from Fast_Path import classify_input, get_fast_path_router, get_speculative_runner
+from Game_State import GameState
+from Game_Storage import get_storage
+from LLM_Client import get_llm_client
+from Location_Matcher import get_location_matcher
+from Memory_Index import MemoryIndex
+from Memory_Summarizer import get_summary_queue
+from Metrics import get_metrics
+from Output_Parser import Analysis, AnalysisError, ResponseStreamParser, parse_llm_output
+from Prompt_Budget import get_prompt_budget
+from Prompt_Registry import PromptTemplateError, expect_fields, get_prompt_registry
+from Response_Cache import get_response_cache
+from Token_Counter import get_token_counter
+from Turn_Scheduler import DIALOGUE, SPECULATIVE, SUMMARY, get_turn_scheduler
+from World_Data import get_world
+
+ANALYSIS_PROMPT = "su_tang/analysis_prompt"
+SUMMARIZE_PROMPT = "su_tang/summarize_prompt"
+SUMMARIZE_BATCH_PROMPT = "su_tang/summarize_batch_prompt"
+ANALYSIS_PROMPT_FIELDS = (
+    "long_term_memories", "relationship_state", "closeness", "mood_today", "current_location_name",
+    "current_scene_description", "available_destinations", "last_topics", "conversation_history", "user_input",
+)
+
+expect_fields(ANALYSIS_PROMPT, ANALYSIS_PROMPT_FIELDS)
+expect_fields(SUMMARIZE_PROMPT, ("conversation_snippet",))
+expect_fields(SUMMARIZE_BATCH_PROMPT, ("conversation_snippets", "snippet_count"))
+
+MEMORY_TOP_K = int(os.environ.get("SUTANG_MEMORY_TOP_K", 5))  # 每轮最多放进Prompt的长期记忆条数
+HISTORY_WINDOW_SIZE = int(os.environ.get("SUTANG_HISTORY_WINDOW", 10))  # Prompt 中最多使用的最近对话条数
+RELATIONSHIP_THRESHOLDS = ((80, "亲密关系"), (60, "好朋友"), (40, "朋友"))  # 亲密度达到多少进入哪个关系阶段（从高到低）
+
 
 class GalGameAgent:
-    def __init__(self, load_slot=None, is_new_game=False):
-        self.storage = GameStorage()
-        self.locations = self._load_locations()
-        self.dialogue_history = []
-        self.game_state = {}
+    def __init__(self, load_slot=None, is_new_game=False, seed=None):
+        self.storage = get_storage()
+        self.rng = random.Random(seed)  # 随机事件、快速通道和备用回复共用；传入 seed 时结果可复现
+        self.world = get_world()  # 地点数据和导航索引，所有 Agent 共用同一份只读数据
+        self.HISTORY_WINDOW_SIZE = HISTORY_WINDOW_SIZE  # Prompt 中最多使用的最近对话条数（实际条数由token预算决定）
+        self.HISTORY_MEMORY_LIMIT = 60  # 内存中最多保留的消息条数，更早的写入归档
+        self.dialogue_history = self._new_history()
+        self.game_state = GameState()  # 带版本号，客户端只需取得自己确认过的版本之后的变化
         self.long_term_memory = [] 
+        self.memory_index = self._new_memory_index()
         self.dialogue_turns_since_last_summary = 0
         self.SUMMARY_TRIGGER_THRESHOLD = 6
+        self.summary_pending = False  # 是否有后台记忆总结尚未完成
+        self.summary_pending_since = 0.0  # 最早一个未完成的后台总结的提交时间 (time.monotonic)
+        self.fast_path_streak = 0  # 连续走本地快速通道的轮数
+        self._speculation = None  # 按玩家草稿提前发起的对话请求
+        self._prompt_assembly = None  # 最近一次正式发送的Prompt的组装结果（本地计算的token数和计数用的校准比例）
 
         if load_slot and self.load(load_slot):
             print(f"加载存档#{load_slot}成功")
         else:
             self._init_new_game(is_new_game)
 
-    def _load_locations(self):
-        try:
-            path = Path(__file__).resolve().parent / "config" / "locations.yaml"
-            with open(path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
-        except Exception as e:
-            print(f"[FATAL] Failed to load 'locations.yaml': {e}")
-            return {}
+    @property
+    def locations(self):
+        return self.world.locations
+
+    @property
+    def navigation(self):
+        return self.world.navigation
+
+    def _refresh_locations(self):
+        """locations.yaml 被修改后，下一次对话时换用新的地点数据和导航索引"""
+        self.world = get_world()
+
+    def _new_history(self, messages=(), archive=None) -> DialogueHistory:
+        """对话历史：内存里只保留最近的消息，更早的写入存档目录下的 history/ 归档"""
+        archive_dir = os.path.join(self.storage.save_dir, "history")
+        return DialogueHistory.restore(messages, archive, archive_dir,
+                                       window_size=self.HISTORY_WINDOW_SIZE, max_in_memory=self.HISTORY_MEMORY_LIMIT)
+
+    def _new_memory_index(self, archive=None) -> MemoryIndex:
+        """长期记忆的检索索引：向量写入存档目录下的 memory_index/"""
+        return MemoryIndex.restore(self.long_term_memory, archive, os.path.join(self.storage.save_dir, "memory_index"))
 
     def _init_new_game(self, is_new_game=False):
-        self.dialogue_history = []
+        self.dialogue_history = self._new_history()
         if not is_new_game:
             self.dialogue_history.append({"role": "system", "content": "（你第一次见到她，是在学校社团招新的活动上，她正在自己的烘焙社摊位前忙碌着。）"})
-        self.game_state = { "closeness": 30, "relationship_state": "初始阶段", "mood_today": "normal", "current_location": "main_building_f2_corridor", "last_topics": [], "boredom_level": 0 }
+        self.game_state.reset({ "closeness": 30, "relationship_state": "初始阶段", "mood_today": "normal", "current_location": "main_building_f2_corridor", "last_topics": [], "boredom_level": 0 })
         self.long_term_memory = []
+        self.memory_index = self._new_memory_index()
         self.dialogue_turns_since_last_summary = 0
 
     def chat(self, user_input: str):
         print(f"\n{'#'*20} NEW CHAT REQUEST {'#'*20}\nUser Input: {user_input}")
+        self._refresh_locations()
 
         # --- 步骤1: 检查是否为特殊指令 ---
         if user_input.startswith("/debug goto "):
@@ -61,68 +114,219 @@ class GalGameAgent:
             return self._process_movement_action(location_key, is_debug_warp=True)
 
         # --- 步骤2: 检查是否为移动意图 ---
-        move_keywords = ["去", "到", "前往", "移动"]
-        if any(keyword in user_input for keyword in move_keywords):
-            for key, loc_data in self.locations.items():
-                if loc_data.get('name') in user_input:
-                    return self._process_movement_action(key)
+        with get_metrics().span("intent"):
+            target_key = self._detect_movement_target(user_input)
+        if target_key:
+            with get_metrics().span("movement"):
+                return self._process_movement_action(target_key)
+
+        # --- 步骤3: 打招呼、“嗯”之类的短句走本地快速通道 ---
+        reply = self._fast_path_reply(user_input)
+        if reply is not None:
+            return reply
 
-        # --- 步骤3: 正常对话流程 ---
+        # --- 步骤4: 正常对话流程 ---
         return self._handle_standard_dialogue(user_input)
 
+    def chat_stream(self, user_input: str):
+        """
+        chat 的流式版本。逐个产出 (事件, 文本) 元组：
+        ("token", 片段) 表示回复的一部分；最后一个总是 ("done", 完整回复)，此时游戏状态已更新完毕。
+        """
+        print(f"\n{'#'*20} NEW STREAM CHAT REQUEST {'#'*20}\nUser Input: {user_input}")
+        self._refresh_locations()
+
+        # 特殊指令和移动意图在本地就能完成，直接给出完整结果
+        if user_input.startswith("/debug goto "):
+            location_key = user_input.split("/debug goto ")[1].strip()
+            yield ("done", self._process_movement_action(location_key, is_debug_warp=True))
+            return
+
+        with get_metrics().span("intent"):
+            target_key = self._detect_movement_target(user_input)
+        if target_key:
+            with get_metrics().span("movement"):
+                reply = self._process_movement_action(target_key)
+            yield ("done", reply)
+            return
+
+        reply = self._fast_path_reply(user_input)
+        if reply is not None:
+            yield ("done", reply)
+            return
+
+        yield from self._handle_standard_dialogue_stream(user_input)
+
+    def _detect_movement_target(self, user_input: str):
+        """输入包含移动关键词时，返回其中提到的最具体的地点key；不是移动意图时返回 None"""
+        move_keywords = ["去", "到", "前往", "移动"]
+        if not any(keyword in user_input for keyword in move_keywords):
+            return None
+        return get_location_matcher(self.locations).best_match(user_input)
+
+    def _fast_path_reply(self, user_input: str):
+        """能在本地回复的短句直接从回复库取一句，不调用LLM；需要LLM时返回 None"""
+        router = get_fast_path_router()
+        if not router.enabled:
+            return None
+        start = time.perf_counter()
+        location_name = self.locations.get(self.game_state.get("current_location"), {}).get("name", "这里")
+        window = self.dialogue_history.prompt_window()
+        last_reply = window[-1]["content"] if window and window[-1]["role"] == "assistant" else None
+        reply = router.route(user_input, self.game_state, location_name, last_reply, self.fast_path_streak, self.rng)
+        if reply is None:
+            self.fast_path_streak = 0
+            return None
+        print("[INFO] Handled by local fast path.")
+        self.dialogue_history.append({"role": "user", "content": user_input})
+        self._apply_llm_output({"analysis": None, "response": reply})
+        self.fast_path_streak += 1
+        elapsed = time.perf_counter() - start
+        get_metrics().observe("fast_path", elapsed)
+        router.record_saved(elapsed)
+        return reply
+
+    def speculate(self, draft: str) -> bool:
+        """
+        玩家还在输入时，按草稿提前发起对话请求（排在玩家正在等待的对话之后）。正式发送后生成的Prompt与草稿的完全一致时才会用上。
+        同一会话同时最多一个预测性请求：上一个还在进行时跳过新的草稿。
+
+        Returns:
+            bool: 是否有对应这份草稿的预测性请求在进行。
+        """
+        runner = get_speculative_runner()
+        if not runner.accepts(draft) or draft.startswith("/debug") or self._detect_movement_target(draft):
+            return False
+        if get_fast_path_router().enabled and classify_input(draft) is not None:
+            return False  # 大概率由快速通道回复，不值得提前请求
+        history = (self.dialogue_history.prompt_window() + [{"role": "user", "content": draft}])[-self.HISTORY_WINDOW_SIZE:]
+        ratio = self._speculation.token_ratio if self._speculation is not None else None
+        prompt, assembly = self._assemble_prompt(draft, history, ratio)  # 草稿的Prompt不计入预算统计
+        if self._speculation is not None and self._speculation.prompt == prompt:
+            return True
+        speculation = runner.start(id(self), prompt, lambda: self._request_completion(prompt, SPECULATIVE), assembly.ratio)
+        if speculation is None:
+            return False  # 上一个预测性请求还在进行，保留它
+        if self._speculation is not None:
+            runner.discard(self._speculation)  # 已经结束、但与新草稿不一致的结果
+        self._speculation = speculation
+        return True
+
+    def _take_speculation(self, filled_prompt: str):
+        """取出与本轮Prompt一致的预测性请求（Future）；没有或不一致时返回 None"""
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return None
+        runner = get_speculative_runner()
+        if speculation.prompt != filled_prompt or (speculation.future.done() and speculation.future.exception()):
+            runner.discard(speculation)
+            return None
+        print("[INFO] Using speculative request started from the draft.")
+        get_turn_scheduler().promote(id(self))  # 还在排队的话，玩家已经在等它了
+        return runner.claim(speculation)
+
     def _handle_standard_dialogue(self, user_input: str):
         """处理所有非移动的、标准的对话交互"""
         print("[INFO] Handling as standard dialogue.")
         self.dialogue_history.append({"role": "user", "content": user_input})
         
         llm_output = self.think_and_chat(user_input)
-        
+        with get_metrics().span("state_update"):
+            return self._apply_llm_output(llm_output)
+
+    def _handle_standard_dialogue_stream(self, user_input: str):
+        """_handle_standard_dialogue 的流式版本：<response> 里的文字一生成就转发出去"""
+        print("[INFO] Handling as streaming dialogue.")
+        self.dialogue_history.append({"role": "user", "content": user_input})
+
+        cache_key = self._response_cache_key(user_input)
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            llm_output = self._parse_llm_output(cached)
+            yield ("token", llm_output["response"])
+            yield ("done", self._apply_llm_output(llm_output))
+            return
+
+        metrics = get_metrics()
+        try:
+            with metrics.span("prompt_build"):
+                filled_prompt = self._build_prompt(user_input)
+            speculative = self._take_speculation(filled_prompt)
+            if speculative is not None:
+                # 草稿阶段已经提前请求过了：等它完成，一次性转发回复
+                raw_output = self._complete(filled_prompt, speculative)
+                with metrics.span("parse"):
+                    llm_output = self._parse_llm_output(raw_output)
+                self._cache_response(cache_key, raw_output, llm_output)
+                yield ("token", llm_output["response"])
+            else:
+                llm_output = yield from self._stream_llm_output(filled_prompt, cache_key)
+        except Exception as e:
+            print(f"!!! STREAMING API CALL FAILED: {e} !!!")
+            llm_output = {"analysis": None, "response": self._get_backup_reply(), "error": str(e)}
+
+        with metrics.span("state_update"):
+            reply = self._apply_llm_output(llm_output)
+        yield ("done", reply)
+
+    def _stream_llm_output(self, filled_prompt: str, cache_key):
+        """流式调用LLM并逐段产出 ("token", 片段)，结束后返回解析结果"""
+        metrics = get_metrics()
+        parser = ResponseStreamParser()
+        response_parts = []
+        with get_turn_scheduler().slot(id(self), DIALOGUE):
+            start = time.perf_counter()
+            first_token = True
+            for chunk in self._stream_completion(filled_prompt):
+                if first_token:
+                    metrics.observe("llm_first_token", time.perf_counter() - start)
+                    first_token = False
+                text = parser.feed(chunk)
+                if text:
+                    response_parts.append(text)
+                    yield ("token", text)
+            metrics.observe("llm_stream", time.perf_counter() - start)
+        text = parser.close()
+        if text:
+            response_parts.append(text)
+            yield ("token", text)
+        # 回复已经在流式过程中切分好了，这里只需解码分析JSON
+        with metrics.span("parse"):
+            llm_output = self._decode_llm_output(parser.analysis_text, "".join(response_parts).strip())
+        self._cache_response(cache_key, parser.text, llm_output)
+        return llm_output
+
+    def _apply_llm_output(self, llm_output: dict) -> str:
+        """根据LLM的分析结果更新状态，并把回复记入对话历史"""
         ai_response = llm_output.get("response", self._get_backup_reply())
         analysis = llm_output.get("analysis")
 
-        if analysis and "error" not in analysis:
-            self._update_closeness(analysis.get('affection_delta', 0))
+        if analysis is not None:
+            self._update_closeness(analysis.affection_delta)
             # ... 其他状态更新 ...
             
             # 检查AI的移动提议
-            suggested_action = analysis.get("suggested_action")
-            if isinstance(suggested_action, dict) and suggested_action.get("type") == "propose_location_change":
+            suggested_action = analysis.suggested_action
+            if suggested_action is not None and suggested_action.type == "propose_location_change":
                 print(f"[AI ACTION] AI proposed to move. Response incorporates this.")
         
         self.dialogue_history.append({"role": "assistant", "content": ai_response})
         
-        # 记忆生成逻辑 (保持不变)
+        # 记忆生成逻辑：把触发时刻的对话快照交给后台总结，不阻塞本轮回复
         self.dialogue_turns_since_last_summary += 2
         if self.dialogue_turns_since_last_summary >= self.SUMMARY_TRIGGER_THRESHOLD:
-            # ...
+            snapshot = self.dialogue_history.recent_dialogue(self.dialogue_turns_since_last_summary)
+            get_summary_queue().submit(self, snapshot)
             self.dialogue_turns_since_last_summary = 0
 
         return ai_response
 
     def _find_path(self, start_key: str, end_key: str) -> list:
-        """使用BFS算法查找两个地点之间的最短路径"""
-        if start_key not in self.locations or end_key not in self.locations:
-            return None
-        
-        queue = deque([(start_key, [start_key])])
-        visited = {start_key}
-        
-        while queue:
-            current_key, path = queue.popleft()
-            
-            if current_key == end_key:
-                return path
-            
-            for neighbor_key in self.locations[current_key].get("connections", []):
-                if neighbor_key not in visited:
-                    visited.add(neighbor_key)
-                    new_path = list(path)
-                    new_path.append(neighbor_key)
-                    queue.append((neighbor_key, new_path))
-        return None # 找不到路径
+        """查找两个地点之间的最短路径（使用预先建立的导航索引）"""
+        return self.navigation.find_path(start_key, end_key)
 
     def _process_movement_action(self, target_key: str, is_debug_warp=False) -> str:
-        """使用路径查找来处理移动，并为随机事件预留框架"""
+        """使用路径查找来处理移动，途中的中间地点可能触发随机事件（见 Event_Engine）"""
         current_key = self.game_state['current_location']
         
         if current_key == target_key:
@@ -144,16 +348,12 @@ class GalGameAgent:
         # 构建移动过程的系统消息
         path_names = [self.locations[key]['name'] for key in path]
         
-        # 处理路径中的随机事件
+        # 处理路径中的随机事件：只在中间点（不包括起点和终点）检查，事件定义在 config/events.yaml
         event_messages = []
-        # 我们只在中间点（不包括起点和终点）检查事件
-        for i in range(1, len(path) - 1):
-            waypoint_key = path[i]
-            waypoint_name = path_names[i]
-            if random.random() < 0.1: # 10%的概率触发事件
-                event_message = f"在前往{final_destination_name}的路上，你们路过{waypoint_name}时，似乎发生了什么... (事件系统待实现)"
-                event_messages.append(event_message)
-                print(f"[EVENT] Random event triggered at {waypoint_key}")
+        for waypoint_key, event in get_event_engine().walk(self.rng, path[1:-1], self.game_state):
+            event_messages.append(event.render(self.locations[waypoint_key]['name'], final_destination_name))
+            self._update_closeness(event.effects.get("closeness", 0))
+            print(f"[EVENT] Random event '{event.id}' triggered at {waypoint_key}")
         
         # 组装最终的系统消息
         if len(path) == 2: # 直达
@@ -170,103 +370,219 @@ class GalGameAgent:
 
     def think_and_chat(self, user_input: str) -> dict:
         # 这个方法现在只负责构建Prompt和调用API，不再处理任何游戏逻辑
-        # 这是一个绝对不会再产生KeyError的实现
-        
-        # 1. 准备动态数据
+        cache_key = self._response_cache_key(user_input)
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            return self._parse_llm_output(cached)
+
+        metrics = get_metrics()
+        try:
+            with metrics.span("prompt_build"):
+                filled_prompt = self._build_prompt(user_input)
+        except Exception as e:
+            print(f"!!! PROMPT FORMATTING FAILED: {e} !!!")
+            return {"analysis": None, "response": self._get_backup_reply(), "error": str(e)}
+
+        try:
+            llm_output = self._complete(filled_prompt, self._take_speculation(filled_prompt))
+            with metrics.span("parse"):
+                parsed = self._parse_llm_output(llm_output)
+            self._cache_response(cache_key, llm_output, parsed)
+            return parsed
+        except Exception as e:
+            print(f"!!! API CALL FAILED: {e} !!!")
+            return {"analysis": None, "response": self._get_backup_reply(), "error": str(e)}
+
+    def _complete(self, filled_prompt: str, speculative=None) -> str:
+        """取得对话请求生成的文本：有可用的预测性请求时等它完成，否则现在发起"""
+        if speculative is not None:
+            result = speculative.result(timeout=45)
+        else:
+            result = self._request_completion(filled_prompt)
+        self._on_usage(result.get("usage") or {}, get_metrics().current_turn())
+        return result["choices"][0]["message"]["content"]
+
+    def _on_usage(self, usage: dict, trace=None):
+        """API返回用量时：记入本轮追踪，用实际的 prompt_tokens 校准本地计数（开启 SUTANG_LOG_TOKENS 时写日志）"""
+        if trace is not None:
+            trace.add_usage(usage)
+        if not usage:
+            return
+        assembly = self._prompt_assembly
+        counted = assembly.total if assembly is not None else 0
+        if get_prompt_budget().log:
+            print(f"[TOKENS] actual prompt {usage.get('prompt_tokens')} (counted ~{counted}), "
+                  f"completion {usage.get('completion_tokens')}")
+        if assembly is not None:
+            get_token_counter().calibrate(counted, usage.get("prompt_tokens") or 0, assembly.ratio)
+
+    def _request_completion(self, filled_prompt: str, priority=DIALOGUE) -> dict:
+        with get_turn_scheduler().slot(id(self), priority), get_metrics().span("llm_request"):
+            return get_llm_client().complete(self._dialogue_request_body(filled_prompt), timeout=45)
+
+    def _response_cache_key(self, user_input: str):
+        """本轮对话的回复缓存键；当前策略不缓存该输入时为 None"""
+        recent = self.dialogue_history.prompt_window()
+        if recent and recent[-1] == {"role": "user", "content": user_input}:
+            recent = recent[:-1]  # 本轮输入已经写入历史，不参与哈希
+        return get_response_cache().make_key(self.game_state.get("current_location"),
+                                             self.game_state.get("relationship_state"), recent, user_input)
+
+    def _cache_response(self, cache_key, raw_output: str, parsed: dict):
+        """只缓存分析JSON解析成功的输出"""
+        if cache_key is not None and parsed.get("analysis") is not None:
+            get_response_cache().put(cache_key, raw_output)
+
+    def _stream_completion(self, filled_prompt: str):
+        """以 stream=True 调用API，逐段产出模型生成的原始文本"""
+        trace = get_metrics().current_turn()  # usage 回调在后台事件循环线程中执行，这里先取出本轮的追踪
+        return get_llm_client().stream(self._dialogue_request_body(filled_prompt), timeout=45,
+                                       on_usage=lambda usage: self._on_usage(usage, trace))
+
+    def _dialogue_request_body(self, filled_prompt: str) -> dict:
+        return {"model": "deepseek-chat", "messages": [{"role": "user", "content": filled_prompt}], "temperature": 0.8,
+                "max_tokens": get_prompt_budget().completion_tokens}
+
+    def _build_prompt(self, user_input: str) -> str:
+        """
+        组装本轮正式发送的Prompt，并记录组装结果（预算统计、日志、本轮追踪，以及之后校准用的本地token数）。
+        有草稿阶段的预测性请求时按它的校准比例组装，输入相同时得到逐字节相同的Prompt。
+        """
+        ratio = self._speculation.token_ratio if self._speculation is not None else None
+        filled_prompt, assembly = self._assemble_prompt(user_input, ratio=ratio)
+        get_prompt_budget().record(assembly)
+        self._prompt_assembly = assembly
+        trace = get_metrics().current_turn()
+        if trace is not None:
+            trace.tokens["prompt_tokens_counted"] = trace.tokens.get("prompt_tokens_counted", 0) + assembly.total
+        return filled_prompt
+
+    def _assemble_prompt(self, user_input: str, history=None, ratio=None):
+        """
+        准备动态数据，按token预算依优先级分配给各部分，填充对话Prompt模板。不记录任何统计。
+
+        Args:
+            user_input (str): 玩家输入（或草稿）。
+            history (list, optional): 对话窗口，None 时使用当前的对话窗口。
+            ratio (float, optional): token计数的校准比例，省略时取当前的比例。
+
+        Returns:
+            tuple: (Prompt文本, PromptAssembly)
+        """
+        budget = get_prompt_budget()
+        assembly = budget.start(ratio)
+        # 1. 人设与规则、关系状态、玩家输入：必须完整保留
         current_location_key = self.game_state.get("current_location")
         location_info = self.locations.get(current_location_key, {})
-        available_destinations = [f"'{self.locations[key]['name']}' ({key})" for key in location_info.get("connections", []) if key in self.locations]
-        
-        # 2. 创建一个字典来存放所有要格式化的值
+        available_destinations = [f"'{self.locations[key]['name']}' ({key})" for key in self.navigation.neighbors(current_location_key)]
+        assembly.add("template", get_prompt_registry().get(ANALYSIS_PROMPT).literal_text)
         format_dict = {
-            "long_term_memories": "\n".join([f"- {mem}" for mem in self.long_term_memory]) if self.long_term_memory else "无",
             "relationship_state": self.game_state.get("relationship_state", "初始阶段"),
             "closeness": self.game_state.get("closeness", 30),
             "mood_today": self.game_state.get("mood_today", "normal"),
             "current_location_name": location_info.get("name", "未知地点"),
-            "current_scene_description": location_info.get("description_for_llm", "未知"),
             "available_destinations": ", ".join(available_destinations) or "无",
             "last_topics": ", ".join(self.game_state.get("last_topics", [])) or "无",
-            "conversation_history": self._format_history_for_prompt(),
-            "user_input": user_input
+            "user_input": user_input,
         }
-        
-        # 3. 读取模板并安全地替换
-        try:
-            prompt_path = Path(__file__).resolve().parent / "prompts" / "su_tang" / "analysis_prompt.txt" # 使用一个新的、干净的模板
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                filled_prompt = f.read().format(**format_dict)
-        except Exception as e:
-            print(f"!!! PROMPT FORMATTING FAILED: {e} !!!")
-            return {"analysis": None, "response": self._get_backup_reply(), "error": str(e)}
+        for value in format_dict.values():
+            assembly.add("state", value)
 
-        # 4. 调用API (保持不变)
-        try:
-            api_key = os.environ.get("DEEPSEEK_API_KEY")
-            if not api_key: raise ValueError("API密钥未设置或无效")
-            messages = [{"role": "user", "content": filled_prompt}]
-            # ... (rest of the API call)
-            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
-            data = {"model": "deepseek-chat", "messages": messages, "temperature": 0.8, "max_tokens": 1500}
-            response = requests.post("https://api.deepseek.com/v1/chat/completions", headers=headers, json=data, timeout=45)
-            if response.status_code != 200: raise Exception(f"API Error {response.status_code}: {response.text}")
-            llm_output = response.json()["choices"][0]["message"]["content"]
-            return self._parse_llm_output(llm_output)
-        except Exception as e:
-            print(f"!!! API CALL FAILED: {e} !!!")
-            return {"analysis": None, "response": self._get_backup_reply(), "error": str(e)}
+        # 2. 场景描述、长期记忆、对话历史：按优先级依次领取剩余预算，放不下的先截短或省略
+        format_dict["current_scene_description"] = assembly.fit("scene", location_info.get("description_for_llm", "未知"))
+        format_dict["long_term_memories"] = assembly.add(
+            "memories", self._recall_memories(user_input, format_dict["current_location_name"],
+                                              assembly.available(budget.memory_tokens), assembly.count))
+        format_dict["conversation_history"] = self._format_history_for_prompt(history, assembly)
+
+        # 3. 用预编译的模板替换
+        return get_prompt_registry().render(ANALYSIS_PROMPT, format_dict), assembly
+
+    def _recall_memories(self, user_input: str, location_name: str, token_budget: int, count_tokens=None) -> str:
+        """从长期记忆中取出与本轮输入和当前地点最相关的几条，格式化为Prompt中的列表"""
+        with get_metrics().span("memory_recall"):
+            memories = self.memory_index.search(self.long_term_memory, f"{user_input} {location_name}",
+                                                top_k=MEMORY_TOP_K, token_budget=token_budget, count_tokens=count_tokens)
+        return "\n".join(f"- {mem}" for mem in memories) if memories else "无"
 
     # ... 其他所有辅助方法保持不变 ...
     def _generate_memory_summary(self, conversation_snippet: str) -> str:
         # ... no change ...
         print("\n" + "-"*15 + " GENERATING LONG-TERM MEMORY " + "-"*15)
         try:
-            prompt_path = Path(__file__).resolve().parent / "prompts" / "su_tang" / "summarize_prompt.txt"
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                prompt_template = f.read()
-        except FileNotFoundError:
-            print(f"错误: 记忆总结Prompt模板在路径 '{prompt_path}' 未找到！")
+            filled_prompt = get_prompt_registry().render(SUMMARIZE_PROMPT, {"conversation_snippet": conversation_snippet})
+        except PromptTemplateError as e:
+            print(f"错误: 记忆总结Prompt模板不可用: {e}")
             return ""
-        filled_prompt = prompt_template.format(conversation_snippet=conversation_snippet)
         try:
-            api_key = os.environ.get("DEEPSEEK_API_KEY")
-            if not api_key: raise ValueError("API密钥未设置")
             messages = [{"role": "user", "content": filled_prompt}]
-            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
             data = {"model": "deepseek-chat", "messages": messages, "temperature": 0.2, "max_tokens": 200}
-            response = requests.post("https://api.deepseek.com/v1/chat/completions", headers=headers, json=data, timeout=30)
-            if response.status_code != 200: raise Exception(f"API Error {response.status_code}: {response.text}")
-            summary = response.json()["choices"][0]["message"]["content"].strip()
+            with get_turn_scheduler().slot(id(self), SUMMARY):
+                result = get_llm_client().complete(data, timeout=30)
+            summary = result["choices"][0]["message"]["content"].strip()
             print(f"New Memory Generated: '{summary}'")
             print("-"*59 + "\n")
             return summary
         except Exception as e:
             print(f"生成记忆时发生异常: {e}"); return ""
 
-    def _parse_llm_output(self, llm_output: str) -> dict:
-        # ... no change ...
-        analysis_json, response_text = None, self._get_backup_reply()
+    def _generate_memory_summaries(self, conversation_snippets: list):
+        """
+        在一次调用中总结多段对话（来自不同玩家），用于记忆总结的微批处理。
+
+        Returns:
+            list or None: 与输入顺序一致的总结列表；调用或解析失败时返回 None，由调用方逐段重试。
+        """
+        snippets = "\n\n".join(f"## Conversation {i + 1}\n{snippet}" for i, snippet in enumerate(conversation_snippets))
         try:
-            analysis_match = re.search(r'<analysis>(.*?)</analysis>', llm_output, re.DOTALL)
-            if analysis_match:
-                json_str = analysis_match.group(1).strip()
-                json_match = re.search(r'\{.*\}', json_str, re.DOTALL)
-                if json_match: analysis_json = json.loads(json_match.group(0))
-                else: analysis_json = {"error": "在<analysis>标签内未找到有效的JSON结构。"}
-            response_match = re.search(r'<response>(.*?)</response>', llm_output, re.DOTALL)
-            if response_match: response_text = response_match.group(1).strip()
-            elif analysis_match: response_text = llm_output.split("</analysis>")[-1].strip()
+            filled_prompt = get_prompt_registry().render(
+                SUMMARIZE_BATCH_PROMPT, {"conversation_snippets": snippets, "snippet_count": len(conversation_snippets)})
+            messages = [{"role": "user", "content": filled_prompt}]
+            data = {"model": "deepseek-chat", "messages": messages, "temperature": 0.2,
+                    "max_tokens": 200 * len(conversation_snippets)}
+            with get_turn_scheduler().slot(id(self), SUMMARY):
+                result = get_llm_client().complete(data, timeout=60)
+            content = result["choices"][0]["message"]["content"]
+            summaries = json.loads(content[content.index("["):content.rindex("]") + 1])
         except Exception as e:
-            analysis_json = {"error": f"解析LLM输出时发生未知错误: {e}"}
-        return {"analysis": analysis_json, "response": re.sub(r'</?response>', '', response_text).strip()}
+            print(f"批量生成记忆失败，改为逐段生成: {e}")
+            return None
+        if not isinstance(summaries, list) or len(summaries) != len(conversation_snippets) \
+                or not all(isinstance(summary, str) for summary in summaries):
+            print("批量生成记忆的结果与输入数量不符，改为逐段生成")
+            return None
+        return [summary.strip() for summary in summaries]
 
-    def _format_history_for_prompt(self, custom_history=None) -> str:
-        # ... no change ...
-        history_to_format = custom_history if custom_history is not None else self.dialogue_history
-        dialogue_only = [msg for msg in history_to_format if msg["role"] in ["user", "assistant"]]
-        if not custom_history: dialogue_only = dialogue_only[-10:]
-        if not dialogue_only: return "（你们还没有开始对话）"
+    def _parse_llm_output(self, llm_output: str) -> dict:
+        """一遍扫描切分出分析与回复，再解码分析JSON"""
+        analysis_text, response_text = parse_llm_output(llm_output)
+        return self._decode_llm_output(analysis_text, response_text)
+
+    def _decode_llm_output(self, analysis_text, response_text: str) -> dict:
+        """分析部分解码为 Analysis；缺失或不合法时 analysis 为 None，原因记在 analysis_error 中"""
+        result = {"analysis": None, "response": response_text or self._get_backup_reply()}
+        if analysis_text is None:
+            result["analysis_error"] = "输出中没有完整的<analysis>标签。"
+            return result
+        try:
+            result["analysis"] = Analysis.decode(analysis_text)
+        except AnalysisError as e:
+            print(f"[WARN] 分析JSON无效: {e}")
+            result["analysis_error"] = str(e)
+        return result
+
+    def _format_history_for_prompt(self, custom_history=None, assembly=None) -> str:
+        """格式化对话历史。传入 assembly 时只保留预算内放得下的最近几条"""
+        if custom_history is not None:
+            dialogue_only = [msg for msg in custom_history if msg["role"] in ["user", "assistant"]]
+        else:
+            dialogue_only = self.dialogue_history.prompt_window()  # 最近的对话窗口，O(window)
+        if not dialogue_only:
+            text = "（你们还没有开始对话）"
+            return assembly.add("history", text) if assembly is not None else text
         lines = [f"陈辰: {e['content']}" if e['role'] == 'user' else f"苏糖: {e['content']}" for e in dialogue_only]
+        if assembly is not None:
+            lines = assembly.fit_lines("history", lines, omitted_line="（更早的对话从略）")
         return "\n".join(lines)
 
     def _update_closeness(self, delta: int):
@@ -279,29 +595,40 @@ class GalGameAgent:
             self._update_relationship_state()
 
     def _update_relationship_state(self):
-        # ... no change ...
         closeness = self.game_state.get("closeness", 30)
-        if closeness >= 80: self.game_state["relationship_state"] = "亲密关系"
-        elif closeness >= 60: self.game_state["relationship_state"] = "好朋友"
-        elif closeness >= 40: self.game_state["relationship_state"] = "朋友"
-        else: self.game_state["relationship_state"] = "初始阶段"
+        self.game_state["relationship_state"] = next(
+            (state for threshold, state in RELATIONSHIP_THRESHOLDS if closeness >= threshold), "初始阶段")
     
-    def save(self, slot):
-        # ... no change ...
-        data = { "history": self.dialogue_history, "state": self.game_state, "long_term_memory": self.long_term_memory, "dialogue_turns_since_last_summary": self.dialogue_turns_since_last_summary }
-        return self.storage.save_game(data, slot)
+    def export_state(self) -> dict:
+        """导出可持久化的完整状态（存档与会话换出共用同一格式）"""
+        history, history_archive = self.dialogue_history.export()
+        memory_index = self.memory_index.export(self.long_term_memory)
+        return { "history": history, "history_archive": history_archive, "state": self.game_state, "state_version": self.game_state.commit(), "long_term_memory": self.long_term_memory, "memory_index": memory_index, "dialogue_turns_since_last_summary": self.dialogue_turns_since_last_summary }
+
+    def import_state(self, data: dict, resume=True):
+        """从 export_state 导出的数据恢复状态。resume=False（读档）时状态版本开始新的时间线，客户端会重新取得整个状态"""
+        self.dialogue_history = self._new_history(data.get("history", []), data.get("history_archive"))
+        self.game_state.reset(data.get("state", {}), data.get("state_version") if resume else None)
+        self.long_term_memory = data.get("long_term_memory", [])
+        self.memory_index = self._new_memory_index(data.get("memory_index"))
+        self.dialogue_turns_since_last_summary = data.get("dialogue_turns_since_last_summary", 0)
+
+    def save(self, slot, owner=None):
+        """存档到槽位 slot。owner 为存档所有者（会话ID），不同所有者的同名槽位互不干扰"""
+        with get_metrics().span("save"):
+            return self.storage.save_game(self.export_state(), slot, owner)
     
-    def load(self, slot):
-        # ... no change ...
-        data = self.storage.load_game(slot)
+    def load(self, slot, owner=None):
+        data = self.storage.load_game(slot, owner)
         if data:
-            self.dialogue_history = data.get("history", [])
-            self.game_state = data.get("state", {})
-            self.long_term_memory = data.get("long_term_memory", [])
-            self.dialogue_turns_since_last_summary = data.get("dialogue_turns_since_last_summary", 0)
+            self.import_state(data, resume=False)
             return True
         return False
 
+    def get_history_page(self, offset: int, limit: int = 50) -> dict:
+        """玩家往回翻看时按需读取历史（包括已归档到磁盘的部分）"""
+        return {"total": len(self.dialogue_history), "offset": offset, "messages": self.dialogue_history.page(offset, limit)}
+
     def _get_backup_reply(self):
         # ... no change ...
-        return random.choice(["嗯...让我想想。", "（有点走神了，不好意思...）", "那个...你刚才说什么？"])
\ No newline at end of file
+        return self.rng.choice(["嗯...让我想想。", "（有点走神了，不好意思...）", "那个...你刚才说什么？"])
\ No newline at end of file
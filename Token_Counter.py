@@ -0,0 +1,108 @@
+# =================================================================================
+# Token_Counter.py - 本地token计数
+#
+# 1. 有模型的 tokenizer.json（DeepSeek 在其开源仓库中提供）时用真实的分词器精确计数：
+#    默认读取 config/tokenizer.json，也可以用 SUTANG_TOKENIZER_FILE 指定其他路径；tokenizers 包见 requirements.txt。
+# 2. 找不到分词器文件时退回估算（启动时日志会说明，/api/stats 的 token_counter.exact 为 false）：
+#    按 DeepSeek 文档给出的经验比例，一个汉字约 0.6 个token，一个英文字符约 0.3 个token。
+# 3. 每次API返回 usage 时，用实际的 prompt_tokens 校准估算值（指数滑动平均），
+#    这样即使没有分词器文件，估算也会越来越接近服务商的计费。校准比例是进程内共享的，
+#    一次Prompt组装在开始时取下当时的比例，之后都按它计数（见 Prompt_Budget.PromptAssembly）。
+# 4. 同样的文本（人设模板、长期记忆、历史消息）每轮都会重复计数，结果按文本缓存。
+# =================================================================================
+
+import os
+import threading
+from functools import lru_cache
+
+DEFAULT_TOKENIZER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "tokenizer.json")
+CJK_TOKENS = 0.6
+OTHER_TOKENS = 0.3
+
+
+def _is_cjk(ch):
+    return "一" <= ch <= "鿿" or "　" <= ch <= "〿" or "＀" <= ch <= "￯"
+
+
+class TokenCounter:
+    def __init__(self, tokenizer_file=None, cache_size=8192, calibration_weight=0.1):
+        """
+        初始化 TokenCounter。
+
+        Args:
+            tokenizer_file (str, optional): tokenizer.json 的路径；为 None 或无法加载时使用估算。
+            cache_size (int): 按文本缓存计数结果的条目数。
+            calibration_weight (float): 每次校准时新观测值的权重。
+        """
+        self.calibration_weight = calibration_weight
+        self.ratio = 1.0  # 实际token数 / 本地计数，由 calibrate() 更新
+        self.calibrations = 0
+        self._lock = threading.Lock()
+        self._tokenizer = self._load_tokenizer(tokenizer_file) if tokenizer_file else None
+        self.exact = self._tokenizer is not None
+        self._raw_count = lru_cache(maxsize=cache_size)(self._count_exact if self.exact else self._estimate)
+
+    @staticmethod
+    def _load_tokenizer(path):
+        if not os.path.exists(path):
+            print(f"[TOKENS] 未找到分词器文件 '{path}'，改用估算的token数（按API返回的用量校准）。")
+            return None
+        try:
+            from tokenizers import Tokenizer
+            return Tokenizer.from_file(path)
+        except ImportError:
+            print("[TOKENS] 未安装 tokenizers 包，改用估算的token数。")
+        except Exception as e:
+            print(f"[TOKENS] 加载分词器 '{path}' 失败，改用估算的token数: {e}")
+        return None
+
+    def _count_exact(self, text):
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    @staticmethod
+    def _estimate(text):
+        cjk = sum(1 for ch in text if _is_cjk(ch))
+        return max(1, round(cjk * CJK_TOKENS + (len(text) - cjk) * OTHER_TOKENS)) if text else 0
+
+    def count(self, text: str, ratio=None) -> int:
+        """文本的token数（已按服务商的实际计费校准）。ratio 指定校准比例，省略时用当前的比例"""
+        return round(self._raw_count(text) * (self.ratio if ratio is None else ratio))
+
+    def calibrate(self, counted: int, actual: int, ratio=None):
+        """
+        用一次请求的实际用量校准。
+
+        Args:
+            counted (int): 发送前本地计算的 prompt token 数。
+            actual (int): API 返回的 prompt_tokens。
+            ratio (float, optional): 计算 counted 时使用的校准比例，省略时视为当前的比例。
+        """
+        if counted <= 0 or actual <= 0:
+            return
+        with self._lock:
+            observed = (self.ratio if ratio is None else ratio) * actual / counted
+            self.ratio = min(2.0, max(0.5, self.ratio + (observed - self.ratio) * self.calibration_weight))
+            self.calibrations += 1
+
+    def stats(self) -> dict:
+        info = self._raw_count.cache_info()
+        return {
+            "exact": self.exact,
+            "calibration_ratio": round(self.ratio, 4),
+            "calibrations": self.calibrations,
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
+        }
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """取得进程内共享的 TokenCounter（第一次调用时按环境变量创建）"""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = TokenCounter(tokenizer_file=os.environ.get("SUTANG_TOKENIZER_FILE") or DEFAULT_TOKENIZER_FILE)
+        return _counter
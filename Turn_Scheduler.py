@@ -0,0 +1,187 @@
+# =================================================================================
+# Turn_Scheduler.py - LLM调用的准入调度
+#
+# 所有玩家的对话和后台记忆总结在调用LLM之前都要先在这里排队领取“调用许可”：
+# 1. 全局令牌桶：每秒最多发出 rate 次调用，允许 burst 次突发；同时进行中的调用不超过 max_in_flight。
+#    突发流量在本地排队，而不是一起打到服务商触发限流。
+# 2. 优先级：玩家正在等待的对话 (DIALOGUE) 总是先于按草稿提前发起的预测性请求 (SPECULATIVE)，
+#    再之后是后台总结 (SUMMARY)。总结等待超过 summary_max_wait 秒后提升为对话优先级，避免被长期饿死；
+#    预测性请求被正式发送用上时 (promote) 提升为对话优先级。
+# 3. 公平性：同一优先级内按玩家轮转，一个玩家的连续请求不会挡住其他玩家。
+# 4. 排队等待时间与模型耗时分开统计（Metrics 中的 queue_wait_* 与 llm_* 阶段）。
+# =================================================================================
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from Metrics import get_metrics
+
+DIALOGUE = 0
+SPECULATIVE = 1
+SUMMARY = 2
+PRIORITY_NAMES = {DIALOGUE: "dialogue", SPECULATIVE: "speculative", SUMMARY: "summary"}
+
+
+class _Ticket:
+    __slots__ = ("player", "priority", "enqueued_at", "granted")
+
+    def __init__(self, player, priority):
+        self.player = player
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class TurnScheduler:
+    def __init__(self, rate=0.0, burst=10, max_in_flight=0, summary_max_wait=30.0):
+        """
+        初始化 TurnScheduler。
+
+        Args:
+            rate (float): 令牌桶每秒补充的调用次数，0 表示不限速。
+            burst (int): 令牌桶容量，即允许的突发调用次数。
+            max_in_flight (int): 同时进行中的调用上限，0 表示不限制。
+            summary_max_wait (float): 总结请求排队超过该秒数后按对话优先级处理。
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_in_flight = max_in_flight
+        self.summary_max_wait = summary_max_wait
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._waiting = {priority: OrderedDict() for priority in PRIORITY_NAMES}  # 优先级 -> 玩家 -> 排队中的票
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.promoted = 0
+        self._total_wait = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    @contextmanager
+    def slot(self, player, priority=DIALOGUE):
+        """
+        排队领取一次LLM调用许可，with 块结束时归还。
+
+        Args:
+            player: 玩家标识（同一玩家的请求按先后顺序处理）。
+            priority (int): DIALOGUE、SPECULATIVE 或 SUMMARY。
+        """
+        ticket = _Ticket(player, priority)
+        with self._cond:
+            self._waiting[priority].setdefault(player, deque()).append(ticket)
+            while True:
+                self._dispatch()
+                if ticket.granted:
+                    break
+                self._cond.wait(self._next_token_delay())
+        wait = time.monotonic() - ticket.enqueued_at
+        get_metrics().observe(f"queue_wait_{PRIORITY_NAMES[priority]}", wait)
+        try:
+            yield wait
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._dispatch()
+                self._cond.notify_all()
+
+    def _refill(self):
+        if not self.rate:
+            self._tokens = float(self.burst)
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _next_token_delay(self):
+        """令牌不足时，等到下一个令牌补充的时间；其他情况等待通知"""
+        if self.rate and self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        return None
+
+    def _promote_starved_summaries(self):
+        summaries = self._waiting[SUMMARY]
+        if not summaries or not self.summary_max_wait:
+            return
+        now = time.monotonic()
+        for player in list(summaries):
+            queue = summaries[player]
+            while queue and now - queue[0].enqueued_at >= self.summary_max_wait:
+                self._waiting[DIALOGUE].setdefault(player, deque()).append(queue.popleft())
+                self.promoted += 1
+            if not queue:
+                del summaries[player]
+
+    def promote(self, player, priority=SPECULATIVE):
+        """玩家在某个优先级排队中的请求改按对话优先级处理（预测性请求被正式发送用上时，玩家已经在等它了）"""
+        with self._cond:
+            queue = self._waiting[priority].pop(player, None)
+            if queue:
+                self._waiting[DIALOGUE].setdefault(player, deque()).extend(queue)
+                self._dispatch()
+
+    def _dispatch(self):
+        """在持有锁时调用：按优先级和玩家轮转发放许可，直到令牌或并发额度用完"""
+        self._refill()
+        self._promote_starved_summaries()
+        granted_any = False
+        while self._tokens >= 1 and (not self.max_in_flight or self.in_flight < self.max_in_flight):
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            granted_any = True
+            self._tokens -= 1
+            self.in_flight += 1
+            self.granted[ticket.priority] += 1
+            self._total_wait[ticket.priority] += time.monotonic() - ticket.enqueued_at
+        if granted_any:
+            self._cond.notify_all()
+
+    def _next_ticket(self):
+        for priority in sorted(PRIORITY_NAMES):
+            players = self._waiting[priority]
+            if not players:
+                continue
+            player, queue = next(iter(players.items()))
+            ticket = queue.popleft()
+            del players[player]
+            if queue:
+                players[player] = queue  # 还有请求的玩家排到本优先级的队尾
+            return ticket
+        return None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "promoted_summaries": self.promoted,
+                **{
+                    f"{name}_waiting": sum(len(q) for q in self._waiting[priority].values())
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+                **{
+                    f"{name}_avg_wait_seconds": round(self._total_wait[priority] / self.granted[priority], 4)
+                    if self.granted[priority] else 0.0
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_turn_scheduler() -> TurnScheduler:
+    """取得进程内共享的 TurnScheduler（第一次调用时按环境变量创建）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TurnScheduler(
+                rate=float(os.environ.get("SUTANG_LLM_RATE", 0)),
+                burst=int(os.environ.get("SUTANG_LLM_BURST", 10)),
+                max_in_flight=int(os.environ.get("SUTANG_LLM_MAX_IN_FLIGHT", 0)),
+                summary_max_wait=float(os.environ.get("SUTANG_SUMMARY_MAX_WAIT", 30)),
+            )
+        return _scheduler
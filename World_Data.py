@@ -0,0 +1,103 @@
+# =================================================================================
+# World_Data.py - 所有 Agent 共享的只读世界数据
+#
+# 1. locations.yaml 在进程内只解析一次，转换成不可变结构（字典 -> MappingProxyType，列表 -> tuple），
+#    和导航索引一起放进一个 WorldData。所有 Agent 引用同一个 WorldData，自己不再持有地点数据，
+#    也不可能意外改动其他会话看到的地图。
+# 2. 文件是否被修改由进程统一检查（每 LOCATIONS_CHECK_INTERVAL 秒最多一次），
+#    修改后换一个新的 WorldData，各 Agent 在下一轮对话时换用。
+#    文件缺失或格式错误时只报告一次，之后继续使用原来的数据（没有时为空地图），直到文件再次变化才重新读取。
+# 3. yaml 在第一次读取地点文件时才导入，不拖慢服务启动。
+# Prompt 模板同样只解析一次，由 Prompt_Registry 在进程内共享。
+# =================================================================================
+
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+
+from Navigation import NavigationIndex, load_navigation
+
+LOCATIONS_PATH = Path(__file__).resolve().parent / "config" / "locations.yaml"
+LOCATIONS_CHECK_INTERVAL = 5  # 每隔多少秒检查一次 locations.yaml 是否被修改
+
+
+def freeze(value):
+    """递归转换成不可变结构：字典 -> MappingProxyType，列表 -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def read_locations(path):
+    """读取地点文件并转换成不可变结构"""
+    import yaml
+    with open(path, 'r', encoding='utf-8') as f:
+        return freeze(yaml.safe_load(f) or {})
+
+
+class WorldData:
+    """一份地点数据及其导航索引，创建后不再修改"""
+    __slots__ = ("locations", "navigation")
+
+    def __init__(self, locations, navigation=None):
+        """
+        初始化 WorldData。
+
+        Args:
+            locations (dict): 地点数据，key 为地点key（会被转换成不可变结构）。
+            navigation (NavigationIndex, optional): 对应的导航索引，省略时按地点数据建立。
+        """
+        self.locations = freeze(locations)
+        self.navigation = navigation or NavigationIndex(self.locations)
+
+
+_world = None
+_checked_at = 0.0
+_pinned = False  # 由 set_world 固定时不再读取 locations.yaml
+_failed = None  # 上次读取失败时 locations.yaml 的状态（见 _file_signature），文件没变就不再重试
+_world_lock = threading.Lock()
+
+
+def _file_signature(path):
+    """文件的 (修改时间, 大小)；文件不存在或无法访问时返回标记 "missing"，用于判断文件是否变化"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return st.st_mtime_ns, st.st_size
+
+
+def get_world() -> WorldData:
+    """取得进程内共享的世界数据；距上次检查超过 LOCATIONS_CHECK_INTERVAL 秒时确认文件是否被修改"""
+    global _world, _checked_at, _failed
+    with _world_lock:
+        now = time.monotonic()
+        if _pinned or (_world is not None and now - _checked_at < LOCATIONS_CHECK_INTERVAL):
+            return _world
+        _checked_at = now
+        current, failed = _world, _failed
+    signature = _file_signature(LOCATIONS_PATH)
+    if current is not None and signature == failed:
+        return current  # 上次读取失败之后文件没有变化
+    try:
+        locations, navigation = load_navigation(LOCATIONS_PATH, read_locations)
+        if current is not None and current.locations is locations:
+            return current
+        world, failed = WorldData(locations, navigation), None
+    except Exception as e:
+        print(f"[FATAL] Failed to load 'locations.yaml': {e}")
+        world, failed = current or WorldData({}), signature
+    with _world_lock:
+        _world, _failed = world, failed
+    return world
+
+
+def set_world(world: WorldData):
+    """固定使用给定的世界数据，不再读取 locations.yaml（离线模拟时使用其他地图）"""
+    global _world, _pinned
+    with _world_lock:
+        _world, _pinned = world, True
@@ -0,0 +1,114 @@
+# benchmarks/bench_events.py
+# 对比逐个检查所有事件条件的朴素实现与 EventEngine（按地点、关系阶段预建别名表 + 编译后的条件）的单步耗时。
+# 地图为 bench_navigation 生成的校园，事件随机分布在各地点和关系阶段上，部分带亲密度/心情条件。
+#
+# 用法:
+#   python benchmarks/bench_events.py --events 2000 --steps 2000000
+#   python benchmarks/bench_events.py --trigger-rate 1.0   # 每一步都抽事件，测量抽样本身的开销
+
+import argparse
+import operator
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from benchmarks.bench_navigation import build_campus
+from Event_Engine import Event, EventEngine
+
+STATES = ["初始阶段", "朋友", "好朋友", "亲密关系"]
+MOODS = ["happy", "normal", "sad"]
+OPS = {">=": operator.ge, "<": operator.lt}
+
+
+def build_events(count, keys, rng):
+    """生成事件定义（与 events.yaml 中的写法相同）：约一半限定地点，约一半限定关系阶段，约三分之一带条件"""
+    specs = []
+    for i in range(count):
+        conditions = {}
+        if rng.random() < 0.2:
+            conditions["closeness"] = f"{rng.choice(list(OPS))} {rng.randint(20, 80)}"
+        if rng.random() < 0.15:
+            conditions["mood_today"] = rng.sample(MOODS, 2)
+        specs.append({
+            "id": f"event_{i}", "text": "路过{waypoint}时发生了一件小事。", "weight": rng.randint(1, 5),
+            "locations": rng.sample(keys, rng.randint(1, 3)) if rng.random() < 0.5 else None,
+            "relationship_states": rng.sample(STATES, rng.randint(1, 2)) if rng.random() < 0.5 else None,
+            "conditions": conditions or None,
+        })
+    return specs
+
+
+def naive_roll(specs, rate, rng, location, game_state):
+    """朴素实现：每一步都遍历全部事件、解释执行条件，再按权重抽取"""
+    if rng.random() >= rate:
+        return None
+    eligible, weights = [], []
+    for spec in specs:
+        if spec["locations"] and location not in spec["locations"]:
+            continue
+        if spec["relationship_states"] and game_state["relationship_state"] not in spec["relationship_states"]:
+            continue
+        ok = True
+        for field, expected in (spec["conditions"] or {}).items():
+            value = game_state.get(field)
+            if isinstance(expected, list):
+                ok = value in expected
+            else:
+                op, number = expected.split()
+                ok = value is not None and OPS[op](value, float(number))
+            if not ok:
+                break
+        if ok:
+            eligible.append(spec)
+            weights.append(spec["weight"])
+    return rng.choices(eligible, weights)[0] if eligible else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="随机事件基准测试")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=2_000_000, help="EventEngine 走过的中间地点数")
+    parser.add_argument("--naive-steps", type=int, default=20_000, help="朴素实现走过的中间地点数")
+    parser.add_argument("--trigger-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    locations = build_campus(10, 5, 20)
+    keys = list(locations)
+    rng = random.Random(42)
+    specs = build_events(args.events, keys, rng)
+
+    build_start = time.perf_counter()
+    engine = EventEngine([Event(**spec) for spec in specs], args.trigger_rate)
+    engine.warm_up()
+    build_ms = (time.perf_counter() - build_start) * 1000
+
+    walk = [rng.choice(keys) for _ in range(1000)]
+    states = [{"relationship_state": rng.choice(STATES), "closeness": rng.randint(0, 100), "mood_today": rng.choice(MOODS)}
+              for _ in range(16)]
+
+    start = time.perf_counter()
+    naive_hits = 0
+    for i in range(args.naive_steps):
+        naive_hits += naive_roll(specs, args.trigger_rate, rng, walk[i % len(walk)], states[i % len(states)]) is not None
+    naive_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = 0
+    for i in range(0, args.steps, len(walk)):
+        hits += len(engine.walk(rng, walk, states[(i // len(walk)) % len(states)]))
+    engine_seconds = time.perf_counter() - start
+
+    naive_rate, engine_rate = args.naive_steps / naive_seconds, args.steps / engine_seconds
+    print(f"events: {len(specs)}, tables: {engine.stats()['tables']}, build: {build_ms:.1f} ms, "
+          f"trigger rate: {args.trigger_rate}")
+    print(f"naive scan:  {naive_rate / 1e6:8.3f} M waypoints/s ({naive_hits / args.naive_steps:.3f} events/step)")
+    print(f"EventEngine: {engine_rate / 1e6:8.3f} M waypoints/s ({hits / args.steps:.3f} events/step), "
+          f"{engine_rate / naive_rate:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_llm_client.py
+# 对比 LLMClient（连接池 + keep-alive）与“每次请求新建连接”的吞吐量。
+#
+# 用法:
+#   python benchmarks/bench_llm_client.py --requests 300 --latency 0.02
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from LLM_Client import LLMClient
+from benchmarks.mock_llm_server import launch_mock_server_process
+
+PAYLOAD = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "你好"}], "max_tokens": 200}
+
+
+def run_pooled(base_url, concurrency, total):
+    # 使用与游戏相同的默认连接池参数：超过 per_host_limit 的请求在本地排队
+    client = LLMClient(base_url=base_url, api_key="bench")
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # 预热：启动事件循环，并让连接池建立好 keep-alive 连接
+        list(pool.map(lambda _: client.complete(PAYLOAD), range(concurrency)))
+        start = time.perf_counter()
+        list(pool.map(lambda _: client.complete(PAYLOAD), range(total)))
+        elapsed = time.perf_counter() - start
+    client.close()
+    return total / elapsed
+
+
+def run_unpooled(base_url, concurrency, total):
+    headers = {"Authorization": "Bearer bench"}
+
+    def one(_):
+        # 旧实现的做法：每轮对话都单独发起请求，不复用连接
+        response = httpx.post(f"{base_url}/chat/completions", json=PAYLOAD, headers=headers, timeout=45)
+        response.json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLMClient 吞吐量基准测试")
+    parser.add_argument("--requests", type=int, default=300, help="每个并发级别发送的请求数")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务的单请求延迟（秒）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    # 模拟服务放在独立进程中，避免和客户端争抢GIL
+    server, base_url = launch_mock_server_process(args.latency)
+
+    print(f"{'players':>8} {'pooled req/s':>14} {'unpooled req/s':>16}")
+    for concurrency in args.concurrency:
+        pooled = run_pooled(base_url, concurrency, args.requests)
+        unpooled = run_unpooled(base_url, concurrency, args.requests)
+        print(f"{concurrency:>8} {pooled:>14.1f} {unpooled:>16.1f}")
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_location_matcher.py
+# 对比旧的逐个地点子串匹配与 LocationMatcher（Aho-Corasick）的移动意图识别耗时。
+#
+# 用法:
+#   python benchmarks/bench_location_matcher.py --locations 5000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from Location_Matcher import LocationMatcher
+
+FILLERS = ["我们", "一起", "去", "吧", "要不", "前往", "看看", "好不好", "今天", "放学后", "到", "那边"]
+
+
+def build_locations(count):
+    locations = {}
+    for i in range(count):
+        building = f"{i // 100 + 1}号楼"
+        locations[f"loc_{i}"] = {
+            "name": f"{building}{i % 10 + 1}楼{i % 100}室",
+            "aliases": [f"{i}号教室"],
+            "pinyin": [f"jiaoshi{i}"],
+        }
+    return locations
+
+
+def legacy_match(locations, user_input):
+    """旧版 GalGameAgent.chat 中的做法：逐个地点做子串判断，第一个命中即返回"""
+    for key, loc_data in locations.items():
+        if loc_data.get('name') in user_input:
+            return key
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地点识别基准测试")
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--inputs", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    locations = build_locations(args.locations)
+    names = [data["name"] for data in locations.values()]
+    inputs = ["".join(rng.sample(FILLERS, 4)) + rng.choice(names) + "".join(rng.sample(FILLERS, 2))
+              for _ in range(args.inputs)]
+
+    start = time.perf_counter()
+    matcher = LocationMatcher(locations)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for text in inputs:
+        legacy_match(locations, text)
+    legacy_us = (time.perf_counter() - start) / len(inputs) * 1e6
+
+    start = time.perf_counter()
+    for text in inputs:
+        matcher.best_match(text)
+    matcher_us = (time.perf_counter() - start) / len(inputs) * 1e6
+
+    print(f"locations: {len(locations)}, patterns: {len(matcher.patterns)}, automaton build: {build_ms:.1f} ms")
+    print(f"legacy substring loop per input: {legacy_us:10.1f} us")
+    print(f"Aho-Corasick per input:          {matcher_us:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_navigation.py
+# 对比旧的逐次BFS寻路与 NavigationIndex 的查询耗时。
+# 地图为生成的校园：若干栋楼，每栋若干层，每层一条走廊连着若干房间，楼梯连接上下层，一楼连到操场。
+#
+# 用法:
+#   python benchmarks/bench_navigation.py --buildings 10 --floors 5 --rooms 20
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import deque
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from Navigation import NavigationIndex
+
+
+def build_campus(buildings, floors, rooms):
+    locations = {"playground": {"name": "操场", "connections": []}}
+    for b in range(buildings):
+        for f in range(floors):
+            corridor = f"b{b}_f{f}_corridor"
+            connections = []
+            if f > 0:
+                connections.append(f"b{b}_f{f - 1}_corridor")
+            if f < floors - 1:
+                connections.append(f"b{b}_f{f + 1}_corridor")
+            if f == 0:
+                connections.append("playground")
+                locations["playground"]["connections"].append(corridor)
+            for r in range(rooms):
+                room = f"b{b}_f{f}_r{r}"
+                connections.append(room)
+                locations[room] = {"name": f"{b}号楼{f + 1}楼{r}室", "connections": [corridor]}
+            locations[corridor] = {"name": f"{b}号楼{f + 1}楼走廊", "connections": connections}
+    return locations
+
+
+def legacy_find_path(locations, start_key, end_key):
+    """旧版 GalGameAgent._find_path：每次查询都做一次BFS，并在入队时复制整条路径"""
+    if start_key not in locations or end_key not in locations:
+        return None
+    queue = deque([(start_key, [start_key])])
+    visited = {start_key}
+    while queue:
+        current_key, path = queue.popleft()
+        if current_key == end_key:
+            return path
+        for neighbor_key in locations[current_key].get("connections", []):
+            if neighbor_key not in visited:
+                visited.add(neighbor_key)
+                new_path = list(path)
+                new_path.append(neighbor_key)
+                queue.append((neighbor_key, new_path))
+    return None
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for a, b in queries:
+        fn(a, b)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="寻路基准测试")
+    parser.add_argument("--buildings", type=int, default=10)
+    parser.add_argument("--floors", type=int, default=5)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    locations = build_campus(args.buildings, args.floors, args.rooms)
+    keys = list(locations)
+    rng = random.Random(42)
+    # 玩家通常在少数几个地点之间来回走动，起点集中、终点随机
+    starts = rng.sample(keys, min(20, len(keys)))
+    queries = [(rng.choice(starts), rng.choice(keys)) for _ in range(args.queries)]
+
+    build_start = time.perf_counter()
+    index = NavigationIndex(locations)
+    build_ms = (time.perf_counter() - build_start) * 1000
+
+    for a, b in queries[:50]:
+        assert len(index.find_path(a, b)) == len(legacy_find_path(locations, a, b))
+
+    legacy_us = timed(lambda a, b: legacy_find_path(locations, a, b), queries)
+    fresh = NavigationIndex(locations)
+    lazy_us = timed(fresh.find_path, queries)
+    warm_us = timed(index.find_path, queries)
+
+    print(f"locations: {len(locations)}, index build: {build_ms:.2f} ms")
+    print(f"legacy BFS per query:        {legacy_us:10.1f} us")
+    print(f"index (lazy rows) per query: {lazy_us:10.1f} us")
+    print(f"index (warm rows) per query: {warm_us:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
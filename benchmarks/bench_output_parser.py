@@ -0,0 +1,88 @@
+# benchmarks/bench_output_parser.py
+# 对比旧的多次正则解析与单遍标签切分 + Analysis 解码的耗时，覆盖正常、超长和格式错误的模型输出。
+#
+# 用法:
+#   python benchmarks/bench_output_parser.py --repeat 2000
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from Output_Parser import Analysis, AnalysisError, parse_llm_output
+
+ANALYSIS = {
+    "thought_process": "他在和我打招呼。", "player_emotion_guess": "neutral", "player_intent_guess": "inquire_wellbeing",
+    "response_strategy": "礼貌回应", "affection_delta_reason": "正常问候", "affection_delta": 1, "boredom_delta": 0,
+    "mood_change": "unchanged", "triggered_topics": ["社团"], "suggested_action": None,
+}
+NORMAL = f"<analysis>{json.dumps(ANALYSIS, ensure_ascii=False)}</analysis>\n<response>嗯，你好呀！今天社团招新好热闹呢。</response>"
+LARGE = (f"<analysis>{json.dumps(dict(ANALYSIS, thought_process='我在想……' * 2000), ensure_ascii=False)}</analysis>\n"
+         f"<response>{'今天的天气真好，我们一起去操场走走吧。' * 500}</response>")
+MALFORMED = {
+    "unclosed_response": NORMAL.replace("</response>", ""),
+    "no_response_tag": NORMAL.replace("<response>", "").replace("</response>", ""),
+    "broken_json": NORMAL.replace('"affection_delta": 1', '"affection_delta": 1,,'),
+    "unclosed_analysis": "<analysis>{" + "\"thought_process\": \"" + "嗯" * 20000,
+    "no_tags": "今天不想说话。" * 1000,
+}
+
+
+def legacy_parse(llm_output):
+    """旧版 GalGameAgent._parse_llm_output：三到四次正则扫描 + 无类型的 json.loads"""
+    analysis_json, response_text = None, "（备用回复）"
+    try:
+        analysis_match = re.search(r'<analysis>(.*?)</analysis>', llm_output, re.DOTALL)
+        if analysis_match:
+            json_str = analysis_match.group(1).strip()
+            json_match = re.search(r'\{.*\}', json_str, re.DOTALL)
+            if json_match: analysis_json = json.loads(json_match.group(0))
+            else: analysis_json = {"error": "在<analysis>标签内未找到有效的JSON结构。"}
+        response_match = re.search(r'<response>(.*?)</response>', llm_output, re.DOTALL)
+        if response_match: response_text = response_match.group(1).strip()
+        elif analysis_match: response_text = llm_output.split("</analysis>")[-1].strip()
+    except Exception as e:
+        analysis_json = {"error": f"解析LLM输出时发生未知错误: {e}"}
+    return {"analysis": analysis_json, "response": re.sub(r'</?response>', '', response_text).strip()}
+
+
+def new_parse(llm_output):
+    analysis_text, response = parse_llm_output(llm_output)
+    analysis = None
+    if analysis_text is not None:
+        try:
+            analysis = Analysis.decode(analysis_text)
+        except AnalysisError:
+            pass
+    return analysis, response
+
+
+def timed(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM输出解析基准测试")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    cases = {"normal": NORMAL, "large": LARGE, **MALFORMED}
+    print(f"{'case':<20} {'chars':>8} {'legacy us':>12} {'single-pass us':>16}")
+    for name, text in cases.items():
+        repeat = max(20, args.repeat // max(1, len(text) // 1000))
+        legacy = timed(legacy_parse, text, repeat)
+        current = timed(new_parse, text, repeat)
+        print(f"{name:<20} {len(text):>8} {legacy:>12.1f} {current:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_page_weight.py
+# 对比构建静态资源 (tools/build_assets.py) 前后首页的传输体积和加载时间。
+# 用 Flask 测试客户端渲染首页，找出页面引用的本站资源（CDN 上的 Bootstrap/jQuery/字体两种情况相同，不计入），
+# 按浏览器的方式逐个请求：带 Accept-Encoding，<picture> 取第一个 <source>，背景图按视口宽度取对应的一档。
+# 加载时间按 RTT 和带宽估算：首页之后的资源并行请求（--connections 个连接），
+# 再次访问时 /static/ 的文件要逐个发请求验证（304），带哈希的 /assets/ 文件直接用缓存。
+#
+# 用法:
+#   python tools/build_assets.py && python benchmarks/bench_page_weight.py
+#   python benchmarks/bench_page_weight.py --rtt 150 --bandwidth 1.6 --viewport-width 1920 --dpr 2
+
+import argparse
+import json
+import os
+import re
+import sys
+from html.parser import HTMLParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from web_app.app import app
+from web_app.assets import AssetManifest, set_asset_manifest
+
+_MEDIA_RULE = re.compile(r"@media \(min-width: (\d+)px\) \{(.*?)\}\s*\}|^([^@\n][^\n]*)$", re.M)
+_FIRST_URL = re.compile(r"""url\(\s*['"]?([^'")]+)""")
+
+
+class ResourceParser(HTMLParser):
+    """收集页面引用的本站资源：样式表、图标、脚本、图片（<picture> 中取第一个 <source>）、内联 <style> 中的背景图"""
+
+    def __init__(self, dpr):
+        super().__init__()
+        self.dpr = f"{dpr}x"
+        self.resources = []
+        self.styles = []
+        self._picture_src = None
+        self._in_style = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "link" and attrs.get("rel") in ("stylesheet", "shortcut icon", "icon"):
+            self.resources.append(attrs.get("href"))
+        elif tag == "script":
+            self.resources.append(attrs.get("src"))
+        elif tag == "source" and self._picture_src is None:
+            self._picture_src = self._pick(attrs.get("srcset", ""))
+        elif tag == "img":
+            self.resources.append(self._picture_src or attrs.get("src"))
+            self._picture_src = None
+        elif tag == "style":
+            self._in_style = True
+
+    def handle_endtag(self, tag):
+        if tag == "style":
+            self._in_style = False
+        elif tag == "picture":
+            self._picture_src = None
+
+    def handle_data(self, data):
+        if self._in_style:
+            self.styles.append(data)
+
+    def _pick(self, srcset):
+        candidates = [item.split() for item in srcset.split(",") if item.strip()]
+        for url, descriptor in candidates:
+            if descriptor == self.dpr:
+                return url
+        return candidates[-1][0] if candidates else None
+
+
+def background_url(css, viewport_width):
+    """内联CSS中适用于这个视口宽度的背景图（取 image-set 的第一个格式）"""
+    chosen = None
+    for match in _MEDIA_RULE.finditer(css):
+        min_width, media_body, plain = match.groups()
+        if plain and "background-image" in plain:
+            chosen = _FIRST_URL.search(plain)
+        elif min_width and int(min_width) <= viewport_width:
+            chosen = _FIRST_URL.search(media_body)
+    return chosen.group(1) if chosen else None
+
+
+def measure(client, manifest, args):
+    """渲染首页并取回所有本站资源，返回每个资源的 (URL, 传输字节数, 响应头)"""
+    set_asset_manifest(manifest)
+    headers = {"Accept-Encoding": args.accept_encoding}
+    page = client.get("/", headers=headers)
+    html = page.get_data(as_text=True)
+    parser = ResourceParser(args.dpr)
+    parser.feed(html)
+    urls = [url for url in parser.resources if url and url.startswith("/")]
+    background = background_url("\n".join(parser.styles), args.viewport_width)
+    if background:
+        urls.append(background)
+    rows = [("/", len(page.get_data()), page.headers)]
+    for url in dict.fromkeys(urls):
+        response = client.get(url, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} 返回 {response.status_code}")
+        rows.append((url, len(response.get_data()), response.headers))
+        response.close()
+    return rows
+
+
+def load_time(rows, args, repeat=False):
+    """估算加载时间（毫秒）：首页一个往返，其余资源在 --connections 个连接上并行，每批一个往返 + 传输时间"""
+    bytes_per_ms = args.bandwidth * 1e6 / 8 / 1000
+    page, assets = rows[0], rows[1:]
+    if repeat:
+        # 再次访问：带哈希的资源 immutable，不发请求；其余资源发请求验证，只收到响应头
+        assets = [(url, 0, headers) for url, _, headers in assets if "immutable" not in headers.get("Cache-Control", "")]
+    total = args.rtt + page[1] / bytes_per_ms
+    for i in range(0, len(assets), args.connections):
+        batch = assets[i:i + args.connections]
+        total += args.rtt + sum(size for _, size, _ in batch) / bytes_per_ms
+    return total, len(assets)
+
+
+def report(label, rows, args):
+    print(f"\n{label}")
+    for url, size, headers in rows:
+        encoding = headers.get("Content-Encoding", "")
+        cache = headers.get("Cache-Control", "")
+        print(f"  {url:<56} {size:>10,} B  {encoding:<5} {cache}")
+    first, first_requests = load_time(rows, args)
+    repeat, repeat_requests = load_time(rows, args, repeat=True)
+    total = sum(size for _, size, _ in rows)
+    print(f"  合计 {total:,} B；首次加载约 {first:.0f} ms，再次访问约 {repeat:.0f} ms（{repeat_requests} 个验证请求）")
+    return {"bytes": total, "requests": len(rows), "first_load_ms": round(first, 1),
+            "repeat_load_ms": round(repeat, 1), "repeat_requests": repeat_requests,
+            "resources": [{"url": url, "bytes": size, "content_encoding": headers.get("Content-Encoding"),
+                           "cache_control": headers.get("Cache-Control")} for url, size, headers in rows]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比构建静态资源前后的首页体积和加载时间")
+    parser.add_argument("--rtt", type=float, default=100, help="往返时间 (ms)")
+    parser.add_argument("--bandwidth", type=float, default=10, help="下行带宽 (Mbit/s)")
+    parser.add_argument("--connections", type=int, default=6, help="并行连接数")
+    parser.add_argument("--viewport-width", type=int, default=1920)
+    parser.add_argument("--dpr", type=int, default=1, choices=(1, 2), help="屏幕像素密度")
+    parser.add_argument("--accept-encoding", default="br, gzip")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    after_manifest = AssetManifest.load()
+    if not after_manifest.files:
+        print("没有找到构建产物，请先运行 python tools/build_assets.py")
+        return 1
+    client = app.test_client()
+    before = report("构建前 (/static/ 原始文件)", measure(client, AssetManifest(), args), args)
+    after = report("构建后 (/assets/ 带哈希、预压缩)", measure(client, after_manifest, args), args)
+    set_asset_manifest(after_manifest)
+
+    print(f"\n传输体积 {before['bytes']:,} B -> {after['bytes']:,} B ({after['bytes'] / before['bytes']:.1%})，"
+          f"首次加载 {before['first_load_ms']:.0f} -> {after['first_load_ms']:.0f} ms，"
+          f"再次访问 {before['repeat_load_ms']:.0f} -> {after['repeat_load_ms']:.0f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "before": before, "after": after}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
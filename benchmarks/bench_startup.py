@@ -0,0 +1,144 @@
+# benchmarks/bench_startup.py
+# 冷启动基准：每项都在一个新的 Python 进程中测量，避免已导入的模块影响结果。
+#
+# 1. import: 用 python -X importtime 导入 web_app.app，统计总耗时、自身耗时最多的模块，
+#    以及 numpy / httpx / yaml 这些应当延迟导入的模块是否在启动时被导入了。
+# 2. first_request: 从进程开始到第一个 /api/start_game 请求返回（含导入和创建第一个 Agent）的耗时。
+# 3. agent_memory: 用 tracemalloc 统计每个新 Agent 占用的内存（地点数据、Prompt模板等共享数据不计入），
+#    以及已经积累了 --memories 条长期记忆、建好检索索引的 Agent 的内存（含记忆文本和索引数组）。
+#
+# 用法:
+#   python benchmarks/bench_startup.py --runs 5 --agents 200 --memories 40 --output startup.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ("numpy", "httpx", "yaml")
+
+FIRST_REQUEST_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from web_app.app import app
+imported = time.perf_counter()
+response = app.test_client().post("/api/start_game")
+assert response.status_code == 200, response.status_code
+print(json.dumps({"import_ms": (imported - start) * 1e3, "first_request_ms": (time.perf_counter() - start) * 1e3}))
+"""
+
+AGENT_MEMORY_SCRIPT = """
+import json, sys, tracemalloc
+from Su_Tang import GalGameAgent
+count, memories = int(sys.argv[1]), int(sys.argv[2])
+TOPICS = ["新做的草莓蛋糕", "周末想去看的电影", "期中考试的复习计划", "社团招新时的趣事", "图书馆里遇到的猫"]
+
+def with_memories():
+    agent = GalGameAgent(is_new_game=True)
+    agent.long_term_memory.extend(f"第{i}次聊天时，陈辰和苏糖聊了{TOPICS[i % len(TOPICS)]}，她看起来很开心。"
+                                  for i in range(memories))
+    agent.memory_index.sync(agent.long_term_memory)
+    return agent
+
+result = {"agents": count, "memories": memories}
+for key, make in (("bytes_per_agent", lambda: GalGameAgent(is_new_game=True)),
+                  ("bytes_per_agent_with_memories", with_memories)):
+    make()  # 先创建一个，让共享数据（地点、模板、存储、NumPy）加载完
+    tracemalloc.start()
+    agents = [make() for _ in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result[key] = current / count
+    if make is with_memories:
+        result["memory_index_bytes"] = agents[0].memory_index.nbytes
+    del agents
+print(json.dumps(result))
+"""
+
+
+def run_python(args, workdir):
+    """在新进程中运行，存档等文件写到 workdir"""
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    """-X importtime 的输出 -> [(模块名, 自身微秒, 累计微秒)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def bench_import(workdir, runs, top):
+    totals, last = [], []
+    for _ in range(runs):
+        rows = parse_importtime(run_python(["-X", "importtime", "-c", "import web_app.app"], workdir).stderr)
+        totals.append(next(cumulative for name, _, cumulative in rows if name == "web_app.app") / 1e3)
+        last = rows
+    return {
+        "import_ms_median": round(statistics.median(totals), 2),
+        "import_ms_min": round(min(totals), 2),
+        "modules": len(last),
+        "lazy_modules_imported": [name for name in LAZY_MODULES if any(row[0] == name for row in last)],
+        "top_self_ms": [(name, round(self_us / 1e3, 2)) for name, self_us, _ in sorted(last, key=lambda r: -r[1])[:top]],
+    }
+
+
+def bench_first_request(workdir, runs):
+    samples = [json.loads(run_python(["-c", FIRST_REQUEST_SCRIPT], workdir).stdout.strip().splitlines()[-1])
+               for _ in range(runs)]
+    return {key: round(statistics.median(s[key] for s in samples), 2) for key in ("import_ms", "first_request_ms")}
+
+
+def bench_agent_memory(workdir, agents, memories):
+    output = run_python(["-c", AGENT_MEMORY_SCRIPT, str(agents), str(memories)], workdir).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return {"agents": result["agents"], "bytes_per_agent": round(result["bytes_per_agent"]),
+            "memories": result["memories"], "bytes_per_agent_with_memories": round(result["bytes_per_agent_with_memories"]),
+            "memory_index_bytes": result["memory_index_bytes"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动与每个 Agent 的内存占用")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量重复的次数（取中位数）")
+    parser.add_argument("--agents", type=int, default=200, help="测量内存时创建的 Agent 数")
+    parser.add_argument("--memories", type=int, default=40, help="第二组 Agent 每个积累的长期记忆条数")
+    parser.add_argument("--top", type=int, default=10, help="列出自身导入耗时最多的几个模块")
+    parser.add_argument("--output", help="另外把结果写成JSON报告")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix="sutang_startup_")
+    report = {
+        "import": bench_import(workdir, args.runs, args.top),
+        "first_request": bench_first_request(workdir, args.runs),
+        "agent_memory": bench_agent_memory(workdir, args.agents, args.memories),
+    }
+    imports = report["import"]
+    print(f"import web_app.app   median {imports['import_ms_median']:>8.2f} ms   min {imports['import_ms_min']:>8.2f} ms"
+          f"   ({imports['modules']} modules)")
+    print(f"  lazy modules imported at startup: {', '.join(imports['lazy_modules_imported']) or 'none'}")
+    for name, ms in imports["top_self_ms"]:
+        print(f"    {name:<40} {ms:>8.2f} ms")
+    print(f"first request        {report['first_request']['first_request_ms']:>8.2f} ms"
+          f"   (import {report['first_request']['import_ms']:.2f} ms)")
+    memory = report["agent_memory"]
+    print(f"memory per agent     {memory['bytes_per_agent']:>8} bytes   ({memory['agents']} agents)")
+    print(f"  with {memory['memories']} memories   {memory['bytes_per_agent_with_memories']:>8} bytes"
+          f"   (memory index {memory['memory_index_bytes']} bytes)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# benchmarks/mock_llm_server.py
+# 本地的模拟 chat/completions 服务，用于在离线状态下测试和压测 LLM_Client。
+# 基于 asyncio 实现，支持 HTTP/1.1 keep-alive，上百个并发连接时服务端本身不会成为瓶颈。
+# 可以设置首字节延迟 (latency) 和生成速度 (token_rate，每秒多少个分片)，流式请求逐个分片返回，
+# 并像 DeepSeek 一样在 stream_options.include_usage 时于最后一个分片附带 usage。
+#
+# 用法:
+#   python benchmarks/mock_llm_server.py --port 8765 --latency 0.05 --token-rate 50
+# 然后设置 DEEPSEEK_API_BASE=http://127.0.0.1:8765/v1 启动游戏。
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_REPLY = (
+    '<analysis>{"thought_process": "他在和我打招呼。", "affection_delta": 1, '
+    '"boredom_delta": 0, "mood_change": "unchanged", "triggered_topics": [], "suggested_action": null}</analysis>\n'
+    '<response>嗯，你好呀！今天社团招新好热闹呢。</response>'
+)
+
+
+class MockLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reply=DEFAULT_REPLY, token_rate=0.0, chunk_chars=4):
+        """
+        初始化 MockLLMServer。
+
+        Args:
+            host (str): 监听地址。
+            port (int): 监听端口，0 表示由系统分配。
+            latency (float): 每个请求在返回首字节前的固定延迟（秒）。
+            reply (str): 模型“生成”的完整文本。
+            token_rate (float): 每秒生成多少个分片，0 表示不限速（立即返回全部内容）。
+            chunk_chars (int): 每个分片（近似一个token）的字符数。
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.reply = reply
+        self.token_rate = token_rate
+        self.chunk_chars = chunk_chars
+        self.request_count = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:  # keep-alive：同一连接上循环处理请求
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                raw_body = await reader.readexactly(int(headers.get("content-length", 0)))
+                body = json.loads(raw_body or b"{}")
+                self.request_count += 1
+                await asyncio.sleep(self.latency)
+
+                usage = self._usage(body)
+                if body.get("stream"):
+                    include_usage = (body.get("stream_options") or {}).get("include_usage")
+                    await self._write_stream(writer, usage if include_usage else None)
+                    break
+                if self.token_rate:
+                    await asyncio.sleep(len(self._chunks()) / self.token_rate)
+                await self._write_json(writer, usage)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _chunks(self):
+        return [self.reply[i:i + self.chunk_chars] for i in range(0, len(self.reply), self.chunk_chars)]
+
+    def _usage(self, body):
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        return {"prompt_tokens": max(1, prompt_chars // self.chunk_chars), "completion_tokens": len(self._chunks())}
+
+    async def _write_json(self, writer, usage):
+        data = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": self.reply}}],
+            "usage": usage,
+        }, ensure_ascii=False).encode("utf-8")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: " + str(len(data)).encode() + b"\r\n\r\n" + data)
+        await writer.drain()
+
+    async def _write_stream(self, writer, usage=None):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+        for text in self._chunks():
+            if self.token_rate:
+                await asyncio.sleep(1 / self.token_rate)
+            chunk = {"choices": [{"delta": {"content": text}}]}
+            writer.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await writer.drain()
+        if usage is not None:
+            writer.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+
+
+def start_mock_server(host="127.0.0.1", port=0, **kwargs):
+    """在后台线程的事件循环中启动模拟服务，返回 server 对象（server.port 为实际端口）"""
+    server = MockLLMServer(host, port, **kwargs)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    return server
+
+
+def launch_mock_server_process(latency=0.0, token_rate=0.0):
+    """
+    在独立进程中启动模拟服务（避免和被测代码争抢GIL），等它开始监听后返回。
+
+    Returns:
+        tuple: (subprocess.Popen, base_url)。用完后调用 process.terminate()。
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--port", str(port),
+                                "--latency", str(latency), "--token-rate", str(token_rate)], stdout=subprocess.DEVNULL)
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 chat/completions 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="每秒生成的分片数，0 表示不限速")
+    args = parser.parse_args()
+
+    async def serve():
+        server = MockLLMServer(args.host, args.port, args.latency, token_rate=args.token_rate)
+        await server.start()
+        print(f"Mock LLM server listening on http://{args.host}:{server.port}/v1", flush=True)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
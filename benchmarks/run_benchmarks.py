@@ -0,0 +1,266 @@
+# benchmarks/run_benchmarks.py
+# 离线基准测试套件：本地模拟LLM服务 + 多名脚本化玩家 + 热点函数的微基准，结果写成JSON报告。
+#
+# 1. sessions: 多名玩家并发通过 /api/start_game、/api/chat（或 /api/chat/stream）、/api/save、/api/load
+#    完成若干轮对话，统计每个接口的延迟分位数与整体吞吐。
+# 2. micro: _find_path、_parse_llm_output、_format_history_for_prompt、_recall_memories、_build_prompt 以及各存储后端的存档/读档耗时。
+# 3. 指定 --baseline 时与之前的报告逐项比较，变慢超过 --tolerance 的指标会被标出。
+#
+# 用法:
+#   python benchmarks/run_benchmarks.py --players 8 --turns 10 --latency 0.05 --output report.json
+#   python benchmarks/run_benchmarks.py --baseline report.json --output report-new.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from benchmarks.bench_navigation import build_campus
+from benchmarks.mock_llm_server import DEFAULT_REPLY, launch_mock_server_process
+
+SCRIPT = ["你好", "今天社团招新好热闹啊", "你在烘焙社做什么呀？", "我也喜欢吃甜点", "周末有空吗",
+          "听说你会弹钢琴", "嗯", "哈哈，好呀", "最近学习累不累？", "那我们下次一起去吧"]
+
+
+def summarize(samples):
+    """毫秒样本 -> 分位数统计"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(pick(0.5), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+# ----------------------------------------------------------------------
+# 脚本化玩家会话
+# ----------------------------------------------------------------------
+def read_all(response):
+    """流式响应要读完整个事件流才算这一轮结束"""
+    response.get_data()
+    return response
+
+
+def run_sessions(args):
+    from web_app.app import app
+
+    latencies = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        response = fn()
+        latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{name} 返回 {response.status_code}")
+        return response
+
+    def play(player):
+        client = app.test_client()
+        rng = random.Random(player)
+        timed("start_game", lambda: client.post("/api/start_game"))
+        for turn in range(args.turns):
+            message = rng.choice(SCRIPT)
+            if args.stream:
+                timed("chat_stream", lambda: read_all(client.post("/api/chat/stream", json={"message": message})))
+            else:
+                timed("chat", lambda: client.post("/api/chat", json={"message": message}))
+            if (turn + 1) % args.save_every == 0:
+                slot = f"bench_{player}"
+                timed("save", lambda: client.post("/api/save", json={"slot": slot}))
+                timed("load", lambda: client.post("/api/load", json={"slot": slot}))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.players) as pool:
+        list(pool.map(play, range(args.players)))
+    elapsed = time.perf_counter() - start
+
+    turns = args.players * args.turns
+    return {
+        "players": args.players,
+        "turns_per_player": args.turns,
+        "wall_seconds": round(elapsed, 3),
+        "turns_per_second": round(turns / elapsed, 2),
+        "endpoints": {name: summarize(samples) for name, samples in sorted(latencies.items())},
+    }
+
+
+# ----------------------------------------------------------------------
+# 微基准
+# ----------------------------------------------------------------------
+def per_call_us(fn, repeat=5, min_time=0.2):
+    """自动选择调用次数，取多次重复的中位数，返回每次调用的微秒数"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return round(statistics.median(timer.repeat(repeat=repeat, number=number)) / number * 1e6, 3)
+
+
+def run_micro(args):
+    from Event_Engine import get_event_engine
+    from Game_Storage import CompactGameStorage, GameStorage
+    from Sqlite_Storage import SqliteGameStorage
+    from Su_Tang import GalGameAgent
+    from World_Data import WorldData
+
+    agent = GalGameAgent(is_new_game=True)
+    rng = random.Random(42)
+
+    # 寻路：在生成的校园地图上查询
+    campus = build_campus(10, 5, 20)
+    agent.world = WorldData(campus)
+    keys = list(campus)
+    queries = [(rng.choice(keys), rng.choice(keys)) for _ in range(256)]
+    query_iter = iter(queries * 100000)
+
+    # 历史：填满内存中的对话窗口
+    for i in range(agent.HISTORY_MEMORY_LIMIT):
+        agent.dialogue_history.append({"role": "user" if i % 2 == 0 else "assistant", "content": rng.choice(SCRIPT) * 3})
+    # 长期记忆：一局较长游戏积累的记忆量
+    agent.long_term_memory.extend(f"第{i}次聊天时，{rng.choice(SCRIPT)}" for i in range(300))
+    state = agent.export_state()
+
+    results = {
+        "find_path": per_call_us(lambda: agent._find_path(*next(query_iter))),
+        "event_walk_10": per_call_us(lambda: get_event_engine().walk(agent.rng, rng.sample(keys, 10), agent.game_state)),
+        "parse_llm_output": per_call_us(lambda: agent._parse_llm_output(DEFAULT_REPLY)),
+        "format_history_for_prompt": per_call_us(agent._format_history_for_prompt),
+        "recall_memories": per_call_us(lambda: agent._recall_memories(rng.choice(SCRIPT), "烘焙社", 300)),
+        "build_prompt": per_call_us(lambda: agent._build_prompt(rng.choice(SCRIPT))),
+    }
+
+    backends = {
+        "json": lambda d: GameStorage(d),
+        "compact": lambda d: CompactGameStorage(d),
+        "sqlite": lambda d: SqliteGameStorage(d),
+    }
+    for name, factory in backends.items():
+        storage = factory(tempfile.mkdtemp(prefix=f"bench_{name}_"))
+        counter = iter(range(10 ** 9))
+
+        def save_turn():
+            # 每次存档都在上一次的基础上多一轮对话，和游戏中的自动存档一致
+            data = json.loads(json.dumps(state))
+            data["history"].append({"role": "user", "content": f"turn {next(counter)}"})
+            storage.save_game(data, 1)
+
+        results[f"storage_{name}_save"] = per_call_us(save_turn, repeat=3)
+        results[f"storage_{name}_load"] = per_call_us(lambda: storage.load_game(1), repeat=3)
+    return {name: {"us_per_call": value} for name, value in results.items()}
+
+
+# ----------------------------------------------------------------------
+# 报告
+# ----------------------------------------------------------------------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def flatten(report):
+    """报告中所有“越小越好”的指标：名称 -> 数值"""
+    metrics = {}
+    for name, stats in report.get("sessions", {}).get("endpoints", {}).items():
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in stats:
+                metrics[f"sessions.{name}.{key}"] = stats[key]
+    for name, stats in report.get("micro", {}).items():
+        metrics[f"micro.{name}.us_per_call"] = stats["us_per_call"]
+    return metrics
+
+
+def compare(baseline, report, tolerance):
+    old, new = flatten(baseline), flatten(report)
+    rows = []
+    for name in sorted(new):
+        if name in old and old[name] > 0:
+            ratio = new[name] / old[name]
+            rows.append({"metric": name, "baseline": old[name], "current": new[name], "ratio": round(ratio, 3),
+                         "regression": ratio > 1 + tolerance})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试套件")
+    parser.add_argument("--players", type=int, default=8, help="并发玩家数")
+    parser.add_argument("--turns", type=int, default=10, help="每名玩家的对话轮数")
+    parser.add_argument("--save-every", type=int, default=5, help="每隔几轮存档并读档一次")
+    parser.add_argument("--stream", action="store_true", help="使用 /api/chat/stream 代替 /api/chat")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟LLM的首字节延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="模拟LLM每秒生成的分片数，0 表示不限速")
+    parser.add_argument("--skip-sessions", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", default="benchmark_report.json", help="JSON报告的输出路径")
+    parser.add_argument("--baseline", help="用于对比的旧报告")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="允许的变慢比例，超过即视为退化")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    # 所有存档写到临时目录，不影响真实存档
+    workdir = tempfile.mkdtemp(prefix="sutang_bench_")
+    os.chdir(workdir)
+    server, base_url = launch_mock_server_process(args.latency, args.token_rate)
+    os.environ["DEEPSEEK_API_BASE"] = base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+    try:
+        if not args.skip_sessions:
+            print("Running scripted sessions...")
+            report["sessions"] = run_sessions(args)
+        if not args.skip_micro:
+            print("Running micro-benchmarks...")
+            report["micro"] = run_micro(args)
+    finally:
+        server.terminate()
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(json.load(f), report, args.tolerance)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, stats in report.get("sessions", {}).get("endpoints", {}).items():
+        print(f"  {name:<14} p50 {stats['p50_ms']:>9.2f} ms   p95 {stats['p95_ms']:>9.2f} ms   p99 {stats['p99_ms']:>9.2f} ms")
+    if "sessions" in report:
+        print(f"  throughput: {report['sessions']['turns_per_second']} turns/s")
+    for name, stats in report.get("micro", {}).items():
+        print(f"  {name:<28} {stats['us_per_call']:>12.2f} us")
+    for row in report.get("comparison", []):
+        if row["regression"]:
+            print(f"  REGRESSION {row['metric']}: {row['baseline']} -> {row['current']} (x{row['ratio']})")
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# tests/conftest.py
+# 测试直接导入根目录下的模块（与 tools/、benchmarks/ 中的脚本相同）。
+# 用法:
+#   python -m pytest -q
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
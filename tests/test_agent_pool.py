@@ -0,0 +1,81 @@
+# tests/test_agent_pool.py
+# 会话池：每个会话一个 Agent，超过上限按 LRU 换出到存储，再次请求时换入。
+
+import types
+
+from Game_Storage import GameStorage
+from web_app.agent_pool import AgentPool
+
+
+class FakeAgent:
+    """只实现会话池用到的接口（导出/导入状态、估算内存的字段）"""
+
+    def __init__(self):
+        self.dialogue_history = []
+        self.long_term_memory = []
+        self.memory_index = types.SimpleNamespace(nbytes=0)
+        self.summary_pending = False
+
+    def say(self, text):
+        self.dialogue_history.append({"role": "user", "content": text})
+
+    def export_state(self):
+        return {"history": list(self.dialogue_history), "state": {}}
+
+    def import_state(self, data):
+        self.dialogue_history = list(data["history"])
+
+
+def make_pool(tmp_path, **kwargs):
+    created = []
+
+    def factory():
+        agent = FakeAgent()
+        created.append(agent)
+        return agent
+
+    pool = AgentPool(agent_factory=factory, storage=GameStorage(str(tmp_path)), **kwargs)
+    return pool, created
+
+
+def test_sessions_get_their_own_agent(tmp_path):
+    pool, _ = make_pool(tmp_path)
+    with pool.acquire("alice") as alice:
+        alice.say("你好")
+    with pool.acquire("bob") as bob:
+        assert bob is not alice
+        assert bob.dialogue_history == []
+    with pool.acquire("alice") as again:
+        assert again is alice
+
+
+def test_least_recently_used_session_is_swapped_out_and_back_in(tmp_path):
+    pool, created = make_pool(tmp_path, max_agents=2)
+    for session_id in ("a", "b"):
+        with pool.acquire(session_id) as agent:
+            agent.say(f"我是{session_id}")
+    with pool.acquire("a"):
+        pass  # a 变成最近使用的，b 最久没用
+    with pool.acquire("c") as agent:
+        agent.say("我是c")
+
+    stats = pool.stats()
+    assert stats["active_agents"] == 2
+    assert stats["swap_outs"] == 1
+    assert pool.storage.has_save("session_b")
+
+    with pool.acquire("b") as agent:
+        assert agent not in created[:2]  # 换入的是新对象，内容从存储恢复
+        assert agent.dialogue_history == [{"role": "user", "content": "我是b"}]
+    assert pool.stats()["swap_ins"] == 1
+
+
+def test_flush_all_writes_every_session_back(tmp_path):
+    pool, _ = make_pool(tmp_path)
+    for session_id in ("a", "b"):
+        with pool.acquire(session_id) as agent:
+            agent.say(session_id)
+    pool.flush_all()
+    assert pool.stats()["active_agents"] == 0
+    assert pool.storage.load_game("session_a")["history"] == [{"role": "user", "content": "a"}]
+    assert pool.storage.load_game("session_b")["history"] == [{"role": "user", "content": "b"}]
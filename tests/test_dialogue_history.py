@@ -0,0 +1,76 @@
+# tests/test_dialogue_history.py
+# 有界的对话历史：环形窗口、溢出到归档、翻页、存档恢复，以及时间线分叉时复制归档。
+
+import os
+import time
+
+from Dialogue_History import DialogueHistory, remove_unreferenced
+
+
+def message(i, role="user"):
+    return {"role": role, "content": f"第{i}句"}
+
+
+def filled(archive_dir, count, **kwargs):
+    history = DialogueHistory(str(archive_dir), window_size=4, max_in_memory=6, **kwargs)
+    for i in range(count):
+        history.append(message(i))
+    return history
+
+
+def test_old_messages_spill_to_the_archive(tmp_path):
+    history = filled(tmp_path, 10)
+    assert len(history) == 10
+    assert history.archived_count == 4
+    assert list(history) == [message(i) for i in range(4, 10)]
+    assert os.path.exists(os.path.join(tmp_path, f"{history.archive_id}.jsonl"))
+
+
+def test_prompt_window_keeps_only_recent_dialogue(tmp_path):
+    history = filled(tmp_path, 10)
+    history.append({"role": "system", "content": "事件"})
+    assert history.prompt_window() == [message(i) for i in range(6, 10)]
+
+
+def test_page_reads_across_the_archive_boundary(tmp_path):
+    history = filled(tmp_path, 10)
+    assert history.page(2, 4) == [message(i) for i in range(2, 6)]
+    assert history.page(8, 50) == [message(8), message(9)]
+    assert history.page(0, -5) == []
+
+
+def test_restore_continues_the_same_archive(tmp_path):
+    messages, archive = filled(tmp_path, 10).export()
+    restored = DialogueHistory.restore(messages, archive, str(tmp_path), window_size=4, max_in_memory=6)
+    for i in range(10, 14):
+        restored.append(message(i))
+    assert restored.archive_id == archive["id"]
+    assert restored.page(0, 14) == [message(i) for i in range(14)]
+
+
+def test_diverging_timelines_fork_the_archive(tmp_path):
+    messages, archive = filled(tmp_path, 10).export()
+    first = DialogueHistory.restore(messages, archive, str(tmp_path), window_size=4, max_in_memory=6)
+    second = DialogueHistory.restore(messages, archive, str(tmp_path), window_size=4, max_in_memory=6)
+    for i in range(10, 14):
+        first.append(message(i))
+    for i in range(10, 14):
+        second.append(message(i, role="assistant"))
+
+    assert second.archive_id != first.archive_id  # 共享的文件已被另一条时间线追加过
+    assert first.page(10, 2) == [message(10), message(11)]
+    assert second.page(10, 2) == [message(10, "assistant"), message(11, "assistant")]
+    assert second.page(0, 4) == [message(i) for i in range(4)]
+
+
+def test_remove_unreferenced_keeps_referenced_and_recent_archives(tmp_path):
+    kept = filled(tmp_path, 10)
+    orphan = filled(tmp_path, 10)
+    old = time.time() - 3600
+    for name in os.listdir(tmp_path):
+        os.utime(os.path.join(tmp_path, name), (old, old))
+    recent = filled(tmp_path, 10)
+
+    removed = remove_unreferenced(str(tmp_path), {kept.archive_id}, min_age=60)
+    assert removed == [os.path.join(str(tmp_path), f"{orphan.archive_id}.jsonl")]
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{h.archive_id}.jsonl" for h in (kept, recent))
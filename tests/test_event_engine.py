@@ -0,0 +1,93 @@
+# tests/test_event_engine.py
+# 随机事件：别名表的抽样比例、按地点和关系阶段分组、条件编译、固定种子可复现。
+
+import random
+from collections import Counter
+
+import pytest
+
+from Event_Engine import (EVENTS_PATH, AliasTable, Event, EventConfigError, EventEngine, compile_conditions,
+                          load_events)
+
+
+def frequencies(draw, n=40000):
+    counts = Counter(draw() for _ in range(n))
+    return {key: count / n for key, count in counts.items()}
+
+
+def test_alias_table_follows_weights():
+    rng = random.Random(1)
+    table = AliasTable(["a", "b", "c"], [1, 2, 7])
+    freq = frequencies(lambda: table.sample(rng))
+    assert freq["a"] == pytest.approx(0.1, abs=0.01)
+    assert freq["b"] == pytest.approx(0.2, abs=0.01)
+    assert freq["c"] == pytest.approx(0.7, abs=0.01)
+
+
+def test_nested_table_keeps_overall_weights():
+    rng = random.Random(2)
+    inner = AliasTable(["x", "y"], [1, 3])
+    table = AliasTable(["a", inner], [4, inner.total])
+    freq = frequencies(lambda: table.sample(rng))
+    assert freq["a"] == pytest.approx(0.5, abs=0.01)
+    assert freq["y"] == pytest.approx(0.375, abs=0.01)
+
+
+def test_compile_conditions():
+    predicate = compile_conditions({"closeness": ">= 40", "mood_today": ["happy", "calm"], "boredom_level": "< 5"})
+    assert predicate({"closeness": 40, "mood_today": "happy", "boredom_level": 0})
+    assert not predicate({"closeness": 39, "mood_today": "happy", "boredom_level": 0})
+    assert not predicate({"closeness": 80, "mood_today": "sad", "boredom_level": 0})
+    assert not predicate({"mood_today": "happy", "boredom_level": 0})  # 缺失的字段不满足数值比较
+    with pytest.raises(EventConfigError):
+        compile_conditions({"closeness": ">= 很多"})
+
+
+def test_event_rejects_bad_definitions():
+    with pytest.raises(EventConfigError):
+        Event("bad", "路过{place}", weight=1)
+    with pytest.raises(EventConfigError):
+        Event("bad", "路过{waypoint}", weight=0)
+    with pytest.raises(EventConfigError):
+        EventEngine([Event("same", "a"), Event("same", "b")])
+
+
+def make_engine():
+    return EventEngine([
+        Event("anywhere", "路过{waypoint}时起风了"),
+        Event("canteen", "食堂飘来饭香", locations=["canteen"], weight=3),
+        Event("friends", "苏糖挽住了你的手", relationship_states=["好朋友"]),
+        Event("happy", "苏糖哼起了歌", conditions={"mood_today": "happy"}),
+    ], trigger_rate=1.0)
+
+
+def test_roll_respects_location_and_relationship():
+    engine, rng = make_engine(), random.Random(3)
+    state = {"relationship_state": "朋友", "mood_today": "calm"}
+    rolls = [engine.roll(rng, "library", state) for _ in range(200)]
+    assert {event.id for event in rolls if event} == {"anywhere"}  # 重抽都不满足条件时不触发
+    seen = {engine.roll(rng, "canteen", {**state, "relationship_state": "好朋友", "mood_today": "happy"}).id
+            for _ in range(400)}
+    assert seen == {"anywhere", "canteen", "friends", "happy"}
+
+
+def test_walk_is_reproducible_with_the_same_seed():
+    state = {"relationship_state": "好朋友", "mood_today": "happy"}
+    route = ["library", "canteen", "playground"] * 5
+    first = [(loc, e.id) for loc, e in make_engine().walk(random.Random(7), route, state)]
+    second = [(loc, e.id) for loc, e in make_engine().walk(random.Random(7), route, state)]
+    assert first == second and len(first) == len(route)
+
+
+def test_zero_trigger_rate_never_fires():
+    engine = EventEngine([Event("a", "a")], trigger_rate=0.0)
+    assert engine.walk(random.Random(0), ["canteen"] * 50, {}) == []
+    assert engine.stats()["waypoints"] == 50
+
+
+@pytest.mark.skipif(not EVENTS_PATH.exists(), reason="没有 config/events.yaml")
+def test_bundled_events_load():
+    events, rate = load_events(EVENTS_PATH)
+    engine = EventEngine(events, rate)
+    engine.warm_up()
+    assert engine.stats()["events"] == len(events) > 0
@@ -0,0 +1,77 @@
+# tests/test_game_state.py
+# 带版本号的游戏状态：提交版本、按客户端版本生成 JSON Patch、整体替换后的新时间线、ETag。
+
+from Game_State import GameState
+
+
+def apply(state, patch):
+    """客户端一侧：把 JSON Patch 应用到本地的状态副本"""
+    state = dict(state)
+    for op in patch:
+        key = op["path"][1:].replace("~1", "/").replace("~0", "~")
+        if op["path"] == "":
+            state = dict(op["value"])
+        elif op["op"] == "remove":
+            del state[key]
+        else:
+            state[key] = op["value"]
+    return state
+
+
+def test_commit_bumps_version_only_when_changed():
+    state = GameState({"closeness": 30, "mood_today": "calm"}, version=10)
+    assert state.commit() == 10
+    state["closeness"] = 30  # 相同的值不算修改
+    assert state.commit() == 10
+    state["closeness"] = 32
+    assert state.commit() == 11
+
+
+def test_patch_since_returns_only_later_changes():
+    state = GameState({"closeness": 30, "mood_today": "calm", "a/b": 1}, version=10)
+    client = dict(state)
+    state["closeness"] = 32
+    v1 = state.commit()
+    state["mood_today"] = "happy"
+    state["a/b"] = 2
+    del state["closeness"]
+    patch = state.patch_since(v1)
+    assert {op["path"] for op in patch} == {"/mood_today", "/a~1b", "/closeness"}
+    assert {op["op"] for op in patch if op["path"] == "/closeness"} == {"remove"}
+    assert apply(client, state.patch_since(10)) == dict(state)
+    assert state.patch_since(state.version) == []
+
+
+def test_in_place_changes_need_touch():
+    state = GameState({"topics": []}, version=1)
+    state["topics"].append("猫")
+    assert state.patch_since(1) == []
+    state.touch("topics")
+    assert state.patch_since(1) == [{"op": "add", "path": "/topics", "value": ["猫"]}]
+
+
+def test_unknown_versions_get_the_whole_state():
+    state = GameState({"closeness": 30}, version=10)
+    state["closeness"] = 31
+    for since in (None, 9, 999):
+        assert state.patch_since(since) == [{"op": "replace", "path": "", "value": {"closeness": 31}}]
+
+
+def test_reset_starts_a_new_timeline():
+    state = GameState({"closeness": 30}, version=10)
+    state["closeness"] = 50
+    old = state.commit()
+    state.reset({"closeness": 20})
+    assert state.version > old
+    assert state.patch_since(old)[0]["path"] == ""  # 旧时间线上的版本拿到整个状态
+    assert state.patch_since(state.version) == []
+
+    state.reset({"closeness": 40}, version=old)  # 换入同一局游戏：沿用存档中的版本号
+    assert state.version == old and state.patch_since(old) == []
+
+
+def test_etag_commits_pending_changes():
+    state = GameState({"closeness": 30}, version=5)
+    assert state.etag == '"5"'
+    state["closeness"] = 31
+    assert state.etag == '"6"'
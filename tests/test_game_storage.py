@@ -0,0 +1,94 @@
+# tests/test_game_storage.py
+# 紧凑存档格式：快照 + 增量日志的往返、合并快照、写到一半的记录、分叉后的完整快照，以及旧版 JSON 存档。
+
+import json
+import os
+
+from Game_Storage import CompactGameStorage
+
+
+def game(turns, **state):
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"第{i}句"} for i in range(turns)]
+    memories = [f"第{i}天和苏糖在图书馆自习，聊到了期末考试和寒假计划" for i in range(200)]  # 快照要比几条增量大
+    return {"history": history, "long_term_memory": memories,
+            "state": {"closeness": 30 + turns, **state}}
+
+
+def saved(storage, slot, data):
+    assert storage.save_game(json.loads(json.dumps(data)), slot)  # 传副本：save_game 会写入 meta
+    return data
+
+
+def same_content(loaded, data):
+    return {k: v for k, v in loaded.items() if k not in ("meta", "history_archive")} == data
+
+
+def test_incremental_saves_round_trip(tmp_path):
+    storage = CompactGameStorage(str(tmp_path), fsync=False)
+    for turns in range(1, 8):
+        data = saved(storage, 1, game(turns, mood_today="happy" if turns % 2 else "calm"))
+    assert os.path.exists(os.path.join(tmp_path, "save_1.delta"))
+    assert same_content(storage.load_game(1), data)
+    assert same_content(CompactGameStorage(str(tmp_path)).load_game(1), data)  # 新实例（重启后）读取
+
+
+def test_deltas_are_compacted_into_a_new_snapshot(tmp_path):
+    storage = CompactGameStorage(str(tmp_path), compact_every=3, fsync=False)
+    for turns in range(1, 5):  # 1 份快照 + 3 条增量
+        data = saved(storage, 1, game(turns))
+    assert os.path.exists(os.path.join(tmp_path, "save_1.delta"))
+    data = saved(storage, 1, game(5))
+    assert not os.path.exists(os.path.join(tmp_path, "save_1.delta"))
+    assert same_content(storage.load_game(1), data)
+    data = saved(storage, 1, game(6))
+    assert os.path.exists(os.path.join(tmp_path, "save_1.delta"))
+    assert same_content(storage.load_game(1), data)
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    storage = CompactGameStorage(str(tmp_path), fsync=False)
+    saved(storage, 1, game(2))
+    data = saved(storage, 1, game(3))
+    saved(storage, 1, game(4))
+    path = os.path.join(tmp_path, "save_1.delta")
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - 5)  # 最后一条记录写到一半时崩溃
+    assert same_content(storage.load_game(1), data)
+
+
+def test_diverging_history_writes_a_full_snapshot(tmp_path):
+    storage = CompactGameStorage(str(tmp_path), fsync=False)
+    saved(storage, 1, game(6))
+    branch = game(4)
+    branch["history"][-1]["content"] = "读档后换了一句"
+    data = saved(storage, 1, branch)
+    assert not os.path.exists(os.path.join(tmp_path, "save_1.delta"))
+    assert same_content(storage.load_game(1), data)
+
+
+def test_slot_written_by_another_instance_is_not_extended_blindly(tmp_path):
+    first = CompactGameStorage(str(tmp_path), fsync=False)
+    second = CompactGameStorage(str(tmp_path), fsync=False)
+    saved(first, 1, game(2))
+    saved(second, 1, game(5, current_location="canteen"))
+    data = saved(first, 1, game(3))
+    assert same_content(second.load_game(1), data)
+
+
+def test_delta_cache_is_bounded(tmp_path):
+    storage = CompactGameStorage(str(tmp_path), fsync=False, cache_slots=2)
+    for slot in range(5):
+        saved(storage, slot, game(2))
+    assert len(storage._slot_cache) == 2
+    data = saved(storage, 0, game(3))  # 缓存已被挤掉：写完整快照
+    assert same_content(storage.load_game(0), data)
+
+
+def test_legacy_json_saves_are_still_readable(tmp_path):
+    data = game(3)
+    with open(os.path.join(tmp_path, "save_old.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    storage = CompactGameStorage(str(tmp_path), fsync=False)
+    assert storage.has_save("old")
+    assert same_content(storage.load_game("old"), data)
+    assert sorted(storage.list_saves()) == ["save_old.json"]
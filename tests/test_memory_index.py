@@ -0,0 +1,62 @@
+# tests/test_memory_index.py
+# 长期记忆检索：相关性排序、按时间顺序返回、token 预算，以及向量文件的导出与恢复。
+
+import os
+
+from Memory_Index import MemoryIndex
+
+MEMORIES = [
+    "第一次在图书馆遇见苏糖，她在看一本推理小说",
+    "苏糖说她养了一只叫年糕的橘猫",
+    "一起在食堂吃了麻辣香锅，苏糖不太能吃辣",
+    "苏糖期末考试数学考得不好，有点沮丧",
+    "周末去操场散步，聊到了她的猫年糕最近变胖了",
+    "苏糖喜欢下雨天待在图书馆里",
+]
+
+
+def test_search_returns_relevant_memories_in_order(tmp_path):
+    index = MemoryIndex(str(tmp_path))
+    found = index.search(MEMORIES, "你的猫年糕还好吗", top_k=2, token_budget=1000)
+    assert found == [MEMORIES[1], MEMORIES[4]]  # 按原有的时间顺序
+
+
+def test_search_respects_token_budget(tmp_path):
+    index = MemoryIndex(str(tmp_path))
+    assert index.search(MEMORIES, "图书馆", top_k=5, token_budget=0) == []
+    assert len(index.search(MEMORIES, "图书馆", top_k=5, token_budget=1000)) == 5
+
+
+def test_new_memories_are_indexed_incrementally(tmp_path):
+    index = MemoryIndex(str(tmp_path))
+    memories = list(MEMORIES[:3])
+    index.search(memories, "猫", top_k=1, token_budget=1000)
+    memories.append("苏糖答应下次带年糕的照片给我看")
+    assert index.search(memories, "照片", top_k=1, token_budget=1000) == [memories[-1]]
+
+
+def test_export_and_restore(tmp_path):
+    memories = list(MEMORIES)
+    index = MemoryIndex(str(tmp_path))
+    archive = index.export(memories)
+    assert archive["count"] == len(memories)
+    assert os.listdir(tmp_path)
+
+    restored = MemoryIndex.restore(memories, archive, str(tmp_path))
+    query = "下雨天去图书馆"
+    assert restored.search(memories, query, top_k=2, token_budget=1000) == \
+        index.search(memories, query, top_k=2, token_budget=1000)
+
+    # 继续游戏后只追加到同一个文件
+    memories.append("苏糖推荐了一本新的推理小说")
+    exported = restored.export(memories)
+    assert (exported["id"], exported["count"]) == (archive["id"], len(memories))
+
+
+def test_restore_rebuilds_when_the_file_is_missing(tmp_path):
+    archive = MemoryIndex(str(tmp_path)).export(MEMORIES)
+    for name in os.listdir(tmp_path):
+        os.remove(os.path.join(tmp_path, name))
+    restored = MemoryIndex.restore(MEMORIES, archive, str(tmp_path))
+    assert restored.search(MEMORIES, "麻辣香锅", top_k=1, token_budget=1000) == [MEMORIES[2]]
+    assert restored.export(MEMORIES)["id"] != archive["id"]
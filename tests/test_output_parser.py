@@ -0,0 +1,66 @@
+# tests/test_output_parser.py
+# 模型输出解析：流式切分（标签被切断在两个片段之间）、完整解析、分析JSON的类型校验。
+
+import pytest
+
+from Output_Parser import Analysis, AnalysisError, ResponseStreamParser, parse_llm_output
+
+OUTPUT = ('<analysis>{"affection_delta": 2, "boredom_delta": -1, "mood_change": "happy", '
+          '"triggered_topics": ["猫"], "suggested_action": null}</analysis>\n'
+          '<response>  嗯……我也喜欢猫。</response>')
+
+
+def stream(text, size):
+    parser = ResponseStreamParser()
+    shown = "".join(parser.feed(text[i:i + size]) for i in range(0, len(text), size)) + parser.close()
+    return parser, shown
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 11, len(OUTPUT)])
+def test_stream_shows_only_the_response(size):
+    parser, shown = stream(OUTPUT, size)
+    assert shown == "嗯……我也喜欢猫。"
+    assert parser.text == OUTPUT
+    assert '"affection_delta": 2' in parser.analysis_text
+
+
+def test_response_without_tags_follows_the_analysis():
+    _, shown = stream('<analysis>{"affection_delta": 0}</analysis>  好吧。', 4)
+    assert shown == "好吧。"
+
+
+def test_unfinished_analysis_is_never_shown():
+    parser, shown = stream('<analysis>{"affection_delta": 1, "thought', 5)
+    assert shown == ""
+    assert parser.analysis_text is None
+
+
+def test_parse_full_output():
+    analysis_text, response = parse_llm_output(OUTPUT)
+    assert response == "嗯……我也喜欢猫。"
+    analysis = Analysis.decode(analysis_text)
+    assert (analysis.affection_delta, analysis.boredom_delta, analysis.mood_change) == (2, -1, "happy")
+    assert analysis.triggered_topics == ("猫",)
+    assert analysis.suggested_action is None
+
+
+def test_decode_accepts_signed_strings_and_actions():
+    analysis = Analysis.decode('{"affection_delta": "+2", "boredom_delta": 3.0, '
+                               '"suggested_action": {"type": "propose_location_change", "target_location_key": "library"}}')
+    assert (analysis.affection_delta, analysis.boredom_delta) == (2, 3)
+    assert analysis.suggested_action.target_location_key == "library"
+
+
+@pytest.mark.parametrize("text", [
+    "没有JSON",
+    '{"affection_delta": 1,}',
+    '{"affection_delta": true}',
+    '{"affection_delta": "很多"}',
+    '{"mood_change": 3}',
+    '{"triggered_topics": "猫"}',
+    '{"suggested_action": "go"}',
+    '{"suggested_action": {"target_location_key": "library"}}',
+])
+def test_decode_rejects_bad_fields(text):
+    with pytest.raises(AnalysisError):
+        Analysis.decode(text)
@@ -0,0 +1,83 @@
+# tests/test_sqlite_storage.py
+# SQLite 存档：往返读写、只插入新增的历史消息、归档偏移、按所有者列出存档。
+
+import json
+import sqlite3
+
+from Sqlite_Storage import SqliteGameStorage
+
+
+def game(turns, archived=0, **state):
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"第{i}句"}
+               for i in range(archived, turns)]
+    data = {"history": history, "long_term_memory": ["一起去了图书馆"],
+            "state": {"closeness": 30 + turns, "relationship_state": "朋友", **state}}
+    if archived:
+        data["history_archive"] = {"id": "abc.jsonl", "count": archived}
+    return data
+
+
+def saved(storage, slot, data, owner=None):
+    assert storage.save_game(json.loads(json.dumps(data)), slot, owner)
+    return data
+
+
+def test_save_and_load_round_trip(tmp_path):
+    storage = SqliteGameStorage(str(tmp_path))
+    data = saved(storage, 1, game(5, current_location="library"))
+    loaded = storage.load_game(1)
+    assert loaded["history"] == data["history"]
+    assert loaded["state"] == data["state"]
+    assert loaded["long_term_memory"] == data["long_term_memory"]
+    assert storage.has_save(1) and not storage.has_save(2)
+
+
+def test_only_new_messages_are_inserted(tmp_path):
+    storage = SqliteGameStorage(str(tmp_path))
+    saved(storage, 1, game(4))
+    conn = sqlite3.connect(storage.db_path)
+    # 标记已有的行（最后一条用来判断是否接得上，保持不变）
+    conn.execute("UPDATE history SET content = content || '（旧行）' WHERE slot='1' AND seq < 3")
+    conn.commit()
+    conn.close()
+    saved(storage, 1, game(6))
+    contents = [content for _, content in storage.iter_history(1)]
+    assert contents == ["第0句（旧行）", "第1句（旧行）", "第2句（旧行）", "第3句", "第4句", "第5句"]
+
+
+def test_rewritten_history_replaces_old_rows(tmp_path):
+    storage = SqliteGameStorage(str(tmp_path))
+    saved(storage, 1, game(6))
+    branch = game(4)
+    branch["history"][-1]["content"] = "读档后换了一句"
+    saved(storage, 1, branch)
+    assert storage.load_game(1)["history"] == branch["history"]
+
+
+def test_iter_history_pages(tmp_path):
+    storage = SqliteGameStorage(str(tmp_path))
+    saved(storage, 1, game(10))
+    assert [content for _, content in storage.iter_history(1, offset=3, limit=2)] == ["第3句", "第4句"]
+
+
+def test_archived_messages_are_not_kept(tmp_path):
+    storage = SqliteGameStorage(str(tmp_path))
+    saved(storage, 1, game(8))
+    data = saved(storage, 1, game(10, archived=4))
+    loaded = storage.load_game(1)
+    assert loaded["history"] == data["history"]
+    assert loaded["history_archive"] == {"id": "abc.jsonl", "count": 4}
+    assert storage.list_save_info()[0]["history_count"] == 10
+
+
+def test_save_list_is_per_owner(tmp_path):
+    storage = SqliteGameStorage(str(tmp_path))
+    saved(storage, 1, game(2), owner="alice")
+    saved(storage, 2, game(3, current_location="canteen"), owner="alice")
+    saved(storage, 1, game(4), owner="bob")
+    info = storage.list_save_info("alice")
+    assert [item["slot"] for item in info] == ["2", "1"]  # 新的在前
+    assert info[0]["current_location"] == "canteen"
+    assert storage.list_saves("bob") == ["save_1"]
+    assert storage.load_game(1, "bob")["state"]["closeness"] == 34
+    assert not storage.has_save(2, "bob")
@@ -0,0 +1,228 @@
+# tools/build_assets.py
+# 构建静态资源：部署前运行一次，生成 web_app/static/dist/ 和 manifest.json，由 web_app/assets.py 提供服务。
+#
+# 1. 背景图：用 create_background.py 按 BACKGROUND_WIDTHS 中的每个宽度直接绘制，输出 AVIF/WebP/JPEG。
+# 2. 角色立绘等图片：按页面上的显示高度输出 1x/2x 两种尺寸，同样有 AVIF/WebP/JPEG。
+# 3. CSS/JS 等文本文件：CSS 中的 url() 换成带哈希的文件名，再预先压缩成 .br（安装了 brotli 时）和 .gz。
+# 4. 所有文件名都带内容的哈希，manifest.json 记录 原始路径 -> 构建产物 的对应关系。
+#
+# 构建依赖 Pillow 和 brotli 见 requirements-build.txt，缺少时直接报错退出。加 --allow-missing 时降级构建：
+# 没有 Pillow 就跳过图片的缩放与转码（图片按原样加上哈希），没有 brotli 就只生成 .gz。
+# Pillow 不支持 AVIF 时只输出 WebP/JPEG（会给出警告）。
+# 旧的构建产物默认保留（还在使用旧页面的浏览器仍能取到），加 --clean 删除 manifest 不再引用的文件。
+#
+# 用法:
+#   pip install -r requirements-build.txt
+#   python tools/build_assets.py
+#   python tools/build_assets.py --clean
+#   python tools/build_assets.py --allow-missing
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+from io import BytesIO
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from web_app.assets import DIST_DIR, MANIFEST_PATH
+
+STATIC_DIR = os.path.join(ROOT_DIR, "web_app", "static")
+TEXT_ASSETS = ["css/style.css", "js/main.js"]
+FILE_ASSETS = ["images/favicon.ico", "images/icon.png"]
+PICTURES = {"images/SuTang.jpg": 380}  # 图片 -> 页面上的最大显示高度（CSS像素）
+BACKGROUND = "images/school_bg.jpg"
+BACKGROUND_WIDTHS = (1280, 1920, 2560)
+COMPRESSIBLE = (".css", ".js", ".svg", ".ico", ".json", ".txt")
+QUALITY = {"avif": {"quality": 55}, "webp": {"quality": 80, "method": 6},
+           "jpeg": {"quality": 82, "optimize": True, "progressive": True}}
+EXTENSIONS = {"avif": ".avif", "webp": ".webp", "jpeg": ".jpg"}
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+class AssetBuilder:
+    def __init__(self, dist_dir=DIST_DIR):
+        """
+        初始化 AssetBuilder。
+
+        Args:
+            dist_dir (str): 构建产物的输出目录。
+        """
+        self.dist_dir = dist_dir
+        self.manifest = {"files": {}, "encodings": {}, "images": {}, "backgrounds": {}}
+        self.sizes = []  # (原始路径, 构建产物, 字节数)，用于打印报告
+        self.missing = []  # 没有安装的构建依赖：(包名, 缺少它的后果)
+        try:
+            import brotli
+            self.brotli = brotli
+        except ImportError:
+            self.brotli = None
+            self.missing.append(("brotli", "CSS/JS 只生成 .gz"))
+        try:
+            from PIL import Image, features
+            self.image_formats = [fmt for fmt in ("avif", "webp") if features.check(fmt)] + ["jpeg"]
+            self.Image = Image
+        except ImportError:
+            self.image_formats = []
+            self.Image = None
+            self.missing.append(("Pillow", "图片按原样输出，不生成背景图和其他尺寸/格式"))
+
+    def _write(self, name, data, source):
+        """写入一个带哈希的构建产物，返回它相对输出目录的路径"""
+        stem, ext = posixpath.splitext(name)
+        hashed = f"{stem}.{content_hash(data)}{ext}"
+        path = os.path.join(self.dist_dir, *hashed.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        self.sizes.append((source, hashed, len(data)))
+        if ext in COMPRESSIBLE:
+            self._precompress(hashed, path, data)
+        return hashed
+
+    def _precompress(self, hashed, path, data):
+        """预先压缩成 .br / .gz，只保留明显变小的版本"""
+        variants = []
+        if self.brotli is not None:
+            variants.append(("br", ".br", self.brotli.compress(data, quality=11)))
+        variants.append(("gzip", ".gz", gzip.compress(data, compresslevel=9, mtime=0)))
+        for encoding, suffix, compressed in variants:
+            if len(compressed) < len(data) * 0.9:
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+                self.manifest["encodings"].setdefault(hashed, []).append(encoding)
+                self.sizes.append((f"  {encoding}", hashed + suffix, len(compressed)))
+
+    def _encode(self, image, fmt):
+        buffer = BytesIO()
+        image.save(buffer, format=fmt.upper(), **QUALITY[fmt])
+        return buffer.getvalue()
+
+    # --- 各类资源 ---
+    def add_file(self, name):
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            self.manifest["files"][name] = self._write(name, f.read(), name)
+
+    def add_text(self, name):
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            data = f.read()
+        if name.endswith(".css"):
+            data = self._rewrite_css_urls(name, data.decode("utf-8")).encode("utf-8")
+        self.manifest["files"][name] = self._write(name, data, name)
+
+    def _rewrite_css_urls(self, name, css):
+        """CSS 中引用的已构建文件换成带哈希的文件名（构建产物保持原来的目录结构，相对路径不变）"""
+        base = posixpath.dirname(name)
+
+        def replace(match):
+            url = match.group(2)
+            if url.startswith(("data:", "http:", "https:", "/", "#")):
+                return match.group(0)
+            target = posixpath.normpath(posixpath.join(base, url))
+            hashed = self.manifest["files"].get(target)
+            return f'url("{posixpath.relpath(hashed, base)}")' if hashed else match.group(0)
+        return _CSS_URL.sub(replace, css)
+
+    def add_picture(self, name, display_height):
+        """按显示高度输出 1x/2x 两种尺寸的各种格式"""
+        self.add_file(name)  # 原始文件仍然可以通过 asset_url 引用
+        if self.Image is None:
+            return
+        source = self.Image.open(os.path.join(STATIC_DIR, name)).convert("RGB")
+        stem = posixpath.splitext(name)[0]
+        variants = {}
+        for fmt in self.image_formats:
+            for density in (1, 2):
+                height = min(display_height * density, source.height)
+                image = source.resize((round(source.width * height / source.height), height), self.Image.LANCZOS)
+                hashed = self._write(f"{stem}-{height}h{EXTENSIONS[fmt]}", self._encode(image, fmt), name)
+                variants.setdefault(fmt, []).append([f"{density}x", hashed])
+                if height == source.height:
+                    break  # 原图不够2x的高度
+        self.manifest["images"][name] = variants
+
+    def add_background(self, name, widths):
+        """用 create_background.py 按每个宽度绘制背景图，输出各种格式"""
+        if self.Image is None:
+            return
+        from web_app.static.images.create_background import draw_school_background
+        stem = posixpath.splitext(name)[0]
+        steps = []
+        for i, width in enumerate(widths):
+            image = draw_school_background(width)
+            formats = {fmt: self._write(f"{stem}-{width}{EXTENSIONS[fmt]}", self._encode(image, fmt), name)
+                       for fmt in self.image_formats}
+            # 视口宽度超过上一档的宽度时换用这一档
+            steps.append({"min_width": widths[i - 1] + 1 if i else 0, "formats": formats})
+        self.manifest["backgrounds"][name] = steps
+
+    def build(self):
+        os.makedirs(self.dist_dir, exist_ok=True)
+        for name in FILE_ASSETS:
+            self.add_file(name)
+        for name, height in PICTURES.items():
+            self.add_picture(name, height)
+        self.add_background(BACKGROUND, BACKGROUND_WIDTHS)
+        for name in TEXT_ASSETS:  # 最后处理，CSS 才能引用到上面的文件
+            self.add_text(name)
+        tmp = MANIFEST_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, MANIFEST_PATH)
+        return self.manifest
+
+    def clean(self):
+        """删除 manifest 不再引用的旧构建产物"""
+        keep = {os.path.basename(MANIFEST_PATH)}
+        for _, hashed, _ in self.sizes:
+            keep.add(hashed)
+        removed = 0
+        for folder, _, files in os.walk(self.dist_dir):
+            for filename in files:
+                rel = os.path.relpath(os.path.join(folder, filename), self.dist_dir).replace(os.sep, "/")
+                if rel not in keep:
+                    os.remove(os.path.join(folder, filename))
+                    removed += 1
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建带哈希文件名、预压缩的静态资源")
+    parser.add_argument("--clean", action="store_true", help="删除 manifest 不再引用的旧构建产物")
+    parser.add_argument("--allow-missing", action="store_true", help="缺少 Pillow/brotli 时仍然构建（降级，不推荐用于部署）")
+    args = parser.parse_args()
+
+    builder = AssetBuilder()
+    if builder.missing:
+        details = "；".join(f"{name}（{effect}）" for name, effect in builder.missing)
+        if not args.allow_missing:
+            print(f"[ASSETS] 错误：缺少构建依赖 {details}。\n"
+                  f"         请运行 pip install -r requirements-build.txt，或加 --allow-missing 构建降级的版本。", file=sys.stderr)
+            return 1
+        print(f"[ASSETS] 警告：缺少构建依赖，降级构建 —— {details}", file=sys.stderr)
+    if builder.Image is not None and "avif" not in builder.image_formats:
+        print("[ASSETS] 警告：当前 Pillow 不支持 AVIF，图片只输出 WebP/JPEG", file=sys.stderr)
+    builder.build()
+    for source, hashed, size in builder.sizes:
+        original = os.path.getsize(os.path.join(STATIC_DIR, source)) if not source.startswith(" ") \
+            and os.path.exists(os.path.join(STATIC_DIR, source)) else None
+        print(f"{source:<24} -> {hashed:<48} {size:>10,} B" + (f"  (原始 {original:,} B)" if original else ""))
+    if args.clean:
+        print(f"已删除 {builder.clean()} 个旧文件")
+    print(f"manifest: {os.path.relpath(MANIFEST_PATH, ROOT_DIR)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
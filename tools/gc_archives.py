@@ -0,0 +1,67 @@
+# tools/gc_archives.py
+# 清理没有任何存档引用的归档文件：对话历史归档 (history/*.jsonl) 和记忆向量文件 (memory_index/*.u16，以及旧版的 *.u8)。
+# 归档文件只追加、可以被多个存档共享，时间线分叉、存档被覆盖或会话换出后又换入时会留下没人引用的旧文件。
+# 引用关系取自所有给出的存档目录（玩家存档和会话存档都会引用同一个归档目录），
+# 紧凑格式、旧版 JSON 和 SQLite 存档都会被扫描，所有所有者都算在内。
+# 最近 --min-age 小时内修改过的文件不删除：还在内存中、尚未存档的 Agent 可能正在使用它们。
+#
+# 用法:
+#   python tools/gc_archives.py --dry-run
+#   python tools/gc_archives.py saves saves/sessions --min-age 24
+
+import argparse
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import Dialogue_History
+import Memory_Index
+from Game_Storage import CompactGameStorage
+from Sqlite_Storage import SqliteGameStorage
+
+# 存档字段 -> (归档目录名, 清理函数)
+ARCHIVES = {
+    "history_archive": ("history", Dialogue_History.remove_unreferenced),
+    "memory_index": ("memory_index", Memory_Index.remove_unreferenced),
+}
+
+
+def storages(save_dir, db_name):
+    """目录中可能存在的各种格式的存档：紧凑格式的存储也能读取旧版 JSON 存档"""
+    found = [CompactGameStorage(save_dir)]
+    if os.path.exists(os.path.join(save_dir, db_name)):
+        found.append(SqliteGameStorage(save_dir, db_name))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理没有存档引用的归档文件")
+    parser.add_argument("save_dirs", nargs="*", default=["saves", os.path.join("saves", "sessions")],
+                        help="引用归档的存档目录；归档位于第一个目录下")
+    parser.add_argument("--db-name", default="saves.sqlite3", help="SQLite 数据库文件名（位于存档目录下）")
+    parser.add_argument("--min-age", type=float, default=24, help="只删除至少这么多小时没有修改过的文件")
+    parser.add_argument("--dry-run", action="store_true", help="只列出，不删除")
+    args = parser.parse_args()
+
+    save_dirs = [d for d in args.save_dirs if os.path.isdir(d)]
+    if not save_dirs:
+        print("没有找到存档目录")
+        return 1
+    for field, (dirname, remove_unreferenced) in ARCHIVES.items():
+        referenced = set()
+        for save_dir in save_dirs:
+            for storage in storages(save_dir, args.db_name):
+                referenced |= storage.referenced_archives(field)
+        archive_dir = os.path.join(save_dirs[0], dirname)
+        removed = remove_unreferenced(archive_dir, referenced, min_age=args.min_age * 3600, dry_run=args.dry_run)
+        for path in removed:
+            print(f"[{'将删除' if args.dry_run else '已删除'}] {path}")
+        print(f"{archive_dir}: 存档引用 {len(referenced)} 个文件，{'可删除' if args.dry_run else '删除了'} {len(removed)} 个")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
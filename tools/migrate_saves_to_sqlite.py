@@ -0,0 +1,62 @@
+# tools/migrate_saves_to_sqlite.py
+# 把存档目录中的旧版 JSON 存档（save_*.json）和紧凑格式存档（save_*.snap）导入 SQLite 数据库。
+# 原文件不会被删除；重复运行时同名槽位会被覆盖。
+#
+# 用法:
+#   python tools/migrate_saves_to_sqlite.py saves
+#   python tools/migrate_saves_to_sqlite.py saves/sessions --owner ""
+
+import argparse
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from Game_Storage import CompactGameStorage
+from Sqlite_Storage import SqliteGameStorage
+
+
+def find_slots(save_dir):
+    """目录中的存档槽位 -> 文件类型，同一槽位两种格式都有时以紧凑格式为准"""
+    slots = {}
+    for filename in sorted(os.listdir(save_dir)):
+        name, ext = os.path.splitext(filename)
+        if name.startswith("save_") and ext in (".json", ".snap"):
+            slot = name[len("save_"):]
+            if slots.get(slot) != ".snap":
+                slots[slot] = ext
+    return slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将 JSON/紧凑格式存档导入 SQLite")
+    parser.add_argument("save_dir", help="存档目录")
+    parser.add_argument("--db-name", default="saves.sqlite3", help="数据库文件名（位于存档目录下）")
+    parser.add_argument("--owner", default="", help="导入后的存档所有者")
+    args = parser.parse_args()
+
+    target = SqliteGameStorage(args.save_dir, args.db_name, owner=args.owner)
+    compact = CompactGameStorage(args.save_dir)
+    migrated, failed = 0, 0
+    for slot, ext in find_slots(args.save_dir).items():
+        try:
+            if ext == ".json":
+                target.import_legacy_save(os.path.join(args.save_dir, f"save_{slot}.json"), slot)
+            else:
+                data = compact.load_game(slot)
+                if data is None:
+                    raise RuntimeError("读取失败")
+                target.import_save(data, slot)
+            migrated += 1
+            print(f"[OK] save_{slot}{ext}")
+        except Exception as e:
+            failed += 1
+            print(f"[失败] save_{slot}{ext}: {e}")
+
+    print(f"完成：导入 {migrated} 个存档，失败 {failed} 个 -> {target.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# tools/simulate_sessions.py
+# 无界面的批量模拟：在进程池中跑成千上万局脚本化或随机的玩家会话，用来调整数值，不必在浏览器里手动点。
+# 可以调整的数值包括关系阶段的亲密度阈值 (Su_Tang.RELATIONSHIP_THRESHOLDS)、移动途中的事件表和触发概率
+# (config/events.yaml) 和记忆总结的频率 (GalGameAgent.SUMMARY_TRIGGER_THRESHOLD)。
+#
+# 1. LLM 换成不联网的替身（默认 ScriptedLLM，--llm 模块:类名 可以换成自己的实现）：
+#    对话请求按 --affection 给出的分布抽取 affection_delta，总结请求返回一句固定的摘要。
+# 2. 每局会话的随机数种子由 --seed 和会话编号派生，同样的参数总能得到同样的结果。
+# 3. 会话按 --chunk 分块交给进程池，各进程之间没有共享状态，吞吐随核数线性增长。
+#    每块的结果以 NumPy 数组返回，最后汇总成报告：亲密度轨迹的分位数、关系阶段的转移次数和首次到达的轮数、
+#    路线长度、途中事件（总数和各事件的次数）和记忆条数。
+#
+# 用法:
+#   python tools/simulate_sessions.py --sessions 10000 --turns 40 --workers 8 --output sim.json
+#   python tools/simulate_sessions.py --thresholds 85,65,45 --event-rate 0.05 --summary-every 8
+#   python tools/simulate_sessions.py --events my_events.yaml --campus 10,5,20
+#   python tools/simulate_sessions.py --script player_lines.txt --locations config/locations.yaml
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+STATES = ("初始阶段", "朋友", "好朋友", "亲密关系")
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+DEFAULT_AFFECTION = "-2:1,-1:2,0:5,1:6,2:3,3:1"  # affection_delta:权重
+SIMULATED_REPLY = "嗯嗯，我也这么觉得！"
+SIMULATED_SUMMARY = "陈辰和苏糖聊了聊最近的事情。"
+
+PLAYER_LINES = [
+    "今天社团招新好热闹啊", "你在烘焙社做什么呀？", "我也喜欢吃甜点", "周末有空吗", "听说你会弹钢琴",
+    "最近学习累不累？", "那我们下次一起去吧", "你最喜欢什么口味的蛋糕？", "期中考试准备得怎么样了",
+    "昨天的社团活动你去了吗", "这家奶茶店新出了一款", "你平时喜欢看什么书", "下雨了，你带伞了吗",
+    "我做了一份曲奇，你要尝尝吗", "你觉得我穿这件好看吗", "今天有点不开心",
+]
+SHORT_LINES = ["你好", "嗯嗯", "好的", "谢谢", "哈哈哈", "拜拜"]
+
+
+def parse_weights(text):
+    """'-1:2,0:5,1:3' -> {-1: 2.0, 0: 5.0, 1: 3.0}"""
+    weights = {}
+    for item in text.split(","):
+        value, _, weight = item.partition(":")
+        weights[int(value)] = float(weight or 1)
+    return weights
+
+
+class ScriptedLLM:
+    """不联网的LLM替身：对话请求按分布抽取 affection_delta，总结请求返回固定的摘要"""
+
+    def __init__(self, affection=None, seed=0):
+        """
+        初始化 ScriptedLLM。
+
+        Args:
+            affection (dict, optional): affection_delta -> 权重；省略时使用 DEFAULT_AFFECTION。
+            seed (int): 随机数种子，每局会话开始时会用 reseed() 重新设置。
+        """
+        affection = affection or parse_weights(DEFAULT_AFFECTION)
+        self.deltas = list(affection)
+        self.cum_weights = list(itertools.accumulate(affection.values()))
+        self.rng = random.Random(seed)
+
+    def reseed(self, seed):
+        self.rng.seed(seed)
+
+    def _dialogue(self):
+        analysis = {"thought_process": "模拟", "affection_delta": self.rng.choices(self.deltas, cum_weights=self.cum_weights)[0],
+                    "boredom_delta": 0, "mood_change": "unchanged", "triggered_topics": [], "suggested_action": None}
+        return f"<analysis>{json.dumps(analysis, ensure_ascii=False)}</analysis>\n<response>{SIMULATED_REPLY}</response>"
+
+    def complete(self, body, timeout=None):
+        prompt = body["messages"][-1]["content"]
+        if "<analysis>" in prompt:
+            content = self._dialogue()
+        elif "## Conversation" in prompt:  # 批量总结
+            content = json.dumps([SIMULATED_SUMMARY] * prompt.count("## Conversation"), ensure_ascii=False)
+        else:
+            content = SIMULATED_SUMMARY
+        return {"choices": [{"message": {"content": content}}], "usage": {}}
+
+    def stream(self, body, timeout=None, on_usage=None):
+        yield self.complete(body, timeout)["choices"][0]["message"]["content"]
+
+    def usage_stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+def load_llm(spec, affection):
+    """--llm 的值 '模块:类名' -> 替身实例；类的构造函数接收 affection 参数"""
+    if not spec:
+        return ScriptedLLM(affection)
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)(affection=affection)
+
+
+# ----------------------------------------------------------------------
+# 工作进程
+# ----------------------------------------------------------------------
+_worker = {}
+
+
+def _init_worker(config, workdir):
+    """每个工作进程启动时调用一次：换成替身LLM和模拟用的地图，修改要调整的数值"""
+    os.chdir(workdir)  # Agent 的存档目录、对话归档都写到临时目录
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")  # Su_Tang 每轮都会打印日志
+    os.environ.update(SUTANG_SPECULATE="off", SUTANG_RESPONSE_CACHE="off", SUTANG_LLM_RATE="0")
+
+    import Su_Tang
+    from Event_Engine import EventEngine, get_event_engine, load_events, set_event_engine
+    from LLM_Client import set_llm_client
+    from World_Data import WorldData, get_world, read_locations, set_world
+
+    if config["thresholds"]:
+        Su_Tang.RELATIONSHIP_THRESHOLDS = tuple(zip(config["thresholds"], reversed(STATES[1:])))
+
+    llm = load_llm(config["llm"], parse_weights(config["affection"]))
+    set_llm_client(llm)
+    if config["locations"]:
+        world = WorldData(read_locations(config["locations"]))
+    elif config["campus"]:
+        from benchmarks.bench_navigation import build_campus
+        world = WorldData(build_campus(*config["campus"]))
+    else:
+        world = get_world()
+    set_world(world)
+    if config["events"]:
+        events, rate = load_events(config["events"])
+    else:
+        engine = get_event_engine()
+        events, rate = engine.events, engine.trigger_rate
+    engine = EventEngine(events, rate if config["event_rate"] is None else config["event_rate"])
+    set_event_engine(engine)
+
+    script = None
+    if config["script"]:
+        with open(config["script"], "r", encoding="utf-8") as f:
+            script = [line.strip() for line in f if line.strip()]
+    _worker.update(config=config, llm=llm, world=world, script=script, engine=engine)
+
+
+def _player_input(rng, turn, agent, keys, config):
+    """本轮玩家说的话：按脚本逐行，或者随机移动、说短句、聊天"""
+    script = _worker["script"]
+    if script:
+        return script[turn % len(script)]
+    roll = rng.random()
+    if roll < config["move_rate"] and len(keys) > 1:
+        target = rng.choice(keys)
+        if target != agent.game_state["current_location"]:
+            return f"我们去{agent.locations[target].get('name', target)}吧"
+    if roll < config["move_rate"] + config["short_rate"]:
+        return rng.choice(SHORT_LINES)
+    return rng.choice(PLAYER_LINES)
+
+
+def run_session(index):
+    """运行一局会话，返回 (亲密度轨迹, 关系阶段轨迹, 各次移动的路线长度, 途中事件数, 经过的中间地点数, 记忆条数)"""
+    from Memory_Summarizer import get_summary_queue
+    from Su_Tang import GalGameAgent
+
+    config, world = _worker["config"], _worker["world"]
+    seed = config["seed"] * 1_000_003 + index
+    rng = random.Random(seed)
+    _worker["llm"].reseed(seed + 1)
+    agent = GalGameAgent(is_new_game=True, seed=seed + 2)  # 途中事件、快速通道和备用回复
+    agent.SUMMARY_TRIGGER_THRESHOLD = config["summary_every"]
+    keys = list(world.locations)
+    if agent.game_state["current_location"] not in world.locations and keys:
+        agent.game_state["current_location"] = config["start"] or keys[0]
+
+    turns = config["turns"]
+    closeness = np.empty(turns + 1, dtype=np.int16)
+    states = np.empty(turns + 1, dtype=np.int8)
+    closeness[0], states[0] = agent.game_state["closeness"], STATE_INDEX[agent.game_state["relationship_state"]]
+    routes = []
+    engine = _worker["engine"]
+    events, waypoints = sum(engine.triggered.values()), engine.steps
+    queue = get_summary_queue()
+    for turn in range(turns):
+        before = agent.game_state["current_location"]
+        agent.chat(_player_input(rng, turn, agent, keys, config))
+        if agent.summary_pending:
+            queue.join()  # 总结在下一轮之前完成（与真实玩家的输入间隔相当），否则合并与否取决于线程调度，结果不可复现
+        after = agent.game_state["current_location"]
+        if after != before:
+            path = agent.navigation.find_path(before, after)
+            hops = len(path) - 1 if path else 1
+            routes.append(hops)
+        closeness[turn + 1] = agent.game_state["closeness"]
+        states[turn + 1] = STATE_INDEX[agent.game_state["relationship_state"]]
+    events, waypoints = sum(engine.triggered.values()) - events, engine.steps - waypoints
+    return closeness, states, routes, events, waypoints, len(agent.long_term_memory)
+
+
+def run_chunk(start, count):
+    """在工作进程中依次运行编号为 [start, start + count) 的会话，结果打包成数组"""
+    began = time.perf_counter()
+    triggered = dict(_worker["engine"].triggered)
+    results = [run_session(index) for index in range(start, start + count)]
+    by_event = {event_id: n - triggered.get(event_id, 0) for event_id, n in _worker["engine"].triggered.items()}
+    return {
+        "closeness": np.stack([r[0] for r in results]),
+        "states": np.stack([r[1] for r in results]),
+        "routes": np.fromiter(itertools.chain.from_iterable(r[2] for r in results), dtype=np.int32),
+        "events": np.array([r[3] for r in results], dtype=np.int32),
+        "waypoints": np.array([r[4] for r in results], dtype=np.int32),
+        "memories": np.array([r[5] for r in results], dtype=np.int32),
+        "by_event": {event_id: n for event_id, n in by_event.items() if n},
+        "seconds": time.perf_counter() - began,
+    }
+
+
+# ----------------------------------------------------------------------
+# 汇总
+# ----------------------------------------------------------------------
+def _percentiles(values, qs=(10, 50, 90)):
+    if not len(values):
+        return {}
+    return {f"p{q}": round(float(v), 2) for q, v in zip(qs, np.percentile(values, qs))}
+
+
+def aggregate(chunks, turns):
+    closeness = np.concatenate([c["closeness"] for c in chunks])
+    states = np.concatenate([c["states"] for c in chunks])
+    routes = np.concatenate([c["routes"] for c in chunks])
+    events = np.concatenate([c["events"] for c in chunks])
+    waypoints = np.concatenate([c["waypoints"] for c in chunks])
+    memories = np.concatenate([c["memories"] for c in chunks])
+    by_event = {}
+    for chunk in chunks:
+        for event_id, n in chunk["by_event"].items():
+            by_event[event_id] = by_event.get(event_id, 0) + n
+
+    checkpoints = np.unique(np.linspace(0, turns, num=min(turns, 10) + 1).astype(int))
+    trajectory = {int(t): dict(mean=round(float(closeness[:, t].mean()), 2), **_percentiles(closeness[:, t]))
+                  for t in checkpoints}
+
+    # 关系阶段：相邻两轮不同即为一次转移
+    before, after = states[:, :-1], states[:, 1:]
+    changed = before != after
+    transitions = np.zeros((len(STATES), len(STATES)), dtype=np.int64)
+    np.add.at(transitions, (before[changed], after[changed]), 1)
+    first_reached = {}
+    for i, state in enumerate(STATES):
+        reached = states == i
+        ever = reached.any(axis=1)
+        first_reached[state] = dict(ratio=round(float(ever.mean()), 4), **_percentiles(reached.argmax(axis=1)[ever]))
+    final = np.bincount(states[:, -1], minlength=len(STATES)) / len(states)
+
+    return {
+        "sessions": len(closeness),
+        "turns": turns,
+        "closeness": {"by_turn": trajectory, "final_histogram": np.bincount(closeness[:, -1], minlength=101).tolist()},
+        "relationship": {
+            "final_distribution": {state: round(float(p), 4) for state, p in zip(STATES, final)},
+            "first_reached_turn": first_reached,
+            "transitions": {f"{STATES[a]}->{STATES[b]}": int(transitions[a, b])
+                            for a, b in zip(*np.nonzero(transitions))},
+        },
+        "routes": {
+            "moves": int(routes.size),
+            "mean_length": round(float(routes.mean()), 3) if routes.size else 0.0,
+            **_percentiles(routes, (50, 95)),
+            "max_length": int(routes.max()) if routes.size else 0,
+            "length_histogram": np.bincount(routes).tolist() if routes.size else [],
+        },
+        "events": {
+            "total": int(events.sum()),
+            "per_move": round(float(events.sum() / routes.size), 4) if routes.size else 0.0,
+            "per_waypoint": round(float(events.sum() / waypoints.sum()), 4) if waypoints.sum() else 0.0,
+            "by_event": dict(sorted(by_event.items(), key=lambda item: -item[1])),
+        },
+        "memories": {"mean": round(float(memories.mean()), 2), "max": int(memories.max())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量模拟玩家会话")
+    parser.add_argument("--sessions", type=int, default=1000, help="模拟的会话数")
+    parser.add_argument("--turns", type=int, default=40, help="每局会话的轮数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="工作进程数")
+    parser.add_argument("--chunk", type=int, default=50, help="每个任务包含的会话数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--script", help="玩家台词文件（每行一句，按顺序循环），省略时随机生成玩家输入")
+    parser.add_argument("--move-rate", type=float, default=0.15, help="随机玩家每轮提出移动的概率")
+    parser.add_argument("--short-rate", type=float, default=0.1, help="随机玩家每轮说短句（打招呼、嗯、谢谢）的概率")
+    parser.add_argument("--affection", default=DEFAULT_AFFECTION, help="替身LLM给出的 affection_delta 分布，格式 值:权重,...")
+    parser.add_argument("--llm", help="自定义LLM替身，格式 模块:类名")
+    parser.add_argument("--thresholds", help="关系阶段的亲密度阈值（亲密关系,好朋友,朋友），例如 80,60,40")
+    parser.add_argument("--events", help="使用指定的 events.yaml（默认 config/events.yaml）")
+    parser.add_argument("--event-rate", type=float, help="移动时每个中间地点触发事件的概率（覆盖事件文件中的 trigger_rate）")
+    parser.add_argument("--summary-every", type=int, default=6, help="每多少条对话消息总结一次记忆")
+    parser.add_argument("--locations", help="使用指定的 locations.yaml")
+    parser.add_argument("--campus", help="使用生成的校园地图：楼数,层数,每层房间数，例如 10,5,20")
+    parser.add_argument("--start", help="起始地点key（默认地点不在地图中时使用，省略则取第一个地点）")
+    parser.add_argument("--output", help="把报告写成JSON文件")
+    args = parser.parse_args()
+
+    config = {
+        "turns": args.turns, "seed": args.seed, "script": args.script and os.path.abspath(args.script),
+        "move_rate": args.move_rate, "short_rate": args.short_rate, "affection": args.affection, "llm": args.llm,
+        "thresholds": [int(v) for v in args.thresholds.split(",")] if args.thresholds else None,
+        "events": args.events and os.path.abspath(args.events), "event_rate": args.event_rate, "summary_every": args.summary_every,
+        "locations": args.locations and os.path.abspath(args.locations),
+        "campus": [int(v) for v in args.campus.split(",")] if args.campus else None, "start": args.start,
+    }
+    if not config["locations"] and not config["campus"] and \
+            not os.path.exists(os.path.join(ROOT_DIR, "config", "locations.yaml")):
+        config["campus"] = [4, 3, 5]
+        print("未找到 config/locations.yaml，使用生成的校园地图 (--campus 4,3,5)。")
+
+    workdir = tempfile.mkdtemp(prefix="sutang_sim_")
+    chunks = [(start, min(args.chunk, args.sessions - start)) for start in range(0, args.sessions, args.chunk)]
+    results, done = [], 0
+    began = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(config, workdir)) as pool:
+            futures = [pool.submit(run_chunk, start, count) for start, count in chunks]
+            for future in as_completed(futures):
+                results.append(future.result())
+                done += len(results[-1]["events"])
+                print(f"\r{done}/{args.sessions} sessions", end="", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    elapsed = time.perf_counter() - began
+    print()
+
+    report = aggregate(results, args.turns)
+    report["run"] = {
+        "workers": args.workers,
+        "seconds": round(elapsed, 2),
+        "sessions_per_second": round(args.sessions / elapsed, 1),
+        "turns_per_second": round(args.sessions * args.turns / elapsed, 1),
+        "cpu_seconds": round(sum(r["seconds"] for r in results), 2),
+        "args": vars(args),
+    }
+
+    print(f"{report['sessions']} sessions x {args.turns} turns in {elapsed:.1f}s "
+          f"({report['run']['sessions_per_second']} sessions/s, {args.workers} workers)")
+    for turn, stats in report["closeness"]["by_turn"].items():
+        print(f"  closeness @ turn {turn:>4}: mean {stats['mean']:>6.2f}  p10 {stats['p10']:>6.1f}"
+              f"  p50 {stats['p50']:>6.1f}  p90 {stats['p90']:>6.1f}")
+    for state, stats in report["relationship"]["first_reached_turn"].items():
+        print(f"  {state}: reached by {stats['ratio']:.1%}" + (f", median turn {stats['p50']}" if "p50" in stats else ""))
+    routes = report["routes"]
+    print(f"  moves {routes['moves']}, mean route {routes['mean_length']} hops, "
+          f"events {report['events']['total']} ({report['events']['per_waypoint']:.3f} per waypoint)")
+    if report["events"]["by_event"]:
+        print("  events by id: " + ", ".join(f"{k} {v}" for k, v in report["events"]["by_event"].items()))
+    print(f"  memories per session: mean {report['memories']['mean']}, max {report['memories']['max']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+# web_app/agent_pool.py
+# 按会话隔离的 GalGameAgent 池
+# 每个浏览器会话拥有自己的 Agent，池子用 LRU 管理活跃 Agent：
+# 超过数量上限、内存上限或长时间空闲的会话会被换出到 GameStorage，下次请求时再换入。
+# 多进程部署时开启 write_through：每次请求结束都把会话写回共享存储，
+# 取用时如果存储中的版本比内存中的新（被其他进程处理过），就重新换入。
+# 同一会话的请求在所有进程间由锁文件 (flock) 串行，两个进程不会各自读出同一版本、各改各的、后写的覆盖先写的。
+# 单进程时请求结束只把会话标记为脏，由 web_app/autosave.py 在后台批量写回 (flush_dirty)。
+# 池的全局锁只保护会话表本身：创建/换入 Agent 和换出时的存储读写都在全局锁之外进行，
+# 一个会话的冷启动或换出不会阻塞其他玩家的请求。
+
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows：只支持单进程部署，不需要跨进程的锁
+    fcntl = None
+
+from Memory_Summarizer import get_summary_queue
+from Metrics import get_metrics
+
+
+class _PoolEntry:
+    """池中的一个会话：Agent 本体 + 会话锁 + 最近访问时间 + 对应的存档版本"""
+    __slots__ = ("agent", "lock", "last_used", "version", "dirty_turns", "size")
+
+    def __init__(self, agent=None, version=None):
+        self.agent = agent  # 为 None 时 Agent 还在创建/换入中，此时会话锁由负责创建的请求持有
+        self.lock = threading.Lock()  # 同一会话的请求串行执行，不同会话互不阻塞
+        self.last_used = time.monotonic()
+        self.version = version  # 最近一次读写存储时的存档时间戳
+        self.dirty_turns = 0  # 上次写回存储之后的修改次数（请求或后台写入的记忆）；读写时持有池的 _dirty_lock
+        self.size = 0  # 最近一次释放会话锁时估算的内存占用（字节），计入池的总量
+
+
+def estimate_agent_bytes(agent) -> int:
+    """粗略估算一个 Agent 占用的内存（字节），主要开销是对话历史、长期记忆及其检索索引"""
+    total = 4096  # Agent 对象本身、game_state 等固定开销
+    for msg in agent.dialogue_history:
+        total += sys.getsizeof(msg.get("content", "")) + 240  # 240: dict + role 字符串的大致开销
+    for mem in agent.long_term_memory:
+        total += sys.getsizeof(mem) + 8
+    return total + agent.memory_index.nbytes
+
+
+class _ProcessLocks:
+    """
+    跨进程的会话锁：会话ID散列到 STRIPES 个锁文件之一，用 flock 加独占锁。
+    锁文件数量固定，不随会话增加；偶尔两个会话落在同一个文件上，只是彼此多等一会儿。
+    """
+    STRIPES = 4096
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def hold(self, session_id):
+        if fcntl is None:
+            yield
+            return
+        stripe = zlib.crc32(session_id.encode("utf-8")) % self.STRIPES
+        fd = os.open(os.path.join(self.lock_dir, f"{stripe:04d}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # 关闭文件即释放锁
+
+
+class AgentPool:
+    def __init__(self, agent_factory, storage, max_agents=500, idle_seconds=1800, memory_limit_mb=256,
+                 write_through=False, on_dirty=None):
+        """
+        初始化 AgentPool。
+
+        Args:
+            agent_factory (callable): 无参函数，返回一个新的 GalGameAgent。
+            storage (GameStorage): 换出会话时使用的存储。
+            max_agents (int): 同时驻留内存的 Agent 数量上限。
+            idle_seconds (int): 会话空闲超过该秒数后被换出。
+            memory_limit_mb (int): 所有活跃 Agent 的估算内存上限 (MB)。
+            write_through (bool): 每次请求后都写回存储，并在取用时检查其他进程是否写过新版本。
+            on_dirty (callable, optional): 不是 write_through 时，每个修改了会话的请求结束后调用（无参数），
+                                           用于通知后台自动存档。
+        """
+        self.agent_factory = agent_factory
+        self.storage = storage
+        self.max_agents = max_agents
+        self.idle_seconds = idle_seconds
+        self.memory_limit_bytes = memory_limit_mb * 1024 * 1024
+        self.write_through = write_through
+        self.on_dirty = on_dirty
+        self._entries = OrderedDict()  # session_id -> _PoolEntry，越靠后越新
+        self._swapping = {}  # 已移出 _entries、正在写回存储的会话 -> 条目；写完之前不能从存储换入
+        self._total_bytes = 0  # _entries 中所有条目 size 之和
+        self._dirty = set()  # 有尚未写回存储的修改的会话
+        self._dirty_lock = threading.Lock()  # 只保护 _dirty；持有会话锁时也可以获取
+        self._lock = threading.RLock()
+        self._last_idle_sweep = time.monotonic()
+        self._process_locks = _ProcessLocks(os.path.join(storage.save_dir, "locks")) if write_through else None
+        self.swap_outs = 0
+        self.swap_ins = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _swap_slot(session_id):
+        return f"session_{session_id}"
+
+    @contextmanager
+    def acquire(self, session_id, write_back=True):
+        """取得会话对应的 Agent，并在 with 块内独占它。不修改游戏状态的请求可以传 write_back=False，跳过写回"""
+        entry = self._lock_entry(session_id)
+        try:
+            if self.write_through:
+                with self._process_locks.hold(session_id):
+                    self._reload_if_stale(session_id, entry)
+                    yield entry.agent
+                    entry.last_used = time.monotonic()
+                    if write_back:
+                        self._mark_dirty(session_id, entry)
+                        with get_metrics().span("save"):
+                            self._write_back(session_id, entry)
+            else:
+                yield entry.agent
+                entry.last_used = time.monotonic()
+                if write_back:
+                    self._mark_dirty(session_id, entry)
+        finally:
+            self._update_size(session_id, entry)
+            entry.lock.release()
+            if write_back and not self.write_through and self.on_dirty is not None:
+                self.on_dirty()
+            self._enforce_limits(keep=session_id)
+
+    def _mark_dirty(self, session_id, entry):
+        with self._dirty_lock:
+            entry.dirty_turns += 1
+            self._dirty.add(session_id)
+
+    def _write_back(self, session_id, entry):
+        """把会话写回存储（不移出内存）。调用方需持有 entry.lock"""
+        with self._dirty_lock:
+            turns = entry.dirty_turns  # 导出之后才发生的修改（后台总结）仍然是脏的
+        data = entry.agent.export_state()
+        if not self.storage.save_game(data, self._swap_slot(session_id)):
+            return False
+        entry.version = data["meta"]["timestamp"]
+        with self._dirty_lock:
+            entry.dirty_turns -= turns
+            if not entry.dirty_turns:
+                self._dirty.discard(session_id)
+        return True
+
+    def note_changed(self, agent):
+        """
+        Agent 在请求之外被修改了（后台记忆总结写入了新记忆，或放弃总结后待总结计数改变，由 SummaryQueue 调用）：
+        标记为脏，由自动存档写回。
+        write_through 时尽量立即写回；会话正在处理请求时，由那个请求结束时写回。
+        """
+        with self._lock:
+            session_id = next((sid for sid, entry in self._entries.items() if entry.agent is agent), None)
+            entry = self._entries.get(session_id)
+        if entry is None:
+            return  # 已经换出或被替换
+        self._mark_dirty(session_id, entry)
+        if not self.write_through:
+            if self.on_dirty is not None:
+                self.on_dirty()
+            return
+        if not entry.lock.acquire(blocking=False):
+            return
+        try:
+            with self._process_locks.hold(session_id):
+                if self.storage.save_version(self._swap_slot(session_id)) == entry.version:
+                    self._write_back(session_id, entry)
+        finally:
+            entry.lock.release()
+
+    def flush_dirty(self, fsync="always"):
+        """
+        把所有脏会话各写回一次（同一会话累计的多轮修改合并为一次写入）。正在处理请求的会话留到下一次。
+
+        Args:
+            fsync (str): 这一批写入的 fsync 策略，见 GameStorage.write_batch。
+
+        Returns:
+            tuple: (写回的会话数, 合并掉的请求数)
+        """
+        with self._lock, self._dirty_lock:
+            dirty = [(sid, self._entries.get(sid)) for sid in self._dirty]
+        written, coalesced = 0, 0
+        with self.storage.write_batch(fsync):
+            for session_id, entry in dirty:
+                if entry is None:
+                    with self._lock, self._dirty_lock:
+                        if session_id not in self._entries:
+                            self._dirty.discard(session_id)  # 已经换出（换出时写过了）
+                    continue
+                if not entry.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if self._entries.get(session_id) is not entry:
+                        continue
+                    with self._dirty_lock:
+                        turns = entry.dirty_turns
+                    if turns and self._write_back(session_id, entry):
+                        written += 1
+                        coalesced += turns - 1
+                finally:
+                    entry.lock.release()
+        return written, coalesced
+
+    @property
+    def dirty_sessions(self) -> int:
+        return len(self._dirty)
+
+    def _lock_entry(self, session_id):
+        """
+        取得会话的条目并持有它的会话锁。会话不在内存中时先放入一个持有会话锁的占位条目，
+        再在全局锁之外创建/换入 Agent；同一会话的其他请求在会话锁上等待，其他会话不受影响。
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(session_id)
+                created = entry is None
+                if created:
+                    entry = _PoolEntry()
+                    entry.lock.acquire()
+                    self._entries[session_id] = entry
+                    swapping = self._swapping.get(session_id)
+                else:
+                    self._entries.move_to_end(session_id)
+                    entry.last_used = time.monotonic()
+            if created:
+                return self._fill_entry(session_id, entry, swapping)
+            entry.lock.acquire()
+            if self._entries.get(session_id) is entry:
+                return entry
+            entry.lock.release()  # 拿到锁之前恰好被换出了，重新换入
+
+    def _fill_entry(self, session_id, entry, swapping=None):
+        """为占位条目创建/换入 Agent。调用方持有 entry.lock，不持有 self._lock"""
+        try:
+            if swapping is not None:
+                with swapping.lock:  # 这个会话正在换出，等它写完存储再读
+                    pass
+            entry.agent, entry.version = self._load_agent(session_id)
+        except BaseException:
+            with self._lock:
+                if self._entries.get(session_id) is entry:
+                    del self._entries[session_id]
+            entry.lock.release()
+            raise
+        if entry.version is not None:
+            self.swap_ins += 1
+            print(f"[POOL] Session {session_id[:8]} swapped in.")
+        return entry
+
+    def _update_size(self, session_id, entry):
+        """请求结束、释放会话锁之前重新估算这个会话的内存占用，更新池的总量。调用方持有 entry.lock"""
+        size = estimate_agent_bytes(entry.agent) if entry.agent is not None else 0
+        with self._lock:
+            if self._entries.get(session_id) is entry:
+                self._total_bytes += size - entry.size
+            entry.size = size
+
+    def _load_agent(self, session_id):
+        """新建 Agent 并从存储恢复该会话，返回 (agent, 存档版本)；没有存档时版本为 None"""
+        agent = self.agent_factory()
+        slot = self._swap_slot(session_id)
+        if self.storage.has_save(slot):
+            data = self.storage.load_game(slot)
+            if data:
+                agent.import_state(data)
+                return agent, data.get("meta", {}).get("timestamp")
+        return agent, None
+
+    def _reload_if_stale(self, session_id, entry):
+        """其他进程处理过该会话时，用存储中的新版本替换内存中的 Agent。调用方需持有 entry.lock"""
+        version = self.storage.save_version(self._swap_slot(session_id))
+        if version is not None and version != entry.version:
+            old_agent = entry.agent
+            entry.agent, entry.version = self._load_agent(session_id)
+            if old_agent.summary_pending:
+                get_summary_queue().transfer(old_agent, entry.agent)  # 还没完成的总结改为写入新换入的 Agent
+            self.reloads += 1
+
+    def _detach(self, session_id, entry):
+        """把会话移出 _entries，登记为正在换出。调用方需持有 self._lock 和 entry.lock"""
+        del self._entries[session_id]
+        self._total_bytes -= entry.size
+        self._swapping[session_id] = entry
+
+    def _swap_out(self, session_id, entry):
+        """
+        把已 _detach 的会话写回存储，然后释放它的会话锁。调用方持有 entry.lock，不持有 self._lock。
+        上次写回之后没有修改的会话（自动存档或 write_through 已经写过）不再重复写入。
+        """
+        with self._dirty_lock:
+            dirty = entry.dirty_turns > 0
+        try:
+            if dirty and not self.write_through:
+                self.storage.save_game(entry.agent.export_state(), self._swap_slot(session_id))
+            elif dirty:
+                # write_through 时每次请求后都已写回；只有写回失败过才需要再写，且要持有跨进程锁，避免覆盖其他进程写入的新版本
+                with self._process_locks.hold(session_id):
+                    if self.storage.save_version(self._swap_slot(session_id)) == entry.version:
+                        self.storage.save_game(entry.agent.export_state(), self._swap_slot(session_id))
+            self.swap_outs += 1
+            print(f"[POOL] Session {session_id[:8]} swapped out.")
+        finally:
+            with self._lock:
+                if self._swapping.get(session_id) is entry:
+                    del self._swapping[session_id]
+            with self._dirty_lock:
+                self._dirty.discard(session_id)
+            entry.lock.release()
+
+    def _enforce_limits(self, keep=None):
+        """按 LRU 顺序换出会话，直到满足数量与内存上限；顺带清理空闲会话。存储写入在全局锁之外进行"""
+        victims = []
+        with self._lock:
+            now = time.monotonic()
+            sweep_idle = now - self._last_idle_sweep >= min(60, self.idle_seconds)
+            if sweep_idle:
+                self._last_idle_sweep = now
+
+            for session_id in list(self._entries):
+                entry = self._entries[session_id]
+                over_count = len(self._entries) > self.max_agents
+                over_memory = self._total_bytes > self.memory_limit_bytes
+                is_idle = sweep_idle and now - entry.last_used > self.idle_seconds
+                if not (over_count or over_memory or is_idle):
+                    if not sweep_idle:
+                        break  # LRU 顺序：后面的会话更新，不必再看
+                    continue
+                if session_id == keep:
+                    continue
+                if not entry.lock.acquire(blocking=False):
+                    continue  # 正在处理请求（或正在换入）的会话不换出
+                if not self._summary_settled(entry.agent):
+                    entry.lock.release()
+                    continue  # 后台记忆总结完成前不换出，否则总结会写进已换出的旧对象
+                self._detach(session_id, entry)
+                victims.append((session_id, entry))
+        for session_id, entry in victims:
+            self._swap_out(session_id, entry)
+
+    @staticmethod
+    def _summary_settled(agent) -> bool:
+        """
+        没有未完成的后台记忆总结时返回 True。总结超时（SUTANG_SUMMARY_TIMEOUT）时放弃它，
+        对话记回待总结计数随会话写回，下次再总结，Agent 不会因为一个卡住的总结一直留在内存里。调用方需持有会话锁
+        """
+        if not agent.summary_pending:
+            return True
+        summaries = get_summary_queue()
+        if not summaries.overdue(agent):
+            return False
+        summaries.abandon(agent)
+        return True
+
+    def flush_all(self):
+        """把所有活跃会话移出内存，还有修改没写回的先写回存储（用于关闭服务前，自动存档最后一批写完之后）"""
+        with self._lock:
+            entries = list(self._entries.items())
+        for session_id, entry in entries:
+            entry.lock.acquire()
+            if self._entries.get(session_id) is entry and entry.agent.summary_pending:
+                get_summary_queue().abandon(entry.agent)  # 写回之前放弃，对话记回待总结计数（会话随之变脏）
+            with self._lock:
+                if self._entries.get(session_id) is not entry:
+                    entry.lock.release()
+                    continue
+                self._detach(session_id, entry)
+            self._swap_out(session_id, entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_agents": len(self._entries),
+                "estimated_bytes": self._total_bytes,
+                "swap_outs": self.swap_outs,
+                "swap_ins": self.swap_ins,
+                "reloads": self.reloads,
+                "write_through": self.write_through,
+                "dirty_sessions": len(self._dirty),
+            }
@@ -2,9 +2,11 @@
 # 最终的、简化的Web应用入口
 # 这个版本只依赖我们新建的 game_core.py，与其他旧模块完全解耦。
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
+import json
 import os
 import sys
+import uuid
 
 # 设置路径以便导入根目录模块
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,8 +14,9 @@ if ROOT_DIR not in sys.path:
     sys.path.append(ROOT_DIR)
 
 # [核心改动] 我们不再导入任何旧的管理器或工具函数
-# 而是直接导入我们新建的、干净的 game_core
-from web_app.game_core import game_core
+# 而是直接导入我们新建的、干净的 game_core（第一次请求时才创建）
+from web_app.game_core import get_game_core
+from web_app.assets import get_asset_manifest
 
 # 你可以保留你原来的load_env_file逻辑，如果它在一个你没删除的文件里
 # 否则，简单的os.environ.get就足够了
@@ -28,15 +31,47 @@ if not os.environ.get("DEEPSEEK_API_KEY"):
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.secret_key = 'a_very_secret_key_for_sutang_reborn'
 
+def client_state_version(data=None):
+    """客户端已确认的状态版本（请求体的 state_version 或查询参数 since），没有时返回 None"""
+    value = (data or {}).get('state_version', request.args.get('since'))
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def get_session_id():
+    """取得当前浏览器会话的ID，第一次访问时分配一个新的"""
+    session_id = session.get('sid')
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        session['sid'] = session_id
+    return session_id
+
+@app.context_processor
+def asset_helpers():
+    """模板中引用静态资源：构建过 (tools/build_assets.py) 时使用带哈希的文件，否则使用 /static/ 下的原始文件"""
+    manifest = get_asset_manifest()
+    return {
+        'asset_url': manifest.url,
+        'image_url': manifest.image_url,
+        'picture_sources': manifest.picture_sources,
+        'background_css': manifest.background_css,
+    }
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/assets/<path:filename>')
+def assets(filename):
+    """带哈希的构建产物：缓存一年，按 Accept-Encoding 发送预压缩的版本"""
+    return get_asset_manifest().response(filename)
+
 @app.route('/api/start_game', methods=['POST'])
 def start_game():
     """开始新游戏，完全由SimpleGameCore驱动"""
     print("[WEB_APP] Request to /api/start_game")
-    initial_data = game_core.start_new_game()
+    initial_data = get_game_core().start_new_game(get_session_id())
     return jsonify(initial_data)
 
 @app.route('/api/chat', methods=['POST'])
@@ -48,13 +83,12 @@ def chat():
         if not user_input:
             return jsonify({'error': 'Message is empty'}), 400
 
-        # 直接调用 SimpleGameCore 的方法
-        response_text = game_core.chat(user_input)
-        current_state = game_core.get_current_state()
+        # 直接调用 SimpleGameCore 的方法。请求体带 state_version 时只返回之后的状态变化 (state_patch)
+        response_text, state = get_game_core().chat(get_session_id(), user_input, client_state_version(request.json))
 
         return jsonify({
             'response': str(response_text), # 强制转字符串，更安全
-            'game_state': current_state
+            **state
         })
     except Exception as e:
         import traceback
@@ -62,26 +96,94 @@ def chat():
         return jsonify({'error': '服务器发生未知错误', 'details': str(e)}), 500
 
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """流式聊天：以Server-Sent Events逐段返回AI的回复"""
+    print("[WEB_APP] Request to /api/chat/stream")
+    user_input = (request.json or {}).get('message', '')
+    if not user_input:
+        return jsonify({'error': 'Message is empty'}), 400
+    session_id = get_session_id()
+    since = client_state_version(request.json)
+
+    def generate():
+        # 事件格式: token -> {"text": 片段}; error -> {"error": ...}
+        # done -> {"response": 完整回复, "state_version": N, "state_patch": [...]}（请求未带 state_version 时为 "game_state": {...}）
+        try:
+            for event, payload in get_game_core().chat_stream(session_id, user_input, since):
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            import traceback
+            print(f"!!! UNEXPECTED ERROR IN CHAT STREAM API !!!\n{traceback.format_exc()}")
+            yield f"event: error\ndata: {json.dumps({'error': '服务器发生未知错误', 'details': str(e)}, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/chat/draft', methods=['POST'])
+def chat_draft():
+    """玩家输入中的草稿：服务端按草稿提前发起LLM请求（SUTANG_SPECULATE=on 时）"""
+    draft = (request.json or {}).get('draft', '').strip()
+    if not get_game_core().speculation_enabled():
+        return jsonify({'speculating': False, 'enabled': False})
+    speculating = bool(draft) and get_game_core().speculate(get_session_id(), draft)
+    return jsonify({'speculating': speculating, 'enabled': True})
+
+
+@app.route('/api/history', methods=['GET'])
+def history_api():
+    """往回翻看对话历史：?offset=起始序号&limit=条数"""
+    offset = request.args.get('offset', 0, type=int)
+    limit = max(0, min(request.args.get('limit', 50, type=int), 200))
+    return jsonify(get_game_core().get_history_page(get_session_id(), offset, limit))
+
+
 # [新] 重新启用存档/读档API，并连接到SimpleGameCore
 @app.route('/api/save', methods=['POST'])
 def save_game_api():
     print("[WEB_APP] Request to /api/save")
     slot = request.json.get('slot', 1)
-    success = game_core.save_game(slot)
+    success = get_game_core().save_game(get_session_id(), slot)
     return jsonify({'success': success})
 
 @app.route('/api/load', methods=['POST'])
 def load_game_api():
     print("[WEB_APP] Request to /api/load")
     slot = request.json.get('slot', 1)
-    success = game_core.load_game(slot)
-    if success:
-        return jsonify({
-            'success': True,
-            'game_state': game_core.get_current_state()
-        })
+    state = get_game_core().load_game(get_session_id(), slot, client_state_version(request.json))
+    if state is not None:
+        return jsonify({'success': True, **state})
     return jsonify({'success': False})
 
+@app.route('/api/saves', methods=['GET'])
+def list_saves_api():
+    """当前会话自己的存档槽位"""
+    return jsonify({'slots': get_game_core().list_saves(get_session_id())})
+
+@app.route('/api/state', methods=['GET'])
+def state_api():
+    """
+    读取游戏状态：?since=已确认的版本 时只返回之后的变化。
+    响应带 ETag（状态版本号），轮询时带上 If-None-Match，状态没变就只回复 304。
+    """
+    etag = request.headers.get('If-None-Match', '').removeprefix('W/') or None
+    state, current = get_game_core().get_current_state(get_session_id(), client_state_version(), etag)
+    response = Response(status=304) if state is None else jsonify(state)
+    response.headers['ETag'] = current
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/stats', methods=['GET'])
+def stats_api():
+    """运行指标：活跃会话数、记忆总结队列深度与延迟等"""
+    return jsonify(get_game_core().get_stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    """Prometheus 抓取用的指标（文本格式）"""
+    return Response(get_game_core().get_metrics_text(), mimetype='text/plain; version=0.0.4')
+
 # web_start.py 应该调用这个
 if __name__ == "__main__":
     app.run(debug=False, port=5000, host="0.0.0.0")
\ No newline at end of file
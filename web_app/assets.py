@@ -0,0 +1,131 @@
+# web_app/assets.py
+# 构建好的静态资源（由 tools/build_assets.py 生成到 web_app/static/dist/）
+# 构建产物的文件名带内容哈希，内容变了文件名就变，所以可以让浏览器缓存一年、不再验证 (immutable)。
+# CSS/JS 预先压缩成 .br / .gz，按请求的 Accept-Encoding 直接发送压缩好的文件；
+# 图片有多种尺寸和格式 (AVIF/WebP/JPEG)，模板用 <picture> 和 image-set() 让浏览器挑选。
+# 没有构建过（没有 manifest.json）或 SUTANG_STATIC_ASSETS=off 时，模板退回 /static/ 下的原始文件。
+
+import json
+import mimetypes
+import os
+import threading
+
+from flask import abort, request, send_file, url_for
+
+DIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+ASSET_URL_PREFIX = "/assets/"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # 按优先顺序
+IMAGE_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+class AssetManifest:
+    def __init__(self, data=None, dist_dir=DIST_DIR):
+        """
+        初始化 AssetManifest。
+
+        Args:
+            data (dict, optional): manifest.json 的内容，省略时不使用构建产物。
+            dist_dir (str): 构建产物所在目录。
+        """
+        data = data or {}
+        self.dist_dir = dist_dir
+        self.files = data.get("files", {})  # 原始路径 -> 带哈希的路径
+        self.encodings = {path: tuple(encodings) for path, encodings in data.get("encodings", {}).items()}
+        self.images = data.get("images", {})  # 原始路径 -> {格式: [[密度描述, 路径], ...]}
+        self.backgrounds = data.get("backgrounds", {})  # 原始路径 -> [{"min_width": 像素, "formats": {格式: 路径}}, ...]
+        self._served = set(self.files.values())
+        for variants in self.images.values():
+            self._served.update(path for candidates in variants.values() for _, path in candidates)
+        for steps in self.backgrounds.values():
+            for step in steps:
+                self._served.update(step["formats"].values())
+
+    @classmethod
+    def load(cls, path=MANIFEST_PATH):
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f), os.path.dirname(path))
+        except (OSError, ValueError) as e:
+            print(f"[ASSETS] 读取 {path} 失败，使用原始静态文件: {e}")
+            return cls()
+
+    # --- 模板中使用 ---
+    def url(self, name):
+        """静态文件的URL：构建过时为带哈希的文件，否则为 /static/ 下的原始文件"""
+        hashed = self.files.get(name)
+        return ASSET_URL_PREFIX + hashed if hashed else url_for("static", filename=name)
+
+    def picture_sources(self, name):
+        """<picture> 的 <source> 列表：[{"type": MIME类型, "srcset": "url 1x, url 2x"}, ...]，越靠前的格式越小"""
+        sources = []
+        for fmt, candidates in self.images.get(name, {}).items():
+            srcset = ", ".join(f"{ASSET_URL_PREFIX}{path} {descriptor}" for descriptor, path in candidates)
+            sources.append({"type": IMAGE_TYPES.get(fmt, "image/" + fmt), "srcset": srcset})
+        return sources
+
+    def image_url(self, name):
+        """<img> 的 src：不支持任何 <source> 格式的浏览器使用的版本（JPEG 1x），没有构建过时为原始文件"""
+        variants = self.images.get(name, {})
+        for fmt in ("jpeg", "png"):
+            if variants.get(fmt):
+                return ASSET_URL_PREFIX + variants[fmt][0][1]
+        return self.url(name)
+
+    def background_css(self, name, selector="body"):
+        """背景图的CSS：按视口宽度选择尺寸，用 image-set() 让浏览器选择支持的格式。没有构建过时为空字符串"""
+        rules = []
+        for step in self.backgrounds.get(name, []):
+            images = ", ".join(f'url("{ASSET_URL_PREFIX}{path}") type("{IMAGE_TYPES.get(fmt, "image/" + fmt)}")'
+                               for fmt, path in step["formats"].items())
+            rule = f"{selector} {{ background-image: image-set({images}); background-size: cover; background-attachment: fixed; }}"
+            rules.append(f"@media (min-width: {step['min_width']}px) {{ {rule} }}" if step["min_width"] else rule)
+        return "\n".join(rules)
+
+    # --- 发送文件 ---
+    def response(self, filename):
+        """发送一个构建产物：按 Accept-Encoding 选择预压缩的版本，并允许浏览器缓存一年"""
+        if filename not in self._served:
+            abort(404)
+        path = os.path.join(self.dist_dir, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        available = self.encodings.get(filename, ())
+        encoding = next((name for name, _ in ENCODINGS if name in available and request.accept_encodings[name] > 0), None)
+        if encoding is not None:
+            path += dict(ENCODINGS)[encoding]
+        if not os.path.exists(path):
+            abort(404)
+        response = send_file(path, mimetype=mimetype, conditional=True, max_age=31536000)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        if available:
+            response.vary.add("Accept-Encoding")
+        return response
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_asset_manifest() -> AssetManifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            if os.environ.get("SUTANG_STATIC_ASSETS", "on").lower() == "off":
+                _manifest = AssetManifest()
+            else:
+                _manifest = AssetManifest.load()
+                if _manifest.files:
+                    print(f"[ASSETS] 使用构建好的静态资源: {len(_manifest.files)} 个文件")
+        return _manifest
+
+
+def set_asset_manifest(manifest: AssetManifest):
+    """替换进程内使用的资源清单（重新构建后、或者对比构建前后的页面体积时）"""
+    global _manifest
+    with _manifest_lock:
+        _manifest = manifest
@@ -0,0 +1,130 @@
+# web_app/autosave.py
+# 会话的后台自动存档（write-behind）
+# 请求线程只把会话标记为脏（AgentPool），不在对话的热路径上写盘。后台线程每隔 interval 秒，
+# 或者自上次写回以来累计的请求数达到 max_turns 时，把所有脏会话作为一批写回会话存储：
+# 同一会话在两批之间聊了多少轮都只写一次。服务崩溃时最多丢失最近一批的进度。
+#
+# fsync 策略（SUTANG_AUTOSAVE_FSYNC，见 GameStorage.write_batch）:
+#   always: 每个文件写完立即 fsync
+#   batch:  整批写完后统一 fsync（默认）
+#   off:    不 fsync，交给操作系统
+# 多进程部署（write_through）时每次请求都已写回共享存储，不需要自动存档。
+
+import os
+import threading
+import time
+
+from Metrics import get_metrics
+
+FSYNC_POLICIES = ("always", "batch", "off")
+
+
+class AutosaveScheduler:
+    def __init__(self, pool, interval=10.0, max_turns=20, fsync="batch", enabled=True):
+        """
+        初始化 AutosaveScheduler。
+
+        Args:
+            pool (AgentPool): 需要定期写回脏会话的会话池。
+            interval (float): 两次写回之间最多间隔多少秒。
+            max_turns (int): 累计多少个修改了会话的请求后提前写回。
+            fsync (str): fsync 策略，"always"、"batch" 或 "off"。
+            enabled (bool): 是否启用自动存档。
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync}（可选: {', '.join(FSYNC_POLICIES)}）")
+        self.pool = pool
+        self.interval = interval
+        self.max_turns = max_turns
+        self.fsync = fsync
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 后台线程与关闭时的最后一次写回不能同时进行
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._turns = 0  # 上次写回之后累计的请求数
+
+        self.flushes = 0
+        self.sessions_written = 0
+        self.turns_coalesced = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def note_turn(self):
+        """一个请求修改了会话（由 AgentPool 在请求结束后调用）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._turns += 1
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+                self._thread.start()
+            if self._turns >= self.max_turns:
+                self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.flush()
+
+    def flush(self):
+        """立即把所有脏会话写回一次"""
+        with self._flush_lock:
+            with self._lock:
+                self._turns = 0
+            if not self.pool.dirty_sessions:
+                return
+            start = time.perf_counter()
+            try:
+                written, coalesced = self.pool.flush_dirty(self.fsync)
+            except Exception as e:
+                print(f"[AUTOSAVE] 写回失败: {e}")
+                return
+            elapsed = time.perf_counter() - start
+            get_metrics().observe("autosave_flush", elapsed)
+            with self._lock:
+                self.flushes += 1
+                self.sessions_written += written
+                self.turns_coalesced += coalesced
+                self.last_flush_ms = elapsed * 1000
+                self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+    def shutdown(self):
+        """停止后台线程，并把还没写回的会话写完"""
+        with self._lock:
+            self._stop.set()
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+        if self.enabled:
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "interval_seconds": self.interval,
+                "max_turns": self.max_turns,
+                "fsync": self.fsync,
+                "pending_sessions": self.pool.dirty_sessions,
+                "flushes": self.flushes,
+                "sessions_written": self.sessions_written,
+                "turns_coalesced": self.turns_coalesced,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "max_flush_ms": round(self.max_flush_ms, 3),
+            }
+
+
+def create_autosave(pool):
+    """按环境变量创建自动存档：SUTANG_AUTOSAVE=on|off、SUTANG_AUTOSAVE_INTERVAL、SUTANG_AUTOSAVE_TURNS、SUTANG_AUTOSAVE_FSYNC"""
+    return AutosaveScheduler(
+        pool,
+        interval=float(os.environ.get("SUTANG_AUTOSAVE_INTERVAL", 10)),
+        max_turns=int(os.environ.get("SUTANG_AUTOSAVE_TURNS", 20)),
+        fsync=os.environ.get("SUTANG_AUTOSAVE_FSYNC", "batch").lower(),
+        enabled=os.environ.get("SUTANG_AUTOSAVE", "on").lower() == "on" and not pool.write_through,
+    )
@@ -1,42 +1,243 @@
 # web_app/game_core.py
 
+import copy
+import importlib
+import os
+import re
+import threading
+
 # 导入我们的AI大脑
 from Su_Tang import GalGameAgent
+from Event_Engine import get_event_engine
+from Fast_Path import get_fast_path_router, get_speculative_runner
+from Game_Storage import get_storage
+from LLM_Client import get_llm_client
+from Location_Matcher import get_location_matcher
+from Memory_Summarizer import get_summary_queue
+from Metrics import get_metrics
+from Prompt_Budget import get_prompt_budget
+from Prompt_Registry import get_prompt_registry
+from Response_Cache import get_response_cache
+from Turn_Scheduler import get_turn_scheduler
+from World_Data import get_world
+from web_app.agent_pool import AgentPool
+from web_app.autosave import create_autosave
+
+_SLOT_NAME = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+
+def player_slot(slot):
+    """
+    玩家手动存档的槽位名。存档按会话ID区分所有者（存储的 owner），不同浏览器会话的同名槽位互不覆盖，也读不到别人的存档。
+
+    Returns:
+        str or None: 槽位名不合法（只允许字母、数字、下划线和短横线）时返回 None。
+    """
+    slot = str(slot)
+    return slot if _SLOT_NAME.fullmatch(slot) else None
+
+
+def state_payload(agent, since=None):
+    """
+    回复中携带的游戏状态：客户端告知已确认的版本时只给增量（JSON Patch），否则给整个状态。
+    返回的是深拷贝：结果在会话锁释放后才序列化，届时 last_topics 等列表/字典字段可能正被下一轮请求原地修改。
+
+    Args:
+        agent (GalGameAgent): 当前会话的Agent（调用方需持有会话锁）。
+        since (int, optional): 客户端已确认的状态版本。
+    """
+    state = agent.game_state
+    if since is None:
+        return {'state_version': state.commit(), 'game_state': copy.deepcopy(dict(state))}
+    patch = copy.deepcopy(state.patch_since(since))
+    return {'state_version': state.version, 'state_patch': patch}
+
 
 class SimpleGameCore:
     def __init__(self):
-        # 1. 创建AI实例：它不通过工厂，直接new一个苏糖出来。
-        self.agent = GalGameAgent(is_new_game=True)
+        # 1. 每个会话一个苏糖：Agent 由会话池按需创建、换出和换入。
+        #    SUTANG_SESSION_STORE=sqlite 时会话存放在多进程共享的 SQLite 中，每次请求后写回（多 worker 部署用）。
+        shared = os.environ.get("SUTANG_SESSION_STORE", "local") == "sqlite"
+        storage = get_storage(os.path.join("saves", "sessions"), "sqlite" if shared else None)
+        self.pool = AgentPool(
+            agent_factory=lambda: GalGameAgent(is_new_game=True),
+            storage=storage,
+            max_agents=int(os.environ.get("SUTANG_MAX_AGENTS", 500)),
+            idle_seconds=int(os.environ.get("SUTANG_AGENT_IDLE_SECONDS", 1800)),
+            memory_limit_mb=int(os.environ.get("SUTANG_AGENT_MEMORY_MB", 256)),
+            write_through=shared,
+        )
+        # 1b. 单进程时每轮对话只把会话标记为脏，由后台自动存档合并后批量写回
+        self.autosave = create_autosave(self.pool)
+        self.pool.on_dirty = self.autosave.note_turn
+        # 1c. 后台记忆总结在请求之外修改了会话，也要标记为脏，不必等玩家下一轮对话才存档
+        get_summary_queue().on_change = self.pool.note_changed
+
+    def preload(self):
+        """提前加载地点数据、导航索引、地点识别自动机、事件表和Prompt模板。多进程部署时在 fork 之前调用，各进程共享这些只读数据"""
+        world = get_world()
+        world.navigation.warm_up()
+        get_location_matcher(world.locations)
+        get_event_engine().warm_up()
+        get_prompt_registry()
+        # 单进程启动时延迟到第一次用到才导入的模块，这里也在 fork 之前导入。这里只需要它们进入 sys.modules
+        # （LLM_Client、Memory_Index 里的延迟导入之后直接取到），用不到模块本身，所以不用 import 语句留下没用的名字
+        for module in ("httpx", "numpy"):
+            importlib.import_module(module)
+
+    def shutdown(self):
+        """
+        关闭服务前：等后台记忆总结写完，停止自动存档并写完待写的会话，把所有活跃会话写回存储，再关闭LLM连接池。
+        记忆总结最多等 SUTANG_SHUTDOWN_SUMMARY_WAIT 秒（LLM 很慢或不可用时不会一直卡住），
+        没完成的放弃，对应的对话随会话保存，下次再总结。
+        """
+        get_speculative_runner().shutdown()
+        summaries = get_summary_queue()
+        if not summaries.join(timeout=float(os.environ.get("SUTANG_SHUTDOWN_SUMMARY_WAIT", 10))):
+            summaries.abandon()
+        self.autosave.shutdown()  # 最后一批：把脏会话写回一次
+        self.pool.flush_all()  # 只写回这之后仍有修改的会话（自动存档关闭时为全部脏会话），其余只移出内存
+        get_llm_client().close()
 
-    def start_new_game(self):
+    def start_new_game(self, session_id):
         """重置游戏状态并返回初始数据"""
-        # 2. 响应“开始游戏”请求：它直接告诉AI大脑去初始化。
-        self.agent._init_new_game(is_new_game=True)
-    
+        # 2. 响应“开始游戏”请求：它直接告诉该会话的AI大脑去初始化。
+        with self.pool.acquire(session_id) as agent:
+            agent._init_new_game(is_new_game=True)
+            initial_state = state_payload(agent)
+
         # 增加返回初始状态的逻辑
         initial_response = "（你走在热闹的校园里，注意到烘焙社的摊位前有个可爱的女孩正在忙碌着...）" # 或者任何你喜欢的开场白
-        initial_state = self.get_current_state()
-    
+
         return {
             'response': initial_response,
-            'game_state': initial_state
+            **initial_state
         }
 
-    def chat(self, user_input):
-        # 3. 响应“聊天”请求：它把玩家的话直接传给AI大脑，然后把AI的回复拿回来。
-        response = self.agent.chat(user_input)
-        return response
+    def chat(self, session_id, user_input, since=None):
+        # 3. 响应“聊天”请求：它把玩家的话传给该会话的AI大脑，然后把AI的回复和最新状态（或相对 since 版本的增量）拿回来。
+        with get_metrics().turn("chat"), self.pool.acquire(session_id) as agent:
+            response = agent.chat(user_input)
+            return response, state_payload(agent, since)
+
+    def chat_stream(self, session_id, user_input, since=None):
+        # 3b. 流式聊天：逐段转发AI的回复，最后附上最新状态（或增量）。整个过程中该会话的AI大脑被独占。
+        with get_metrics().turn("chat_stream"), self.pool.acquire(session_id) as agent:
+            for event, text in agent.chat_stream(user_input):
+                if event == "done":
+                    yield event, {'response': text, **state_payload(agent, since)}
+                else:
+                    yield event, {'text': text}
+
+    def speculation_enabled(self):
+        return get_speculative_runner().enabled
+
+    def speculate(self, session_id, draft):
+        # 3c. 玩家还在输入：按草稿提前发起LLM请求，正式发送时内容一致就直接用上。
+        with self.pool.acquire(session_id, write_back=False) as agent:
+            return agent.speculate(draft)
+
+    def get_current_state(self, session_id, since=None, etag=None):
+        # 4. 响应“获取状态”请求：它直接去问该会话的AI大脑现在的状态是什么。
+        #    客户端带来的 ETag 与当前版本一致时返回 (None, etag)，由 Web 层回复 304。
+        with self.pool.acquire(session_id, write_back=False) as agent:
+            current = agent.game_state.etag
+            if etag == current:
+                return None, current
+            return state_payload(agent, since), current
+
+    def get_history_page(self, session_id, offset, limit):
+        # 4b. 往回翻看历史：只有这时才会读取磁盘上的归档。
+        with self.pool.acquire(session_id, write_back=False) as agent:
+            return agent.get_history_page(offset, limit)
+
+    # 5. 响应“存档/读档”请求：它直接告诉该会话的AI大脑去执行存档或读档。槽位按会话隔离。
+    def save_game(self, session_id, slot):
+        slot = player_slot(slot)
+        if slot is None:
+            return False
+        with self.pool.acquire(session_id) as agent:
+            return agent.save(slot, owner=session_id)
+
+    def load_game(self, session_id, slot, since=None):
+        """读档，成功时返回游戏状态（或相对 since 版本的增量），失败时返回 None"""
+        slot = player_slot(slot)
+        if slot is None:
+            return None
+        with self.pool.acquire(session_id) as agent:
+            if not agent.load(slot, owner=session_id):
+                return None
+            return state_payload(agent, since)
+
+    def list_saves(self, session_id):
+        """该会话自己的存档槽位（SQLite 存储时按 owner 索引查询）"""
+        names = get_storage().list_saves(owner=session_id)
+        return sorted({os.path.splitext(name)[0][len("save_"):] for name in names})
+
+    def get_metrics_text(self):
+        # 7. Prometheus 格式的指标：各阶段耗时分位数、token用量、会话池与队列状态。
+        llm = get_llm_client().usage_stats()
+        pool = self.pool.stats()
+        queue = get_summary_queue().stats()
+        fast_path = get_fast_path_router().stats()
+        speculation = get_speculative_runner().stats()
+        autosave = self.autosave.stats()
+        events = get_event_engine().stats()
+        counters = {
+            "sutang_llm_requests_total": ("LLM API responses with usage.", llm["requests"]),
+            "sutang_llm_prompt_tokens_total": ("Prompt tokens reported by the API.", llm["prompt_tokens"]),
+            "sutang_llm_cached_prompt_tokens_total": ("Prompt tokens served from the provider prefix cache.", llm["cached_prompt_tokens"]),
+            "sutang_llm_completion_tokens_total": ("Completion tokens reported by the API.", llm["completion_tokens"]),
+            "sutang_llm_retries_total": ("LLM request retries.", llm["retries"]),
+            "sutang_agent_swap_outs_total": ("Agents swapped out to storage.", pool["swap_outs"]),
+            "sutang_autosave_flushes_total": ("Background autosave batches written.", autosave["flushes"]),
+            "sutang_autosave_sessions_written_total": ("Sessions written by background autosave.", autosave["sessions_written"]),
+            "sutang_event_waypoints_total": ("Waypoints checked for random events.", events["waypoints"]),
+            "sutang_events_triggered_total": ("Random events triggered on the way.", sum(events["triggered"].values())),
+            "sutang_fast_path_turns_total": ("Dialogue turns checked by the local fast path.", fast_path["turns"]),
+            "sutang_fast_path_hits_total": ("Dialogue turns answered locally without an LLM call.", fast_path["hits"]),
+            "sutang_fast_path_saved_seconds_total": ("Estimated LLM latency saved by the fast path.", fast_path["estimated_saved_seconds"]),
+            "sutang_speculative_started_total": ("Speculative LLM requests started from drafts.", speculation["started"]),
+            "sutang_speculative_skipped_total": ("Drafts skipped while the session's speculative request was in flight.", speculation["skipped"]),
+            "sutang_speculative_used_total": ("Speculative LLM requests used by the sent message.", speculation["used"]),
+            "sutang_speculative_saved_seconds_total": ("Latency saved by starting requests from drafts.", speculation["saved_seconds"]),
+        }
+        gauges = {
+            "sutang_active_agents": ("Agents resident in memory.", pool["active_agents"]),
+            "sutang_autosave_pending_sessions": ("Sessions with changes not yet written by autosave.", autosave["pending_sessions"]),
+            "sutang_summary_queue_depth": ("Memory summary jobs waiting.", queue["queue_depth"]),
+            "sutang_llm_in_flight": ("LLM calls admitted by the turn scheduler and still running.", get_turn_scheduler().stats()["in_flight"]),
+        }
+        return get_metrics().render(counters, gauges)
+
+    def get_stats(self):
+        # 6. 运行状态：会话池、自动存档、后台记忆总结队列、随机事件、Prompt渲染耗时与token预算、LLM用量（前缀缓存命中率）、回复缓存、快速通道与预测性请求的指标。
+        return {
+            'agent_pool': self.pool.stats(),
+            'autosave': self.autosave.stats(),
+            'summary_queue': get_summary_queue().stats(),
+            'events': get_event_engine().stats(),
+            'prompts': get_prompt_registry().stats(),
+            'prompt_budget': get_prompt_budget().stats(),
+            'llm': get_llm_client().usage_stats(),
+            'response_cache': get_response_cache().stats(),
+            'latency': get_metrics().stats(),
+            'scheduler': get_turn_scheduler().stats(),
+            'fast_path': get_fast_path_router().stats(),
+            'speculation': get_speculative_runner().stats(),
+        }
 
-    def get_current_state(self):
-        # 4. 响应“获取状态”请求：它直接去问AI大脑现在的状态是什么。
-        return self.agent.game_state
-    
-    # 5. 响应“存档/读档”请求：它直接告诉AI大脑去执行存档或读档。
-    def save_game(self, slot):
-        return self.agent.save(slot)
+_game_core = None
+_game_core_lock = threading.Lock()
 
-    def load_game(self, slot):
-        return self.agent.load(slot)
 
-# 创建一个全局实例，这样 app.py 就可以直接用了
-game_core = SimpleGameCore()
\ No newline at end of file
+def get_game_core() -> SimpleGameCore:
+    """
+    取得进程内的 SimpleGameCore。第一次请求（或启动时的 preload）才创建会话池、存储和后台存档，
+    导入 web_app.app 时不做这些事。
+    """
+    global _game_core
+    with _game_core_lock:
+        if _game_core is None:
+            _game_core = SimpleGameCore()
+        return _game_core
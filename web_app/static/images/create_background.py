@@ -1,54 +1,71 @@
 """
 创建网页版背景图像
+tools/build_assets.py 用 draw_school_background 按不同宽度绘制，再转换成 WebP/AVIF
 """
 from PIL import Image, ImageDraw
 import os
 
-def create_school_background():
-    """创建学校背景图像"""
-    # 创建一个1920x1080的图像，淡蓝色背景
-    width, height = 1920, 1080
+BASE_WIDTH, BASE_HEIGHT = 1920, 1080  # 下面的坐标都按这个尺寸编写
+
+
+def draw_school_background(width=BASE_WIDTH):
+    """按给定宽度绘制学校背景（16:9），返回 PIL Image。各元素按比例缩放后直接绘制，任何尺寸都是清晰的"""
+    scale = width / BASE_WIDTH
+    height = round(BASE_HEIGHT * scale)
+
+    def p(*values):
+        return tuple(round(v * scale) for v in values)
+
+    def w(value):
+        return max(1, round(value * scale))
+
+    # 淡蓝色背景
     background_color = (235, 245, 255)
-    
+
     img = Image.new('RGB', (width, height), background_color)
     draw = ImageDraw.Draw(img)
-    
+
     # 绘制建筑轮廓（简化的学校建筑）
     building_color = (180, 200, 220)
-    
+
     # 主楼
-    draw.rectangle([(400, 300), (1520, 800)], fill=building_color, outline=(150, 170, 190), width=2)
-    
+    draw.rectangle([p(400, 300), p(1520, 800)], fill=building_color, outline=(150, 170, 190), width=w(2))
+
     # 窗户
     window_color = (220, 230, 255)
     window_outline = (150, 170, 190)
-    
+
     # 绘制窗户行
     for y in range(350, 751, 100):
         for x in range(450, 1471, 120):
-            draw.rectangle([(x, y), (x+80, y+70)], fill=window_color, outline=window_outline, width=1)
-    
+            draw.rectangle([p(x, y), p(x+80, y+70)], fill=window_color, outline=window_outline, width=w(1))
+
     # 屋顶
-    draw.polygon([(400, 300), (960, 150), (1520, 300)], fill=(160, 180, 200), outline=(150, 170, 190), width=2)
-    
+    draw.polygon([p(400, 300), p(960, 150), p(1520, 300)], fill=(160, 180, 200), outline=(150, 170, 190), width=w(2))
+
     # 门
     door_color = (140, 160, 180)
-    draw.rectangle([(910, 650), (1010, 800)], fill=door_color, outline=(120, 140, 160), width=2)
-    
+    draw.rectangle([p(910, 650), p(1010, 800)], fill=door_color, outline=(120, 140, 160), width=w(2))
+
     # 草地
     grass_color = (150, 200, 150)
-    draw.rectangle([(0, 800), (width, height)], fill=grass_color)
-    
+    draw.rectangle([p(0, 800), (width, height)], fill=grass_color)
+
     # 天空渐变
-    for y in range(300):
+    for row in range(round(300 * scale)):
         # 从顶部到y=300的蓝色渐变
+        y = int(row / scale)
         color = (235 - y//3, 245 - y//3, 255)
-        draw.line([(0, y), (width, y)], fill=color, width=1)
-    
+        draw.line([(0, row), (width, row)], fill=color, width=1)
+    return img
+
+
+def create_school_background():
+    """创建学校背景图像"""
     # 存储图像
-    img.save("school_bg.jpg", quality=95)
+    draw_school_background().save("school_bg.jpg", quality=95)
     print("背景图像已创建: school_bg.jpg")
 
 if __name__ == "__main__":
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    create_school_background() 
\ No newline at end of file
+    create_school_background()
@@ -13,6 +13,21 @@ const gameState = {
     timeInfo: "2023年9月1日 上午"
 };
 
+// 服务端游戏状态的本地副本：服务端只发送 version 之后的变化 (JSON Patch)
+const serverState = {
+    version: null,  // 已确认的状态版本，随请求发给服务端
+    data: {}
+};
+
+// 预测性请求：玩家停止输入一会儿后把草稿发给服务端，让它提前调用LLM
+const draftState = {
+    enabled: true,      // 服务端未开启 SUTANG_SPECULATE 时自动关闭
+    timer: null,
+    lastDraft: "",
+    replyPending: false // 等待回复期间不发送草稿
+};
+const DRAFT_IDLE_MS = 600;
+
 // DOM加载完成后执行
 $(document).ready(function() {
     // 绑定按钮事件
@@ -23,6 +38,7 @@ $(document).ready(function() {
             sendMessage();
         }
     });
+    $("#user-input").on("input", scheduleDraft);
     
     // 初始化提示
     console.log("绿园中学物语：追女生模拟 - Web版本已加载");
@@ -73,7 +89,7 @@ function startGame() {
                 $(".game-screen").fadeIn(500);
                 
                 // 更新游戏状态
-                updateGameState(data.game_state);
+                applyStatePayload(data);
                 
                 // 添加游戏介绍到聊天历史
                 addSystemMessage(data.intro_text);
@@ -99,11 +115,37 @@ function startGame() {
 }
 
 /**
- * 发送用户消息 (伪打字机版本)
+ * 输入停顿后发送草稿，服务端据此提前发起LLM请求
+ */
+function scheduleDraft() {
+    clearTimeout(draftState.timer);
+    if (!draftState.enabled) return;
+    draftState.timer = setTimeout(function() {
+        const draft = $("#user-input").val().trim();
+        if (draftState.replyPending || draft.length < 2 || draft === draftState.lastDraft) return;
+        draftState.lastDraft = draft;
+        $.ajax({
+            url: "/api/chat/draft",
+            type: "POST",
+            contentType: "application/json",
+            data: JSON.stringify({ draft: draft }),
+            success: function(data) {
+                // 服务端没有开启预测性请求时，不再发送草稿
+                if (!data.speculating && data.enabled === false) draftState.enabled = false;
+            }
+        });
+    }, DRAFT_IDLE_MS);
+}
+
+/**
+ * 发送用户消息 (流式版本：回复一边生成一边显示)
  */
 function sendMessage() {
     const userInput = $("#user-input").val().trim();
     if (userInput === "") return;
+    clearTimeout(draftState.timer);
+    draftState.lastDraft = "";
+    draftState.replyPending = true;
 
     // 添加用户消息到对话框
     addUserMessage(userInput);
@@ -114,55 +156,132 @@ function sendMessage() {
     // 滚动到底部
     scrollChatToBottom();
     
-    // 显示旧的“正在输入”动画，让用户知道系统有反应
+    // 在第一个字到达之前，显示“正在输入”动画
     showTypingIndicator(); 
-    
-    // 发送消息到服务器 (这里是你原来的、能正常工作的 $.ajax 调用)
-    $.ajax({
-        url: "/api/chat",
-        type: "POST",
-        contentType: "application/json",
-        data: JSON.stringify({ message: userInput }),
-        success: function(data) {
-            // 1. 成功后，立刻移除“正在输入”的动画
-            removeTypingIndicator();
-            
-            // 2. 获取到完整的回复文本
-            const fullResponseText = data.response;
-
-            // 3. 创建一个空的AI消息气泡
-            const assistantMessageHtml = `<div class="assistant-message"></div>`;
-            $("#chat-history").append(assistantMessageHtml);
-            const messageElement = $("#chat-history .assistant-message").last();
 
-            // 4. --- 伪打字机效果的核心 ---
-            let charIndex = 0;
-            const typingSpeed = 50; // 打字速度，单位是毫秒，数字越小越快
+    let messageElement = null;
+    let receivedText = "";
 
-            const typingInterval = setInterval(function() {
-                if (charIndex < fullResponseText.length) {
-                    // 添加一个字
-                    messageElement.html(formatMessage(fullResponseText.substring(0, charIndex + 1)));
-                    charIndex++;
-                    // 每打一个字都滚动到底部
-                    scrollChatToBottom();
-                } else {
-                    // 所有字都打完了，清除定时器
-                    clearInterval(typingInterval);
-                    
-                    // 打字结束后，再更新游戏状态（好感度条等），这样动画效果更自然
-                    updateGameState(data.game_state);
-                    updateCharacterImage(data.game_state.closeness);
-                }
-            }, typingSpeed);
+    // 收到第一段文字时，把“正在输入”替换成AI消息气泡
+    function ensureMessageElement() {
+        if (messageElement) return messageElement;
+        removeTypingIndicator();
+        $("#chat-history").append(`<div class="assistant-message"></div>`);
+        messageElement = $("#chat-history .assistant-message").last();
+        return messageElement;
+    }
 
-        },
-        error: function(xhr, status, error) {
+    function handleEvent(event, data) {
+        if (event === "token") {
+            receivedText += data.text;
+            ensureMessageElement().html(formatMessage(receivedText));
+            scrollChatToBottom();
+        } else if (event === "done") {
+            // 以服务器最终确认的完整回复为准
+            ensureMessageElement().html(formatMessage(data.response));
+            scrollChatToBottom();
+            applyStatePayload(data);
+            updateCharacterImage(serverState.data.closeness);
+            draftState.replyPending = false;
+        } else if (event === "error") {
+            draftState.replyPending = false;
             removeTypingIndicator();
-            showError("发送消息失败: " + error);
+            showError("发送消息失败: " + (data.details || data.error));
+        }
+    }
+
+    // EventSource 只支持GET，这里用 fetch 读取 /api/chat/stream 返回的SSE流
+    fetch("/api/chat/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ message: userInput, state_version: serverState.version })
+    }).then(function(response) {
+        if (!response.ok || !response.body) {
+            throw new Error(response.statusText || "HTTP " + response.status);
         }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder("utf-8");
+        let buffer = "";
+
+        function pump() {
+            return reader.read().then(function(result) {
+                if (result.done) return;
+                buffer += decoder.decode(result.value, { stream: true });
+                // SSE事件之间以空行分隔
+                let boundary;
+                while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = "message";
+                    let dataLines = [];
+                    rawEvent.split("\n").forEach(function(line) {
+                        if (line.startsWith("event:")) event = line.slice(6).trim();
+                        else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+                    });
+                    if (dataLines.length) handleEvent(event, JSON.parse(dataLines.join("\n")));
+                }
+                return pump();
+            });
+        }
+        return pump();
+    }).catch(function(error) {
+        draftState.replyPending = false;
+        removeTypingIndicator();
+        showError("发送消息失败: " + error.message);
     });
 }
+/**
+ * 把JSON Patch操作应用到服务端状态的本地副本（只涉及顶层字段）
+ */
+function applyStatePatch(patch) {
+    patch.forEach(function(op) {
+        if (op.path === "") {
+            serverState.data = $.extend(true, {}, op.value);
+            return;
+        }
+        const key = op.path.slice(1).replace(/~1/g, "/").replace(/~0/g, "~");
+        if (op.op === "remove") {
+            delete serverState.data[key];
+        } else {
+            serverState.data[key] = op.value;
+        }
+    });
+}
+
+/**
+ * 处理响应中的游戏状态：完整状态 (game_state) 或相对已确认版本的增量 (state_patch)
+ */
+function applyStatePayload(data) {
+    if (!data || data.state_version === undefined) return;
+    if (data.game_state) {
+        serverState.data = data.game_state;
+    } else if (data.state_patch) {
+        applyStatePatch(data.state_patch);
+    }
+    serverState.version = data.state_version;
+    updateGameState(serverState.data);
+}
+
+/**
+ * 向服务端确认状态是否有变化：带上 If-None-Match，状态没变时服务端只回复304
+ */
+function refreshState() {
+    const headers = {};
+    let url = "/api/state";
+    if (serverState.version !== null) {
+        headers["If-None-Match"] = `"${serverState.version}"`;
+        url += "?since=" + serverState.version;
+    }
+    return fetch(url, { headers: headers, cache: "no-store", credentials: "same-origin" })
+        .then(function(response) {
+            if (response.status === 304 || !response.ok) return;
+            return response.json().then(applyStatePayload);
+        })
+        .catch(function(error) {
+            console.log("刷新状态失败: " + error.message);
+        });
+}
+
 /**
  * 更新游戏状态显示
  */
@@ -277,6 +396,8 @@ function updateGameState(state) {
 function updateCharacterImage(closeness) {
     // 使用固定的图片，不再根据好感度切换
     let imageName = "SuTang.jpg";
+    // 页面中的 <picture> 已按浏览器支持的格式和屏幕密度加载了这张图，图片没变时不要改动
+    if ($("#character-image").data("image") === imageName) return;
     
     // 设置图像源
     $("#character-image").attr("src", `/static/images/${imageName}`);
@@ -423,5 +544,9 @@ function adjustChatHeight() {
 
 // 初始化游戏状态
 function initGameState() {
-    // 实现初始化游戏状态的逻辑
+    // 刷新页面后从服务端取回当前会话的状态；切回页面时再确认一次（没变化时只是一个304）
+    refreshState();
+    document.addEventListener("visibilitychange", function() {
+        if (document.visibilityState === "visible" && !draftState.replyPending) refreshState();
+    });
 } 
\ No newline at end of file
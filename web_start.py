@@ -1,7 +1,10 @@
 # web_start.py - [最终独立版]
 
+import argparse
 import os
 import logging
+import signal
+import sys
 from dotenv import load_dotenv
 
 # --- 内置核心功能，不再需要 utils ---
@@ -44,12 +47,80 @@ def setup_environment():
         
     return True # 所有设置成功
 
+# --- 生产模式 ---
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="启动 '绿园中学物语' Web版本")
+    parser.add_argument("--prod", action="store_true", help="使用生产级 WSGI 服务器（默认是 Flask 开发服务器）")
+    parser.add_argument("--host", default=os.environ.get("SUTANG_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SUTANG_PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SUTANG_WORKERS", 1)),
+                        help="工作进程数，大于1时使用 gunicorn（仅限 Linux/macOS）")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("SUTANG_THREADS", 8)),
+                        help="每个工作进程的线程数")
+    parser.add_argument("--preload", action="store_true", default=os.environ.get("SUTANG_PRELOAD") == "1",
+                        help="在 fork 工作进程之前加载地点数据和Prompt模板")
+    return parser.parse_args()
+
+
+def serve_gunicorn(args):
+    """多进程：gunicorn + gthread。会话状态放在共享的 SQLite 中，任意进程都能处理任意会话"""
+    from gunicorn.app.base import BaseApplication
+
+    def load_app():
+        from web_app.app import app
+        from web_app.game_core import get_game_core
+        if args.preload:
+            get_game_core().preload()
+        return app
+
+    def worker_exit(server, worker):
+        # 收到 SIGTERM/SIGINT 后 gunicorn 会等进行中的请求结束，再在每个工作进程里调用这里
+        from web_app.game_core import get_game_core
+        get_game_core().shutdown()
+        logging.info(f"工作进程 {worker.pid} 已把活跃会话写回存储。")
+
+    class GunicornApp(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{args.host}:{args.port}")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("preload_app", args.preload)
+            self.cfg.set("timeout", 120)  # 流式回复可能持续较久
+            self.cfg.set("graceful_timeout", 60)
+            self.cfg.set("worker_exit", worker_exit)
+
+        def load(self):
+            return load_app()
+
+    GunicornApp().run()
+
+
+def serve_waitress(args):
+    """单进程多线程：waitress，Windows 上也能用"""
+    from waitress import serve
+    from web_app.app import app
+    from web_app.game_core import get_game_core
+
+    if args.preload:
+        get_game_core().preload()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(app, host=args.host, port=args.port, threads=args.threads)
+    finally:
+        get_game_core().shutdown()
+        logging.info("已把活跃会话写回存储。")
+
+
 # --- 主启动逻辑 ---
 
 def main():
     """
     主函数：设置环境并启动Web应用。
     """
+    args = parse_args()
+
     # 设置日志
     logging.basicConfig(level=logging.INFO, 
                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -63,25 +134,43 @@ def main():
         print("\n环境设置失败，请检查错误日志。程序即将退出。")
         return # 失败则直接退出
 
-    # 2. 动态导入Flask app
+    # 多个工作进程之间不共享内存，会话必须放在共享存储里
+    if args.prod and args.workers > 1:
+        os.environ.setdefault("SUTANG_SESSION_STORE", "sqlite")
+
+    # 2. 生产模式：交给 gunicorn / waitress
+    if args.prod:
+        logging.info(f"生产模式: {args.workers} 个工作进程 x {args.threads} 个线程，监听 {args.host}:{args.port}")
+        try:
+            if args.workers > 1:
+                serve_gunicorn(args)
+            else:
+                serve_waitress(args)
+        except ImportError as e:
+            logging.error(f"缺少生产服务器依赖: {e}。请运行 pip install -r requirements.txt")
+        return
+
+    # 3. 动态导入Flask app
     #    这样可以确保环境设置完成后再加载Web应用的代码
     try:
         from web_app.app import app
+        from web_app.game_core import get_game_core
         logging.info("Web应用模块导入成功。")
     except ImportError as e:
         logging.error(f"导入Web应用时出错: {e}")
         logging.error("请确保 web_app/app.py 和 web_app/game_core.py 文件存在且无语法错误。")
         return
 
-    # 3. 运行Flask应用
+    # 4. 运行Flask开发服务器
     try:
-        logging.info("正在启动Web服务器，请在浏览器中访问 http://127.0.0.1:5000")
+        logging.info(f"正在启动Web服务器，请在浏览器中访问 http://127.0.0.1:{args.port}")
         logging.info("按 CTRL+C 退出服务器。")
-        # 使用 waitress 或 gunicorn 替换 app.run 是生产环境的最佳实践
-        # 但对于开发，app.run 足够了
-        app.run(debug=False, host='0.0.0.0', port=5000)
+        # 开发用；正式部署请使用 --prod（waitress / gunicorn）
+        app.run(debug=False, host=args.host, port=args.port)
     except Exception as e:
         logging.error(f"启动Web应用时发生未知错误: {e}")
+    finally:
+        get_game_core().shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file